@@ -1,23 +1,58 @@
 import streamlit as st
-import cv2
 import numpy as np
-import os
-import tempfile
-from PIL import Image
-from datetime import datetime
-import pandas as pd
+from datetime import datetime, timedelta
+import time
+import uuid
+import importlib.util
 import atexit
-import plotly.graph_objects as go
-import base64
-import json
-import re
+import tracemalloc
+from contextlib import nullcontext
+from lazy_imports import lazy_module
+
+# Heavy libraries are imported on first use to keep start-up fast
+cv2 = lazy_module("cv2")
+pd = lazy_module("pandas")
+go = lazy_module("plotly.graph_objects")
 
 from dental_detector import DentalDecayDetector
-from image_processing import preprocess_image, annotate_image
-from tooth_visualization import generate_3d_tooth_model, generate_decay_visualization
-from dental_report import generate_health_score, create_trend_chart, generate_recommendations, calculate_next_checkup
+from image_processing import preprocess_image, annotate_image, decode_image, ingest_images
+from tooth_visualization import generate_3d_tooth_model, generate_decay_visualization, generate_arch_model
+from dental_report import (
+    generate_health_score, create_trend_chart, generate_recommendations, calculate_next_checkup,
+    health_scores, score_matrix, HEALTH_LEVELS
+)
 from language_support import translator
 from reminder_system import reminder_system
+from instrumentation import metrics, stage, trace_scan, configure_from_environment
+from profiling import slow_scan_profiler, image_metadata
+from visit_aggregation import VisitAggregator, VIEWS, view_digest
+from quality_gate import assess_quality
+from pdf_report import report_renderer
+from scan_history import ScanHistory
+from duplicate_index import DuplicateIndex, dhash, hamming
+from session_store import get_session_store, new_session_id, valid_session_id
+from population_analytics import get_analytics_store, WINDOWS, METRICS, BIN_WIDTH, BIN_COUNT
+
+# Start the metrics endpoint/exporter if configured (once per process)
+configure_from_environment()
+
+# Captures are decoded at reduced scale down to this size (width, height);
+# it keeps the displayed and annotated image sharp, while the model itself
+# only sees 224x224
+CAPTURE_MIN_SIZE = (640, 480)
+
+# Seconds between checks of a PDF report rendering in the background
+PDF_POLL_INTERVAL = 1.0
+
+# Session state kept in the shared session store, when one is configured.
+# Objects rebuilt per process (the detector, the visit cache) and widget
+# values are not stored.
+PERSISTED_STATE = (
+    "history", "detection_results", "region_results", "visit_summary", "quality_report",
+    "current_scan_id", "captured_image", "duplicate_index", "language", "user_info",
+    "reminders_enabled", "reminder_frequency", "next_checkup_date", "reminder_email",
+    "scheduled_reminder", "recorded_checkup",
+)
 
 # Set page configuration
 st.set_page_config(
@@ -26,18 +61,40 @@ st.set_page_config(
     layout="wide"
 )
 
+# Restore the session on its first run in this process. The session id
+# travels in the URL, so any replica (or a restarted one) can load it.
+session_store = get_session_store()
+if session_store is not None and "session_id" not in st.session_state:
+    session_id = st.query_params.get("sid")
+    if not valid_session_id(session_id):
+        session_id = new_session_id()
+        st.query_params["sid"] = session_id
+    st.session_state.session_id = session_id
+    for key, value in session_store.load(session_id).items():
+        st.session_state[key] = value
+
 # Initialize session state variables
 if "detection_results" not in st.session_state:
     st.session_state.detection_results = None
 if "captured_image" not in st.session_state:
     st.session_state.captured_image = None
 if "history" not in st.session_state:
-    st.session_state.history = []
+    st.session_state.history = ScanHistory()
+if "duplicate_index" not in st.session_state:
+    st.session_state.duplicate_index = DuplicateIndex()
 if "model_loaded" not in st.session_state:
     st.session_state.model_loaded = False
 if "decay_detector" not in st.session_state:
     st.session_state.decay_detector = DentalDecayDetector()
     st.session_state.model_loaded = True
+if "region_results" not in st.session_state:
+    st.session_state.region_results = None
+if "visit_summary" not in st.session_state:
+    st.session_state.visit_summary = None
+if "quality_report" not in st.session_state:
+    st.session_state.quality_report = None
+if "current_scan_id" not in st.session_state:
+    st.session_state.current_scan_id = None
 if "camera_on" not in st.session_state:
     st.session_state.camera_on = False
 if "language" not in st.session_state:
@@ -59,8 +116,9 @@ if "next_checkup_date" not in st.session_state:
 if "reminder_email" not in st.session_state:
     st.session_state.reminder_email = ""
 
-# Set the current language
-translator.set_language(st.session_state.language)
+# Bind translations to this session's language. The shared translator is
+# never switched, so concurrent sessions cannot change each other's language.
+_translate = translator.bind(st.session_state.language)
 
 # Function to clean up resources when app exits
 def cleanup_resources():
@@ -75,8 +133,8 @@ atexit.register(cleanup_resources)
 
 # Function to translate text
 def t(key):
-    """Shorthand for translator.translate"""
-    return translator.translate(key)
+    """Shorthand for the session's bound translator"""
+    return _translate(key)
 
 # Main function
 def main():
@@ -104,7 +162,6 @@ def main():
         
         if selected_language != st.session_state.language:
             st.session_state.language = selected_language
-            translator.set_language(selected_language)
             st.rerun()
         
         # User profile section
@@ -125,6 +182,20 @@ def main():
         
         # Reminder system UI
         reminder_system.display_reminder_ui()
+        
+        # Debug panel, filled in once the tabs have run
+        show_timings = st.toggle("🛠 Show stage timings", key="show_stage_timings")
+        timings_panel = st.container() if show_timings else None
+        
+        # Opt-in profiling of slow scans
+        profile_scans = st.toggle(
+            "🐢 Profile slow scans",
+            value=slow_scan_profiler.enabled,
+            key="profile_slow_scans",
+            help=f"Save a cProfile report when a scan takes over {slow_scan_profiler.threshold_ms:.0f} ms"
+        )
+        if profile_scans:
+            display_recent_profiles()
 
     # Main content area
     st.markdown(f"""
@@ -133,19 +204,442 @@ def main():
     """)
 
     # Create tabs for navigation
-    tabs = st.tabs([t("tab_scan"), t("tab_results"), t("tab_report"), t("tab_history")])
+    tabs = st.tabs([t("tab_scan"), t("tab_results"), t("tab_report"), t("tab_history"), t("tab_analytics")])
+    
+    # Stage timings are only traced while the debug panel is open
+    trace_context = trace_scan(memory=True) if timings_panel is not None else nullcontext()
+    with trace_context as trace:
+        with tabs[0]:
+            scan_tab()
+        
+        with tabs[1]:
+            with slow_scan_profiler.profile(
+                "results_tab",
+                image_metadata(st.session_state.captured_image, len(st.session_state.history)),
+                enabled=profile_scans
+            ):
+                results_tab()
+        
+        with tabs[2]:
+            report_tab()
+        
+        with tabs[3]:
+            history_tab()
+        
+        with tabs[4]:
+            analytics_tab()
+    
+    if timings_panel is not None:
+        # Keep the breakdown of the last run that actually analysed an image
+        breakdown = trace.breakdown()
+        if "detect" in breakdown:
+            st.session_state.last_scan_timings = breakdown
+            st.session_state.last_scan_peak_bytes = trace.peak_bytes
+        display_stage_timings(timings_panel)
+
+def display_recent_profiles():
+    """
+    List the most recent slow-scan profiles in the sidebar.
+    """
+    profiles = slow_scan_profiler.recent_profiles()
+    if not profiles:
+        st.caption("No slow scans recorded yet.")
+        return
+    
+    for profile in profiles:
+        hotspot = profile["hotspots"][0]["function"] if profile.get("hotspots") else "-"
+        st.caption(f"{profile['label']}: {profile['elapsed_ms']:.0f} ms {profile['metadata']} (hotspot: {hotspot})")
+    st.caption(f"Profiles are saved in {slow_scan_profiler.directory}")
+
+def display_stage_timings(container):
+    """
+    Show the stage breakdown of the last scan in the sidebar.
+    
+    Args:
+        container: Sidebar container to draw into
+    """
+    timings = st.session_state.get("last_scan_timings")
+    with container:
+        if not timings:
+            st.caption("No scan timed yet. Analyze an image with this panel open.")
+            return
+        
+        total = sum(timings.values())
+        st.markdown("\n".join(
+            f"- **{name}**: {ms:.1f} ms" for name, ms in sorted(timings.items(), key=lambda item: -item[1])
+        ))
+        st.caption(f"Total of stages: {total:.1f} ms (nested stages are counted in their parents too)")
+        
+        peak_bytes = st.session_state.get("last_scan_peak_bytes")
+        if peak_bytes is not None:
+            st.caption(f"Peak memory allocated during the scan: {peak_bytes / 1024 ** 2:.1f} MB")
+        elif not tracemalloc.is_tracing():
+            st.caption("Start the app with DENTAL_TRACE_MEMORY=1 to measure peak memory.")
+
+def new_scan_id():
+    """
+    Create a unique id for a scan, used to key its history entry and report.
+    """
+    return uuid.uuid4().hex[:12]
+
+def record_analytics(entries):
+    """
+    Add new history entries to the population analytics rollups.
+    
+    Args:
+        entries: History entries with "timestamp" and "results"
+    """
+    get_analytics_store().record_scans(
+        score_matrix(entry["results"] for entry in entries),
+        np.array([np.datetime64(entry["timestamp"], "s") for entry in entries])
+    )
+
+def find_duplicate(image_hash):
+    """
+    Find a recent history entry showing the same image.
+    
+    Args:
+        image_hash: dhash of the preprocessed image
+    
+    Returns:
+        The history entry, or None if the image is new
+    """
+    match = st.session_state.duplicate_index.find(image_hash)
+    if match is None:
+        return None
+    return st.session_state.history.find(match[0])
+
+def find_duplicate_visit(view_hashes):
+    """
+    Find a recent visit entry showing the same views.
+    
+    The views of a visit are indexed as "<scan id>:<view>", so a visit is
+    a duplicate only if every view matches the same view of one visit.
+    
+    Args:
+        view_hashes: Dictionary mapping view name to the dhash of its
+            preprocessed image
+    
+    Returns:
+        The history entry, or None if the visit is new
+    """
+    scan_ids = set()
+    for view, image_hash in view_hashes.items():
+        match = st.session_state.duplicate_index.find(image_hash)
+        if match is None or not match[0].endswith(f":{view}"):
+            return None
+        scan_ids.add(match[0].rsplit(":", 1)[0])
+    if len(scan_ids) != 1:
+        return None
+    entry = st.session_state.history.find(scan_ids.pop())
+    if entry is None or set(entry.get("views", ())) != set(view_hashes):
+        return None
+    return entry
+
+def quality_reasons(codes):
+    """
+    Describe quality issue codes in the current language.
+    """
+    return ", ".join(t(f"quality_{code}") for code in codes)
+
+def analyze_image(image, channel_order="rgb"):
+    """
+    Run the analysis pipeline on a captured image and record the results.
+    
+    Args:
+        image: Captured image as a numpy array
+        channel_order: "rgb", or "bgr" for an image straight from decode_image
+    """
+    # Run dental issue detection
+    if not st.session_state.model_loaded:
+        st.error(t("model_error"))
+        return
+    
+    profile = slow_scan_profiler.profile(
+        "scan",
+        image_metadata(image, len(st.session_state.history)),
+        enabled=st.session_state.get("profile_slow_scans")
+    )
+    with st.spinner(t("analyzing")), profile:
+        # Stop unusable frames before the expensive stages
+        quality = assess_quality(image, channel_order)
+        if not quality["passed"]:
+            st.warning(t("quality_rejected").format(name=t("captured_image"), reasons=quality_reasons(quality["rejected"])))
+            return
+        st.session_state.quality_report = quality
+        
+        # Preprocess the image
+        processed_image = preprocess_image(image, channel_order=channel_order)
+        
+        # A re-submitted or re-captured frame reuses the earlier scan
+        image_hash = dhash(processed_image)
+        duplicate = find_duplicate(image_hash)
+        if duplicate is not None:
+            st.session_state.detection_results = duplicate["results"]
+            if "region_results" not in duplicate:
+                # Batch entries only keep the region scores of their last image
+                duplicate["region_results"] = st.session_state.decay_detector.detect_regions(processed_image)
+            st.session_state.region_results = duplicate["region_results"]
+            st.session_state.current_scan_id = duplicate["scan_id"]
+            metrics.increment("duplicate_scans_total")
+            st.info(t("duplicate_scan").format(timestamp=duplicate["timestamp"]))
+            return
+        
+        results = st.session_state.decay_detector.detect(processed_image)
+        st.session_state.detection_results = results
+        st.session_state.region_results = st.session_state.decay_detector.detect_regions(processed_image)
+        
+        # Add to history
+        scan_id = new_scan_id()
+        st.session_state.current_scan_id = scan_id
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        st.session_state.history.append({
+            "scan_id": scan_id,
+            "timestamp": timestamp,
+            "image": processed_image,
+            "results": results,
+            "region_results": st.session_state.region_results,
+            "quality": quality["metrics"]
+        })
+        st.session_state.duplicate_index.add(scan_id, image_hash)
+        record_analytics(st.session_state.history[-1:])
+        
+        # Set next checkup date based on results
+        next_date, urgency = calculate_next_checkup(results)
+        reminder_system.schedule_next_checkup(next_date)
+        metrics.increment("scans_total")
+    
+    st.success(t("analysis_complete"))
+
+def analyze_batch(uploaded_files):
+    """
+    Run the analysis pipeline on a series of uploaded images.
+    
+    Images are decoded concurrently, scored with one batched detect call
+    and added to the history in a single state update.
+    
+    Args:
+        uploaded_files: Files returned by st.file_uploader
+    """
+    if not st.session_state.model_loaded:
+        st.error(t("model_error"))
+        return
+    
+    payloads = [f.getvalue() for f in uploaded_files]
+    metrics.increment("decoded_bytes_total", sum(len(data) for data in payloads))
+    
+    total = len(payloads)
+    progress = st.progress(0.0)
+    started = time.perf_counter()
+    
+    def report_progress(done):
+        rate = done / max(time.perf_counter() - started, 1e-6)
+        progress.progress(done / total, text=t("batch_progress").format(done=done, total=total, rate=rate))
+    
+    with slow_scan_profiler.profile(
+        "batch_scan",
+        {"images": total, "history_length": len(st.session_state.history)},
+        enabled=st.session_state.get("profile_slow_scans")
+    ):
+        ingested = ingest_images(
+            payloads, min_size=CAPTURE_MIN_SIZE, on_progress=report_progress, assess=assess_quality
+        )
+        
+        for uploaded, item in zip(uploaded_files, ingested):
+            if item is None:
+                st.warning(t("decode_failed").format(name=uploaded.name))
+            elif item[1] is None:
+                st.warning(t("quality_rejected").format(name=uploaded.name, reasons=quality_reasons(item[2]["rejected"])))
+        ingested = [item for item in ingested if item is not None and item[1] is not None]
+        
+        # Drop images already in the history, or repeated within the series
+        index = st.session_state.duplicate_index
+        unique, hashes = [], []
+        for item in ingested:
+            image_hash = dhash(item[1])
+            if find_duplicate(image_hash) is None and all(
+                hamming(image_hash, other) > index.radius for other in hashes
+            ):
+                unique.append(item)
+                hashes.append(image_hash)
+        duplicates = len(ingested) - len(unique)
+        if duplicates:
+            metrics.increment("duplicate_scans_total", duplicates)
+            st.info(t("batch_duplicates").format(count=duplicates))
+        ingested = unique
+        if not ingested:
+            progress.empty()
+            return
+        
+        detector = st.session_state.decay_detector
+        processed_images = [processed for _, processed, _ in ingested]
+        batch_results = detector.detect_batch(processed_images)
+        
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        entries = [
+            {
+                "scan_id": new_scan_id(),
+                "timestamp": timestamp,
+                "image": processed,
+                "results": results,
+                "quality": quality["metrics"]
+            }
+            for (_, processed, quality), results in zip(ingested, batch_results)
+        ]
+        for entry, image_hash in zip(entries, hashes):
+            index.add(entry["scan_id"], image_hash)
+        
+        # One state update for the whole series; the last image is shown
+        last_image, last_processed, last_quality = ingested[-1]
+        st.session_state.history.extend(entries)
+        record_analytics(entries)
+        st.session_state.captured_image = last_image
+        st.session_state.quality_report = last_quality
+        st.session_state.detection_results = batch_results[-1]
+        st.session_state.current_scan_id = entries[-1]["scan_id"]
+        st.session_state.region_results = detector.detect_regions(last_processed)
+        entries[-1]["region_results"] = st.session_state.region_results
+        
+        # Schedule the checkup for the worst finding across the series
+        worst = {issue: max(results[issue] for results in batch_results) for issue in batch_results[0]}
+        next_date, urgency = calculate_next_checkup(worst)
+        reminder_system.schedule_next_checkup(next_date)
+        metrics.increment("scans_total", len(entries))
+    
+    st.success(t("batch_complete").format(count=len(entries), seconds=time.perf_counter() - started))
+
+def analyze_visit(uploads):
+    """
+    Analyse the views of one visit and report the fused scores.
+    
+    Unchanged views keep their cached scores, so retaking one view only
+    re-analyses that view.
+    
+    Args:
+        uploads: Dictionary mapping view name to the uploaded file
+    """
+    if not st.session_state.model_loaded:
+        st.error(t("model_error"))
+        return
+    
+    if "visit_aggregator" not in st.session_state:
+        st.session_state.visit_aggregator = VisitAggregator(
+            st.session_state.decay_detector, min_size=CAPTURE_MIN_SIZE
+        )
+    aggregator = st.session_state.visit_aggregator
+    
+    payloads = {view: uploaded.getvalue() for view, uploaded in uploads.items()}
+    
+    with st.spinner(t("analyzing")), slow_scan_profiler.profile(
+        "visit_scan",
+        {"views": len(payloads), "history_length": len(st.session_state.history)},
+        enabled=st.session_state.get("profile_slow_scans")
+    ):
+        recomputed, failed = aggregator.update(payloads)
+        for view in failed:
+            quality = aggregator.rejected_quality.get(view)
+            if quality is not None:
+                st.warning(t("quality_rejected").format(name=t(f"view_{view}"), reasons=quality_reasons(quality["rejected"])))
+            else:
+                st.warning(t("decode_failed").format(name=uploads[view].name))
+        
+        summary = aggregator.fuse()
+        if not summary["views"]:
+            return
+        
+        # The highest-weighted view stands in for the visit in the UI
+        primary = aggregator.view(aggregator.primary_view())
+        results = summary["results"]
+        st.session_state.visit_summary = summary
+        st.session_state.captured_image = primary["image"]
+        st.session_state.quality_report = primary["quality"]
+        
+        # Pressing analyse again with the same views reuses the visit: the
+        # recorded visit stands if it fused exactly these views (removed or
+        # rejected views change the visit without re-analysing anything),
+        # and views matching a recent visit reuse it
+        view_hashes = {view: dhash(aggregator.view(view)["processed"]) for view in summary["views"]}
+        duplicate = None
+        if not recomputed and st.session_state.get("visit_scan_id"):
+            duplicate = st.session_state.history.find(st.session_state.visit_scan_id)
+            if duplicate is not None and duplicate.get("views") != summary["views"]:
+                duplicate = None
+        if duplicate is None:
+            duplicate = find_duplicate_visit(view_hashes)
+        if duplicate is not None:
+            st.session_state.detection_results = duplicate["results"]
+            st.session_state.region_results = duplicate["region_results"]
+            st.session_state.current_scan_id = duplicate["scan_id"]
+            st.session_state.visit_scan_id = duplicate["scan_id"]
+            metrics.increment("duplicate_scans_total")
+            st.info(t("duplicate_visit").format(timestamp=duplicate["timestamp"]))
+            return
+        
+        st.session_state.detection_results = results
+        st.session_state.region_results = st.session_state.decay_detector.detect_regions(primary["processed"])
+        st.session_state.current_scan_id = new_scan_id()
+        st.session_state.visit_scan_id = st.session_state.current_scan_id
+        st.session_state.history.append({
+            "scan_id": st.session_state.current_scan_id,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "image": primary["processed"],
+            "results": results,
+            "region_results": st.session_state.region_results,
+            "views": summary["views"]
+        })
+        for view, image_hash in view_hashes.items():
+            st.session_state.duplicate_index.add(f"{st.session_state.current_scan_id}:{view}", image_hash)
+        record_analytics(st.session_state.history[-1:])
+        
+        next_date, urgency = calculate_next_checkup(results)
+        reminder_system.schedule_next_checkup(next_date)
+        metrics.increment("scans_total", len(recomputed))
     
-    with tabs[0]:
-        scan_tab()
+    st.success(t("visit_complete").format(count=len(summary["views"]), recomputed=len(recomputed)))
+
+def display_quality_report():
+    """
+    Show the quality flags and metrics of the image behind the results.
+    """
+    quality = st.session_state.quality_report
+    if quality is None:
+        return
     
-    with tabs[1]:
-        results_tab()
+    if quality["flagged"]:
+        st.warning(t("quality_flagged").format(reasons=quality_reasons(quality["flagged"])))
     
-    with tabs[2]:
-        report_tab()
+    with st.expander(t("quality_metrics")):
+        measured = quality["metrics"]
+        st.markdown("\n".join(f"- {line}" for line in (
+            t("quality_sharpness").format(value=measured["sharpness"]),
+            t("quality_brightness").format(value=measured["brightness"]),
+            t("quality_clipping").format(dark=measured["dark_clip"], bright=measured["bright_clip"]),
+            t("quality_coverage").format(value=measured["coverage"]),
+        )))
+        st.caption(t("quality_checked").format(ms=quality["elapsed_ms"]))
+
+def display_visit_summary():
+    """
+    Show the per-view scores behind the current visit score, if any.
+    """
+    summary = st.session_state.visit_summary
+    # Only while the current results are the fused visit results
+    if summary is None or summary["results"] is not st.session_state.detection_results:
+        return
     
-    with tabs[3]:
-        history_tab()
+    with st.expander(t("visit_views")):
+        issues = list(summary["results"])
+        rows = {t(f"view_{view}"): [scores[issue] for issue in issues] for view, scores in summary["views"].items()}
+        df = pd.DataFrame.from_dict(rows, orient="index", columns=issues)
+        df.loc["= " + t("visit_mode")] = [summary["results"][issue] for issue in issues]
+        st.dataframe(df.style.format("{:.1f}"), use_container_width=True)
+        
+        if summary["rejected"]:
+            details = "; ".join(
+                f"{issue}: {', '.join(t(f'view_{view}') for view in views)}"
+                for issue, views in summary["rejected"].items()
+            )
+            st.caption(t("visit_rejected").format(details=details))
 
 def scan_tab():
     st.header(t("scan_header"))
@@ -164,9 +658,10 @@ def scan_tab():
         # Camera controls
         camera_options = st.radio(
             t("camera_options"),
-            [t("turn_on_camera"), t("use_last_image")],
-            index=0 if not st.session_state.camera_on else 1,
-            horizontal=True
+            [t("turn_on_camera"), t("use_last_image"), t("upload_images"), t("visit_mode")],
+            index=0,
+            horizontal=True,
+            key="camera_mode"
         )
         
         if camera_options == t("turn_on_camera"):
@@ -174,45 +669,52 @@ def scan_tab():
             # Camera input
             img_file = st.camera_input(t("take_picture"), key="camera")
             
-            if img_file is not None:
-                # Read and display the image
-                bytes_data = img_file.getvalue()
-                img_array = np.frombuffer(bytes_data, np.uint8)
-                image = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-                image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            # The widget keeps its frame across reruns; only a new capture
+            # is analysed
+            bytes_data = img_file.getvalue() if img_file is not None else None
+            capture = view_digest(bytes_data) if bytes_data is not None else None
+            if capture is not None and capture != st.session_state.get("camera_capture"):
+                st.session_state.camera_capture = capture
+                metrics.increment("decoded_bytes_total", len(bytes_data))
+                image = decode_image(bytes_data, min_size=CAPTURE_MIN_SIZE)
                 
-                # Store the captured image in session state
-                st.session_state.captured_image = image_rgb
-                
-                # Preprocess the image
-                processed_image = preprocess_image(image_rgb)
-                
-                # Run dental issue detection
-                if st.session_state.model_loaded:
-                    with st.spinner(t("analyzing")):
-                        results = st.session_state.decay_detector.detect(processed_image)
-                        st.session_state.detection_results = results
-                        
-                        # Add to history
-                        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        st.session_state.history.append({
-                            "timestamp": timestamp,
-                            "image": processed_image,
-                            "results": results
-                        })
-                        
-                        # Set next checkup date based on results
-                        next_date, urgency = calculate_next_checkup(results)
-                        reminder_system.schedule_next_checkup(next_date)
-                        
-                    st.success(t("analysis_complete"))
-                else:
-                    st.error(t("model_error"))
+                # The pipeline reads the BGR decode directly; the stored copy
+                # is then swapped to RGB in place, without a second frame
+                analyze_image(image, channel_order="bgr")
+                with stage("color_convert"):
+                    cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
                 
+                # Store the captured image in session state
+                st.session_state.captured_image = image
+            
+            if img_file is not None:
                 # Option to turn off camera after capturing
                 if st.button(t("turn_off_camera")):
                     st.session_state.camera_on = False
                     st.rerun()
+        elif camera_options == t("upload_images"):
+            st.session_state.camera_on = False
+            uploaded_files = st.file_uploader(
+                t("upload_prompt"),
+                type=["jpg", "jpeg", "png"],
+                accept_multiple_files=True,
+                key="upload_images"
+            )
+            
+            # Analyse on request only, so reruns do not re-process the series
+            if uploaded_files and st.button(t("analyze_batch").format(count=len(uploaded_files))):
+                analyze_batch(uploaded_files)
+        elif camera_options == t("visit_mode"):
+            st.session_state.camera_on = False
+            st.caption(t("visit_prompt"))
+            uploads = {}
+            for view in VIEWS:
+                uploaded = st.file_uploader(t(f"view_{view}"), type=["jpg", "jpeg", "png"], key=f"visit_{view}")
+                if uploaded is not None:
+                    uploads[view] = uploaded
+            
+            if uploads and st.button(t("analyze_visit").format(count=len(uploads))):
+                analyze_visit(uploads)
         else:
             st.session_state.camera_on = False
             # Display the last captured image if available
@@ -221,30 +723,7 @@ def scan_tab():
                 
                 # Only offer analysis if we have a captured image
                 if st.button(t("analyze_image")):
-                    # Preprocess the image
-                    processed_image = preprocess_image(st.session_state.captured_image)
-                    
-                    # Run dental issue detection
-                    if st.session_state.model_loaded:
-                        with st.spinner(t("analyzing")):
-                            results = st.session_state.decay_detector.detect(processed_image)
-                            st.session_state.detection_results = results
-                            
-                            # Add to history
-                            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            st.session_state.history.append({
-                                "timestamp": timestamp,
-                                "image": processed_image,
-                                "results": results
-                            })
-                            
-                            # Set next checkup date based on results
-                            next_date, urgency = calculate_next_checkup(results)
-                            reminder_system.schedule_next_checkup(next_date)
-                            
-                        st.success(t("analysis_complete"))
-                    else:
-                        st.error(t("model_error"))
+                    analyze_image(st.session_state.captured_image)
             else:
                 st.info(t("no_image"))
     
@@ -261,6 +740,8 @@ def results_tab():
     if st.session_state.detection_results is None:
         st.info(t("no_results"))
         return
+    
+    display_quality_report()
         
     col1, col2 = st.columns([1, 1])
     
@@ -274,8 +755,23 @@ def results_tab():
             t("confidence_column"): [f"{results[k]:.1f}%" for k in results.keys()],
             t("status_column"): [t("attention_needed") if results[k] > 50 else t("likely_healthy") for k in results.keys()]
         })
+        
+        # Change since the previous scan, from the history score columns
+        history = st.session_state.history
+        if len(history) >= 2 and history.scan_ids[-1] == st.session_state.current_scan_id:
+            change = history.scores[-1] - history.scores[-2]
+            changes = dict(zip(history.issues, change.tolist()))
+            df[t("change_column")] = [
+                f"{changes[k]:+.1f}" if not np.isnan(changes.get(k, np.nan)) else "" for k in results.keys()
+            ]
         st.dataframe(df, use_container_width=True)
         
+        # Per-region breakdown
+        if st.session_state.region_results:
+            with st.expander(t("region_scores")):
+                region_df = pd.DataFrame(st.session_state.region_results).T.round(1)
+                st.dataframe(region_df, use_container_width=True)
+        
         # Overall health assessment
         avg_confidence = np.mean(list(results.values()))
         score, status, color = generate_health_score(results)
@@ -322,12 +818,25 @@ def results_tab():
         # 3D Visualization
         st.subheader("3D Tooth Visualization")
         
-        # Generate 3D model with decay areas based on detection results
-        decay_areas = generate_decay_visualization(st.session_state.detection_results)
-        fig = generate_3d_tooth_model(decay_areas)
+        model_view = st.radio(
+            t("model_label"),
+            ["tooth", "arch"],
+            format_func=lambda view: t(f"model_{view}"),
+            horizontal=True,
+            key="model_view",
+            label_visibility="collapsed"
+        )
+        
+        if model_view == "arch" and st.session_state.region_results:
+            # Each tooth colored by the scores of its dental region
+            fig = generate_arch_model(st.session_state.region_results)
+        else:
+            # Generate 3D model with decay areas based on detection results
+            decay_areas = generate_decay_visualization(st.session_state.detection_results)
+            fig = generate_3d_tooth_model(decay_areas)
         
         # Display the 3D model
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(fig, use_container_width=True, key="results_model")
         
         st.info("Interactive 3D model: drag to rotate, zoom with scroll wheel")
         
@@ -344,7 +853,7 @@ def results_tab():
     # Recommendations section
     st.subheader(t("recommendations"))
     
-    html_recommendations = generate_recommendations(st.session_state.detection_results)
+    html_recommendations = generate_recommendations(st.session_state.detection_results, st.session_state.language)
     if html_recommendations:
         st.markdown(html_recommendations, unsafe_allow_html=True)
     else:
@@ -437,9 +946,12 @@ def report_tab():
             </div>
             """, unsafe_allow_html=True)
         
+        # Per-view scores when the report covers a multi-view visit
+        display_visit_summary()
+        
         # Show personalized recommendations
         st.subheader("Personalized Recommendations")
-        html_recommendations = generate_recommendations(st.session_state.detection_results)
+        html_recommendations = generate_recommendations(st.session_state.detection_results, st.session_state.language)
         if html_recommendations:
             st.markdown(html_recommendations, unsafe_allow_html=True)
         
@@ -457,12 +969,25 @@ def report_tab():
         # Show 3D visualization
         st.subheader("3D Tooth Model")
         
-        # Generate 3D model with decay areas based on detection results
-        decay_areas = generate_decay_visualization(st.session_state.detection_results)
-        fig = generate_3d_tooth_model(decay_areas)
+        model_view = st.radio(
+            t("model_label"),
+            ["tooth", "arch"],
+            format_func=lambda view: t(f"model_{view}"),
+            horizontal=True,
+            key="report_model_view",
+            label_visibility="collapsed"
+        )
+        
+        if model_view == "arch" and st.session_state.region_results:
+            # Each tooth colored by the scores of its dental region
+            fig = generate_arch_model(st.session_state.region_results)
+        else:
+            # Generate 3D model with decay areas based on detection results
+            decay_areas = generate_decay_visualization(st.session_state.detection_results)
+            fig = generate_3d_tooth_model(decay_areas)
         
         # Display the 3D model
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(fig, use_container_width=True, key="report_model")
     
     # Show report download option
     st.markdown("---")
@@ -470,8 +995,7 @@ def report_tab():
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        if st.button("📄 Download PDF Report"):
-            st.info("In a production app, this would generate and download a complete PDF report with all your dental health information.")
+        display_pdf_download()
     
     with col2:
         if st.button("📧 Email Report to Me"):
@@ -485,6 +1009,72 @@ def report_tab():
         if st.button("👨‍⚕️ Share with Doctor"):
             st.info("In a production app, this would provide options to securely share your dental health data with your dentist.")
 
+def build_report():
+    """
+    Snapshot the current results for the PDF renderer.
+    
+    Returns:
+        Report dictionary for pdf_report.render_pdf_report
+    """
+    results = st.session_state.detection_results
+    return {
+        "scan_id": st.session_state.current_scan_id,
+        "language": st.session_state.language,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "patient_name": st.session_state.user_info.get("name", ""),
+        "results": dict(results),
+        "history": [{"timestamp": e["timestamp"], "results": e["results"]} for e in st.session_state.history],
+        "image": st.session_state.captured_image,
+        "decay_areas": generate_decay_visualization(results),
+    }
+
+def display_pdf_download():
+    """
+    Offer the PDF report of the current scan.
+    
+    The PDF is only rendered when asked for, in the renderer's worker
+    threads; the page polls the pending render and offers the download once
+    the renderer's cache, keyed by scan and language, has it.
+    """
+    scan_id = st.session_state.current_scan_id
+    if scan_id is None:
+        return
+    
+    key = (scan_id, st.session_state.language)
+    data = report_renderer.get(*key)
+    if data is None:
+        pending = st.session_state.get("pdf_render")
+        if pending is not None and pending[0] == key:
+            future = pending[1]
+            if future.done() and future.exception() is not None:
+                st.error(t("pdf_failed").format(error=future.exception()))
+                del st.session_state.pdf_render
+            elif not future.done():
+                display_pdf_progress()
+                return
+        if not st.button(t("prepare_pdf"), key="prepare_pdf_report"):
+            return
+        st.session_state.pdf_render = (key, report_renderer.submit(scan_id, st.session_state.language, build_report))
+        display_pdf_progress()
+        return
+    
+    st.download_button(
+        t("download_pdf"),
+        data=data,
+        file_name=f"dental_report_{scan_id}.pdf",
+        mime="application/pdf",
+        key="download_pdf_report"
+    )
+
+@st.fragment(run_every=PDF_POLL_INTERVAL)
+def display_pdf_progress():
+    """
+    Show that the PDF is being prepared, rerunning the page once it is done.
+    """
+    if st.session_state.pdf_render[1].done():
+        st.rerun(scope="app")
+    st.caption(t("preparing_pdf"))
+
 def history_tab():
     st.header(t("history_header"))
     
@@ -492,6 +1082,10 @@ def history_tab():
         st.info(t("no_history"))
         return
     
+    # Health scores of the whole history in one vectorized call
+    history = st.session_state.history
+    scores, statuses, colors = health_scores(history.scores, history.issues)
+    
     # Display history in reverse chronological order (newest first)
     for i, entry in enumerate(reversed(st.session_state.history)):
         with st.expander(f"{t('scan_from')} {entry['timestamp']}"):
@@ -507,9 +1101,10 @@ def history_tab():
                     status = t("attention_needed") if confidence > 50 else t("likely_healthy")
                     st.markdown(f"**{issue}**: {confidence:.1f}% - {status}")
                 
-                # Generate health score for this scan
-                score, status, color = generate_health_score(results)
-                if score is not None:
+                # Health score of this scan
+                index = len(st.session_state.history) - 1 - i
+                score, status, color = scores[index], statuses[index], colors[index]
+                if not np.isnan(score):
                     st.markdown(f"""
                     <div style="background-color: {color}; padding: 10px; border-radius: 5px; text-align: center; margin-top: 10px;">
                         <h4 style="color: white; margin: 0;">Health Score: {score}</h4>
@@ -518,16 +1113,131 @@ def history_tab():
                     """, unsafe_allow_html=True)
             
             with col3:
-                # Show 3D model for this scan
-                decay_areas = generate_decay_visualization(entry['results'])
-                fig = generate_3d_tooth_model(decay_areas)
-                st.plotly_chart(fig, use_container_width=True)
+                # Show 3D model for this scan; the markers are kept with the
+                # entry so the figure stays the same across reruns
+                if "decay_areas" not in entry:
+                    entry["decay_areas"] = generate_decay_visualization(entry['results'])
+                fig = generate_3d_tooth_model(entry["decay_areas"], compact=True)
+                st.plotly_chart(fig, use_container_width=True, key=f"history_model_{entry.get('scan_id', i)}")
+    
+    # Export the history columns (scores and timestamps, without images);
+    # the files are only built when a button is clicked
+    col1, col2, _ = st.columns([1, 1, 2])
+    with col1:
+        st.download_button(
+            t("export_csv"),
+            data=history.to_csv,
+            file_name="dental_history.csv",
+            mime="text/csv",
+            key="export_history_csv"
+        )
+    with col2:
+        if importlib.util.find_spec("pyarrow") is not None:
+            st.download_button(
+                t("export_parquet"),
+                data=history.to_parquet,
+                file_name="dental_history.parquet",
+                mime="application/vnd.apache.parquet",
+                key="export_history_parquet"
+            )
     
     # Clear history button
     if st.button(t("clear_history")):
-        st.session_state.history = []
+        st.session_state.history = ScanHistory()
+        st.session_state.duplicate_index.clear()
         st.success(t("history_cleared"))
         st.rerun()
 
+def analytics_tab():
+    st.header(t("analytics_header"))
+    
+    window = st.selectbox(
+        t("analytics_window"),
+        list(WINDOWS),
+        index=1,
+        format_func=lambda window: t(f"window_{WINDOWS[window] or 'all'}"),
+        key="analytics_window"
+    )
+    days = WINDOWS[window]
+    start = datetime.now().date() - timedelta(days=days - 1) if days else None
+    
+    # Both queries read the daily/weekly rollups, never the raw scans
+    store = get_analytics_store()
+    summary = store.summary(start)
+    if summary["scans"] == 0:
+        st.info(t("no_analytics"))
+        return
+    
+    health = summary["metrics"]["Health"]
+    attention = summary["status"].get(HEALTH_LEVELS[-1][1], 0)
+    col1, col2, col3 = st.columns(3)
+    col1.metric(t("analytics_scans"), f"{summary['scans']:,}")
+    col2.metric(t("analytics_mean_score"), f"{health['mean']:.1f}" if health["mean"] is not None else "-")
+    col3.metric(t("analytics_attention"), f"{attention / summary['scans']:.0%}")
+    
+    series = store.series(start, grain="week" if days is None or days > 90 else "day")
+    if series:
+        dates, counts, scores = zip(*series)
+        fig = go.Figure()
+        fig.add_trace(go.Bar(x=dates, y=counts, name=t("analytics_scans"), marker_color="rgba(52, 152, 219, 0.4)"))
+        fig.add_trace(go.Scatter(x=dates, y=scores, name=t("analytics_mean_score"), yaxis="y2",
+                                 mode="lines+markers", line=dict(color="#2ecc71")))
+        fig.update_layout(
+            height=300,
+            margin=dict(l=20, r=20, t=30, b=20),
+            yaxis=dict(title=t("analytics_scans")),
+            yaxis2=dict(title=t("analytics_mean_score"), overlaying="y", side="right", range=[0, 100]),
+            legend=dict(orientation="h")
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader(t("analytics_status"))
+        colors = {status: color for _, status, color in HEALTH_LEVELS}
+        fig = go.Figure(go.Bar(
+            x=list(summary["status"]),
+            y=list(summary["status"].values()),
+            marker_color=[colors[status] for status in summary["status"]]
+        ))
+        fig.update_layout(height=280, margin=dict(l=20, r=20, t=20, b=20))
+        st.plotly_chart(fig, use_container_width=True)
+    with col2:
+        st.subheader(t("analytics_urgency"))
+        urgency = summary["urgency"]
+        fig = go.Figure(go.Bar(
+            x=[t(f"checkup_{level.lower()}") for level in urgency],
+            y=list(urgency.values()),
+            marker_color="#3498db"
+        ))
+        fig.update_layout(height=280, margin=dict(l=20, r=20, t=20, b=20))
+        st.plotly_chart(fig, use_container_width=True)
+    
+    st.subheader(t("analytics_distributions"))
+    bins = [f"{low}-{low + BIN_WIDTH}" for low in range(0, BIN_COUNT * BIN_WIDTH, BIN_WIDTH)]
+    fig = go.Figure()
+    for metric in METRICS:
+        distribution = summary["metrics"][metric]
+        if distribution["count"]:
+            fig.add_trace(go.Bar(x=bins, y=distribution["histogram"], name=metric))
+    fig.update_layout(barmode="group", height=320, margin=dict(l=20, r=20, t=20, b=20),
+                      xaxis_title=t("analytics_score"), yaxis_title=t("analytics_scans"))
+    st.plotly_chart(fig, use_container_width=True)
+    
+    st.dataframe(pd.DataFrame({
+        metric: {
+            t("analytics_mean"): summary["metrics"][metric]["mean"],
+            t("analytics_std"): summary["metrics"][metric]["std"],
+            t("analytics_scans"): summary["metrics"][metric]["count"],
+        }
+        for metric in METRICS
+    }).T.round(1), use_container_width=True)
+
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        # One batched write of the state changed by this run (also when
+        # the run ends early through st.rerun or st.stop)
+        if session_store is not None:
+            session_store.flush(st.session_state.session_id, st.session_state, PERSISTED_STATE)
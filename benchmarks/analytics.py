@@ -0,0 +1,109 @@
+"""
+Query latency of the population analytics rollups.
+
+Backfills an analytics database with synthetic scans spread over a
+number of days (in batches, through AnalyticsStore.record_scans), then
+times summary() and series() for each dashboard window, and a single
+incremental record_scan(). The exit status is 1 if the slowest query
+median exceeds --budget milliseconds, so the script can run in CI.
+
+Usage:
+    python benchmarks/analytics.py [--scans 10000000] [--days 1095] [--db PATH] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from dental_report import ISSUES
+from population_analytics import AnalyticsStore, WINDOWS
+
+# Scans generated and recorded per record_scans call
+BACKFILL_BATCH = 1_000_000
+
+
+def backfill(store, scans, days, seed=0):
+    """
+    Record synthetic scans, uniformly spread over the last days.
+
+    Returns:
+        Seconds taken
+    """
+    rng = np.random.default_rng(seed)
+    first = np.datetime64(date.today() - timedelta(days=days - 1), "s")
+    start = time.perf_counter()
+    for offset in range(0, scans, BACKFILL_BATCH):
+        size = min(BACKFILL_BATCH, scans - offset)
+        scores = rng.uniform(0, 100, (size, len(ISSUES)))
+        timestamps = first + rng.integers(0, days * 86400, size).astype("timedelta64[s]")
+        store.record_scans(scores, timestamps)
+    return time.perf_counter() - start
+
+
+def time_call(func, runs):
+    """
+    Median and maximum milliseconds of func over runs calls (after one warm-up).
+    """
+    func()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": round(statistics.median(timings), 2), "max_ms": round(max(timings), 2)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scans", type=int, default=10_000_000, help="synthetic scans to record")
+    parser.add_argument("--days", type=int, default=3 * 365, help="days the scans are spread over")
+    parser.add_argument("--runs", type=int, default=20, help="timed runs per query")
+    parser.add_argument("--db", default=None, help="database file (default: a temporary file)")
+    parser.add_argument("--budget", type=float, default=100.0, help="maximum query median in ms")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = AnalyticsStore(args.db or os.path.join(tmp, "analytics.db"))
+        backfill_s = backfill(store, args.scans, args.days)
+
+        results = {}
+        for name, days in WINDOWS.items():
+            start = date.today() - timedelta(days=days - 1) if days else None
+            results[f"summary[{name}]"] = time_call(lambda: store.summary(start), args.runs)
+            results[f"series[{name}]"] = time_call(
+                lambda: store.series(start, grain="week" if days is None or days > 90 else "day"), args.runs
+            )
+        results["record_scan"] = time_call(
+            lambda: store.record_scan(dict.fromkeys(ISSUES, 50.0), date.today().strftime("%Y-%m-%d 12:00:00")),
+            args.runs
+        )
+        scans = store.summary()["scans"]
+        store.close()
+
+    slowest = max(result["median_ms"] for name, result in results.items() if name != "record_scan")
+    if args.json:
+        print(json.dumps({"scans": scans, "backfill_s": round(backfill_s, 1), "results": results}, indent=2))
+    else:
+        print(f"{scans} scans over {args.days} days, backfilled in {backfill_s:.1f} s")
+        print(f"{'query':<28} {'median ms':>10} {'max ms':>8}")
+        for name, result in results.items():
+            print(f"{name:<28} {result['median_ms']:>10.2f} {result['max_ms']:>8.2f}")
+
+    if slowest > args.budget:
+        print(f"Slowest query median {slowest:.1f} ms exceeds the {args.budget:.0f} ms budget", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
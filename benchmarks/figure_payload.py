@@ -0,0 +1,103 @@
+"""
+Payload size of the 3D tooth figures sent to the browser.
+
+Builds the figures the history tab shows for histories of several sizes,
+in the default and the compact mode, and reports the bytes of the JSON
+spec Streamlit sends (serialized the same way as st.plotly_chart), the
+same bytes gzip-compressed, and the time to build and serialize them.
+
+Usage:
+    python benchmarks/figure_payload.py [--rows 1 10 50] [--json]
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import plotly.io as pio
+
+from tooth_visualization import generate_3d_tooth_model, generate_decay_visualization
+
+DEFAULT_ROWS = [1, 10, 50]
+
+
+def synthetic_results(count, seed=0):
+    """
+    Detection results for a history of count scans.
+    """
+    rng = random.Random(seed)
+    return [
+        {issue: rng.uniform(0, 100) for issue in ("Decay", "Plaque", "Cavity", "Gingivitis")}
+        for _ in range(count)
+    ]
+
+
+def measure(rows, compact):
+    """
+    Build and serialize the figures of a history tab with rows entries.
+
+    Returns:
+        Dictionary with total and per-figure raw and gzip bytes, and the
+        build + serialize time in milliseconds
+    """
+    random.seed(0)
+    decay_areas = [generate_decay_visualization(results) for results in synthetic_results(rows)]
+
+    start = time.perf_counter()
+    specs = [
+        # What st.plotly_chart puts in the PlotlyChart proto
+        pio.to_json(generate_3d_tooth_model(areas, compact=compact).to_dict(), validate=False)
+        for areas in decay_areas
+    ]
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    raw = sum(len(spec.encode()) for spec in specs)
+    compressed = sum(len(gzip.compress(spec.encode())) for spec in specs)
+    return {
+        "bytes": raw,
+        "gzip_bytes": compressed,
+        "bytes_per_figure": round(raw / rows),
+        "gzip_bytes_per_figure": round(compressed / rows),
+        "build_ms": round(elapsed_ms, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="*", default=DEFAULT_ROWS, help="history sizes to measure")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    # Warm up imports and caches
+    generate_3d_tooth_model(compact=False)
+    generate_3d_tooth_model(compact=True)
+
+    results = {
+        rows: {mode: measure(rows, mode == "compact") for mode in ("default", "compact")}
+        for rows in args.rows
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(f"{'rows':>5} {'mode':<8} {'KB/figure':>10} {'gzip KB/fig':>12} {'total KB':>10} {'build ms':>9}")
+    for rows, modes in results.items():
+        for mode, result in modes.items():
+            print(f"{rows:>5} {mode:<8} {result['bytes_per_figure'] / 1024:>10.1f} "
+                  f"{result['gzip_bytes_per_figure'] / 1024:>12.1f} {result['bytes'] / 1024:>10.1f} "
+                  f"{result['build_ms']:>9.1f}")
+        default, compact = modes["default"], modes["compact"]
+        print(f"{'':>5} {'saved':<8} {1 - compact['bytes'] / default['bytes']:>10.0%} "
+              f"{1 - compact['gzip_bytes'] / default['gzip_bytes']:>12.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
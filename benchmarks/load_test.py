@@ -0,0 +1,279 @@
+"""
+Concurrent-session load test of the Streamlit app.
+
+Drives app.py headlessly with Streamlit's AppTest, one AppTest per
+simulated session, all in this process as in a single server process.
+Every session loads the page, then repeats scan -> results -> report ->
+history: a new synthetic camera image is analysed, the results and
+report tabs are switched between the full-arch and single-tooth models,
+and the page is re-run once more as when opening the history. Each step
+is one script run.
+
+AppTest swaps process-wide Streamlit state on every run, so runs cannot
+overlap: the sessions' threads take turns, and the harness models one
+worker serving all of them. A step's latency is measured from the
+interaction to the rendered page, including the time spent waiting for
+other sessions' runs, so it grows with the number of sessions the way
+a saturated server's does; the service time excludes that wait.
+
+Reports latency percentiles per step, throughput, and the resident
+memory of the process: after a warm-up session (imports, model and
+caches), with all sessions alive, and after they are dropped. The
+growth per live session is the memory a user costs; memory not given
+back after the sessions are dropped may be a leak or just the allocator
+keeping freed pages, so the histories of dropped sessions are also
+tracked with weak references: any still alive are leaked session state.
+The exit status is 1 if a session failed or leaked, or the p95 latency
+exceeds --budget ms.
+
+Usage:
+    python benchmarks/load_test.py [--sessions 8] [--concurrency 8] [--scans 3] [--json]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from pipeline import synthetic_image
+
+APP = os.path.join(ROOT, "app.py")
+
+# Steps of a session, in order; "load" only runs once
+STEPS = ("load", "scan", "results", "report", "history")
+
+# Camera frame size, as decoded from a capture
+FRAME_SIZE = (640, 480)
+
+# Seconds a single script run may take before the session fails
+RUN_TIMEOUT = 120
+
+
+def rss_mb():
+    """
+    Resident memory of this process in MB.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage / 1024 ** 2 if sys.platform == "darwin" else usage / 1024
+
+
+def percentile(values, q):
+    """
+    The q-th percentile of values in ms, None if there are none.
+    """
+    return round(float(np.percentile(values, q)), 1) if values else None
+
+
+class Session:
+    """
+    One simulated user of the app.
+    """
+
+    def __init__(self, number, scans, worker):
+        """
+        Args:
+            number: Session number, which seeds its images
+            scans: Number of scan -> results -> report -> history rounds
+            worker: Lock held during each script run
+        """
+        # Imported here: streamlit.testing pulls in the whole runtime
+        from streamlit.testing.v1 import AppTest
+
+        self.number = number
+        self.scans = scans
+        self.worker = worker
+        self.app = AppTest.from_file(APP, default_timeout=RUN_TIMEOUT)
+        self.timings = {step: [] for step in STEPS}
+        self.service = {step: [] for step in STEPS}
+
+    def _timed(self, step, action):
+        start = time.perf_counter()
+        with self.worker:
+            served = time.perf_counter()
+            action()
+        end = time.perf_counter()
+        self.timings[step].append((end - start) * 1000)
+        self.service[step].append((end - served) * 1000)
+        if self.app.exception:
+            raise RuntimeError(f"{step}: {self.app.exception[0].message}")
+
+    def run(self):
+        """
+        Play the session.
+
+        Raises:
+            RuntimeError: If the app raised or did not record every scan
+        """
+        app = self.app
+        self._timed("load", app.run)
+        analyze_label = self._analyze_label()
+
+        for scan in range(self.scans):
+            # A distinct frame per scan, so no scan is skipped as a duplicate
+            app.session_state["captured_image"] = synthetic_image(
+                *FRAME_SIZE, seed=self.number * self.scans + scan
+            )
+            if scan == 0:
+                # Switch the scan tab to the captured image (not timed)
+                camera_mode = app.radio(key="camera_mode")
+                with self.worker:
+                    camera_mode.set_value(camera_mode.options[1]).run()
+            self._timed("scan", lambda: next(
+                button for button in app.button if button.label == analyze_label
+            ).click().run())
+
+            view = "arch" if scan % 2 == 0 else "tooth"
+            self._timed("results", lambda: app.radio(key="model_view").set_value(view).run())
+            self._timed("report", lambda: app.radio(key="report_model_view").set_value(view).run())
+            self._timed("history", app.run)
+
+        recorded = len(app.session_state["history"])
+        if recorded != self.scans:
+            raise RuntimeError(f"{recorded} of {self.scans} scans in history")
+
+    def _analyze_label(self):
+        # The app's own translation, so the harness follows locale changes
+        from language_support import translator
+        return translator.bind(self.app.session_state["language"])("analyze_image")
+
+
+def run_sessions(count, scans, concurrency, first=0):
+    """
+    Run sessions concurrently.
+
+    Returns:
+        (sessions, errors, wall seconds); the sessions are kept alive
+    """
+    worker = threading.Lock()
+    sessions = [Session(first + number, scans, worker) for number in range(count)]
+    errors = []
+    lock = threading.Lock()
+
+    def play(session):
+        try:
+            session.run()
+        except Exception as error:
+            with lock:
+                errors.append(f"session {session.number}: {error!r}")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(play, sessions))
+    return sessions, errors, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8, help="simulated sessions")
+    parser.add_argument("--concurrency", type=int, default=None, help="sessions running at once (default: all)")
+    parser.add_argument("--scans", type=int, default=3, help="scans per session")
+    parser.add_argument("--budget", type=float, default=None, help="maximum p95 latency in ms")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+    concurrency = args.concurrency or args.sessions
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep the run's analytics and reminders out of the real databases
+        os.environ["DENTAL_ANALYTICS_DB"] = os.path.join(tmp, "analytics.db")
+        os.environ["DENTAL_REMINDER_DB"] = os.path.join(tmp, "reminders.db")
+        os.chdir(ROOT)
+
+        # Warm up imports, the model and the figure caches
+        warmup, errors, _ = run_sessions(1, 1, 1, first=args.sessions)
+        if errors:
+            print(f"Warm-up failed: {errors[0]}", file=sys.stderr)
+            return 1
+        del warmup
+        gc.collect()
+        baseline_mb = rss_mb()
+
+        sessions, errors, wall_s = run_sessions(args.sessions, args.scans, concurrency)
+        gc.collect()
+        loaded_mb = rss_mb()
+
+        timings = {step: [ms for session in sessions for ms in session.timings[step]] for step in STEPS}
+        service = {step: [ms for session in sessions for ms in session.service[step]] for step in STEPS}
+        histories = [weakref.ref(session.app.session_state["history"]) for session in sessions]
+        del sessions
+        gc.collect()
+        released_mb = rss_mb()
+        leaked = sum(history() is not None for history in histories)
+
+    interactions = sum(len(values) for values in timings.values())
+    everything = [ms for values in timings.values() for ms in values]
+    service["all"] = [ms for values in service.values() for ms in values]
+    results = {
+        "sessions": args.sessions,
+        "concurrency": concurrency,
+        "scans_per_session": args.scans,
+        "errors": errors,
+        "leaked_sessions": leaked,
+        "wall_s": round(wall_s, 2),
+        "throughput": {
+            "runs_per_s": round(interactions / wall_s, 2),
+            "scans_per_s": round(len(timings["scan"]) / wall_s, 2),
+        },
+        "latency_ms": {
+            step: {
+                **{f"p{q}": percentile(values, q) for q in (50, 95, 99)},
+                "service_p50": percentile(service[step], 50),
+            }
+            for step, values in list(timings.items()) + [("all", everything)]
+        },
+        "rss_mb": {
+            "baseline": round(baseline_mb, 1),
+            "loaded": round(loaded_mb, 1),
+            "released": round(released_mb, 1),
+            "per_session": round((loaded_mb - baseline_mb) / args.sessions, 2),
+            "retained_per_session": round((released_mb - baseline_mb) / args.sessions, 2),
+        },
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{args.sessions} sessions x {args.scans} scans, {concurrency} at once, in {wall_s:.1f} s")
+        print(f"{'step':<10} {'runs':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'service p50':>12}")
+        for step, latency in results["latency_ms"].items():
+            runs = len(service[step])
+            print(f"{step:<10} {runs:>6} " + " ".join(f"{latency[p]:>9.1f}" for p in ("p50", "p95", "p99"))
+                  + f" {latency['service_p50']:>12.1f}")
+        throughput = results["throughput"]
+        print(f"Throughput: {throughput['runs_per_s']:.2f} runs/s, {throughput['scans_per_s']:.2f} scans/s")
+        memory = results["rss_mb"]
+        print(f"RSS: {memory['baseline']:.1f} MB after warm-up, {memory['loaded']:.1f} MB with all sessions "
+              f"({memory['per_session']:+.2f} MB/session), {memory['released']:.1f} MB after dropping them "
+              f"({memory['retained_per_session']:+.2f} MB/session retained)")
+        print(f"Session state still alive after dropping the sessions: {leaked} of {args.sessions}")
+        for error in errors:
+            print(f"FAILED: {error}", file=sys.stderr)
+
+    if errors or leaked:
+        return 1
+    p95 = results["latency_ms"]["all"]["p95"]
+    if args.budget is not None and p95 > args.budget:
+        print(f"p95 latency {p95:.1f} ms exceeds the {args.budget:.0f} ms budget", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
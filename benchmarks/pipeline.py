@@ -0,0 +1,390 @@
+"""
+Benchmarks for the imaging and rendering pipeline.
+
+Times the image processing functions on synthetic images at several
+resolutions and the report functions on histories of several sizes.
+Each case also reports the peak memory allocated by one run (traced with
+tracemalloc). Results are written as JSON; --compare checks them against
+a saved baseline and exits with status 1 when a case got slower than
+allowed.
+
+Usage:
+    python benchmarks/pipeline.py [--output results.json] [--repeat N] [--filter REGEX]
+    python benchmarks/pipeline.py --compare baseline.json [--threshold 0.25]
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import cv2
+
+from image_processing import preprocess_image, annotate_image, detect_teeth_region, decode_image, ingest_images
+from dental_detector import DentalDecayDetector
+from quality_gate import assess_quality
+from model_utils import enhance_dental_image, analyze_tooth_color, generate_heatmap
+from tooth_visualization import generate_3d_tooth_model, generate_decay_visualization, generate_arch_model
+from tooth_snapshot import tooth_snapshot_png, clear_snapshot_cache
+from dental_report import create_trend_chart, trend_series, health_scores, calculate_next_checkups
+from scan_history import ScanHistory
+from duplicate_index import DuplicateIndex, dhash, INDEX_CAPACITY
+from session_store import SessionStore, MemoryBackend, new_session_id
+
+# Image sizes as (width, height)
+RESOLUTIONS = {
+    "224": (224, 224),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "12mp": (4000, 3000),
+}
+
+HISTORY_SIZES = (1, 100, 10000)
+
+# Scans scored at once by the columnar health score
+COHORT_SIZE = 1_000_000
+
+# Hashes in the large duplicate index case
+LARGE_INDEX_SIZE = 100_000
+
+# Images in an uploaded series
+BATCH_SIZE = 20
+
+REGION_TYPES = ("decay", "plaque", "cavity", "gingivitis")
+
+ISSUES = ("Decay", "Plaque", "Cavity", "Gingivitis")
+
+# Results with every issue flagged, so annotate_image draws all overlays
+SEVERE_RESULTS = {"Decay": 80.0, "Plaque": 70.0, "Cavity": 65.0, "Gingivitis": 75.0}
+
+
+def synthetic_image(width, height, seed=0):
+    """
+    Build a reproducible RGB image resembling a close-up of teeth: ivory
+    teeth on a red gum band with a few yellow stains and dark spots.
+    """
+    rng = np.random.default_rng(seed)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = (225, 215, 190)
+
+    # Gum line across the middle
+    gum = height // 10
+    image[height // 2 - gum // 2:height // 2 + gum // 2] = (190, 60, 70)
+
+    scale = max(1, min(width, height) // 224)
+    for _ in range(12):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        cv2.circle(image, center, int(rng.integers(3, 12)) * scale, (200, 170, 40), -1)
+    for _ in range(6):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        cv2.circle(image, center, int(rng.integers(2, 8)) * scale, (40, 30, 25), -1)
+
+    noise = rng.integers(-12, 13, size=image.shape, dtype=np.int16)
+    return np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def synthetic_history(size, seed=0):
+    """
+    Build a reproducible scan history with one entry per day.
+    """
+    rng = np.random.default_rng(seed)
+    start = datetime(2024, 1, 1)
+    thumbnail = np.zeros((8, 8, 3), dtype=np.float32)
+    return [
+        {
+            "timestamp": (start + timedelta(days=i)).strftime("%Y-%m-%d %H:%M:%S"),
+            "image": thumbnail,
+            "results": dict(zip(ISSUES, rng.uniform(0, 100, len(ISSUES)).tolist())),
+        }
+        for i in range(size)
+    ]
+
+
+def jpeg_bytes(image, quality=90):
+    """
+    Encode an RGB image as JPEG, like a camera upload.
+    """
+    _, encoded = cv2.imencode(".jpg", cv2.cvtColor(image, cv2.COLOR_RGB2BGR),
+                              [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes()
+
+
+def ingest_legacy(data):
+    """
+    The original upload path: full-size decode, RGB copy, preprocess.
+    """
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    return preprocess_image(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+
+
+def build_cases():
+    """
+    List the benchmark cases.
+
+    Returns:
+        List of (name, setup) pairs; setup returns the function to time
+    """
+    cases = []
+
+    for label, (width, height) in RESOLUTIONS.items():
+        def image_case(func, label=label, width=width, height=height):
+            def setup():
+                image = synthetic_image(width, height)
+                return lambda: func(image)
+            return setup
+
+        cases.append((f"preprocess_image[{label}]", image_case(preprocess_image)))
+        cases.append((f"enhance_dental_image[{label}]", image_case(enhance_dental_image)))
+        cases.append((f"detect_teeth_region[{label}]", image_case(detect_teeth_region)))
+        cases.append((f"analyze_tooth_color[{label}]", image_case(analyze_tooth_color)))
+        cases.append((f"assess_quality[{label}]", image_case(assess_quality)))
+        for region_type in REGION_TYPES:
+            cases.append((
+                f"generate_heatmap[{region_type},{label}]",
+                image_case(lambda image, region_type=region_type: generate_heatmap(image, region_type))
+            ))
+        cases.append((
+            f"annotate_image[{label}]",
+            image_case(lambda image: annotate_image(image, SEVERE_RESULTS))
+        ))
+        
+        # Upload bytes to model input: the original full decode and copy
+        # to RGB, against decoding at reduced scale in BGR order
+        def ingest_case(ingest, width=width, height=height):
+            def setup():
+                data = jpeg_bytes(synthetic_image(width, height))
+                return lambda: ingest(data)
+            return setup
+        
+        cases.append((f"ingest_legacy[{label}]", ingest_case(ingest_legacy)))
+        cases.append((
+            f"ingest[224,{label}]",
+            ingest_case(lambda data: preprocess_image(decode_image(data, (224, 224)), channel_order="bgr"))
+        ))
+        cases.append((
+            f"ingest[640x480,{label}]",
+            ingest_case(lambda data: preprocess_image(decode_image(data, (640, 480)), channel_order="bgr"))
+        ))
+
+    # A clinic's intraoral series uploaded in one go
+    def series_setup():
+        payloads = [jpeg_bytes(synthetic_image(1920, 1080, seed=i)) for i in range(BATCH_SIZE)]
+        return lambda: ingest_images(payloads, min_size=(640, 480))
+    cases.append((f"ingest_images[{BATCH_SIZE}x1080p]", series_setup))
+    
+    def detect_batch_setup():
+        detector = DentalDecayDetector()
+        images = [preprocess_image(synthetic_image(224, 224, seed=i)) for i in range(BATCH_SIZE)]
+        return lambda: detector.detect_batch(images)
+    cases.append((f"detect_batch[{BATCH_SIZE}]", detect_batch_setup))
+
+    def dhash_setup():
+        image = preprocess_image(synthetic_image(224, 224))
+        return lambda: dhash(image)
+    cases.append(("dhash[224]", dhash_setup))
+
+    for size in (INDEX_CAPACITY, LARGE_INDEX_SIZE):
+        def duplicate_find_setup(size=size):
+            rng = np.random.default_rng(0)
+            index = DuplicateIndex(capacity=size)
+            for key, value in enumerate(rng.integers(0, 2 ** 64, size, dtype=np.uint64).tolist()):
+                index.add(key, value)
+            queries = iter(rng.integers(0, 2 ** 64, 1_000_000, dtype=np.uint64).tolist())
+            return lambda: index.find(next(queries))
+        cases.append((f"duplicate_find[{size}]", duplicate_find_setup))
+
+    def tooth_model_setup():
+        decay_areas = generate_decay_visualization(SEVERE_RESULTS)
+        return lambda: generate_3d_tooth_model(decay_areas)
+    cases.append(("generate_3d_tooth_model", tooth_model_setup))
+
+    def compact_tooth_model_setup():
+        decay_areas = generate_decay_visualization(SEVERE_RESULTS)
+        return lambda: generate_3d_tooth_model(decay_areas, compact=True)
+    cases.append(("generate_3d_tooth_model[compact]", compact_tooth_model_setup))
+
+    def arch_model_setup():
+        region_results = DentalDecayDetector().detect_regions(preprocess_image(synthetic_image(640, 480)))
+        return lambda: generate_arch_model(region_results)
+    cases.append(("generate_arch_model", arch_model_setup))
+
+    for side in (320, 640):
+        def snapshot_setup(side=side):
+            decay_areas = generate_decay_visualization(SEVERE_RESULTS)
+
+            def render():
+                clear_snapshot_cache()
+                return tooth_snapshot_png(decay_areas, (side, side))
+            return render
+        cases.append((f"tooth_snapshot_png[{side}]", snapshot_setup))
+
+    for size in HISTORY_SIZES:
+        def trend_setup(size=size):
+            history = synthetic_history(size)
+            return lambda: create_trend_chart(history)
+        cases.append((f"create_trend_chart[{size}]", trend_setup))
+
+        def trend_series_setup(size=size, columnar=False):
+            history = synthetic_history(size)
+            if columnar:
+                history = ScanHistory(history)
+            return lambda: trend_series(history)
+        cases.append((f"trend_series[{size}]", trend_series_setup))
+        cases.append((f"trend_series[{size},columnar]", lambda size=size: trend_series_setup(size, columnar=True)))
+
+    # Session store round trips with a history of 224x224 scans: the flush
+    # at the end of a run that changed nothing, and a restore
+    def session_state(size):
+        rng = np.random.default_rng(0)
+        history = ScanHistory()
+        for entry in synthetic_history(size):
+            history.append({**entry, "image": rng.random((224, 224, 3), dtype=np.float32)})
+        return {"history": history, "user_info": {"name": "", "age": "", "last_dental_visit": ""}}
+
+    for size in (10, 100):
+        def session_flush_setup(size=size):
+            store, session_id, state = SessionStore(MemoryBackend()), new_session_id(), session_state(size)
+            store.flush(session_id, state, state)
+            return lambda: store.flush(session_id, state, state)
+        cases.append((f"session_flush[{size}]", session_flush_setup))
+
+        def session_load_setup(size=size):
+            store, session_id, state = SessionStore(MemoryBackend()), new_session_id(), session_state(size)
+            store.flush(session_id, state, state)
+            return lambda: SessionStore(store.backend).load(session_id)
+        cases.append((f"session_load[{size}]", session_load_setup))
+
+    def health_scores_setup():
+        scores = np.random.default_rng(0).uniform(0, 100, (COHORT_SIZE, len(ISSUES)))
+        return lambda: calculate_next_checkups(health_scores(scores)[0])
+    cases.append((f"health_scores[{COHORT_SIZE}]", health_scores_setup))
+
+    return cases
+
+
+def run_case(func, repeat, warmup=1):
+    """
+    Time a function.
+
+    Returns:
+        Dictionary with median/min/max milliseconds, the repeat count and
+        the peak kilobytes allocated by one untimed run
+    """
+    for _ in range(warmup):
+        func()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    # Memory is traced in a separate run, as tracing slows allocations
+    tracemalloc.start()
+    try:
+        func()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "max_ms": round(max(timings), 3),
+        "repeat": repeat,
+        "peak_kb": round(peak_bytes / 1024, 1),
+    }
+
+
+def environment():
+    import plotly
+    import matplotlib
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "plotly": plotly.__version__,
+        "matplotlib": matplotlib.__version__,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare median timings against a baseline.
+
+    Args:
+        results: Current "results" mapping
+        baseline: Baseline "results" mapping
+        threshold: Allowed relative slowdown, e.g. 0.25 for 25%
+
+    Returns:
+        (report lines, list of regressed case names)
+    """
+    lines = [f"{'case':<40}{'baseline ms':>13}{'current ms':>13}{'change':>10}"]
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before is None:
+            lines.append(f"{name:<40}{'-':>13}{current['median_ms']:>13.3f}{'new':>10}")
+            continue
+        change = current["median_ms"] / before["median_ms"] - 1 if before["median_ms"] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        lines.append(f"{name:<40}{before['median_ms']:>13.3f}{current['median_ms']:>13.3f}{change:>+10.1%}{flag}")
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case")
+    parser.add_argument("--filter", default=None, help="only run cases matching this regex")
+    parser.add_argument("--output", default=None, help="write JSON results to this file")
+    parser.add_argument("--compare", default=None, help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown for --compare")
+    args = parser.parse_args(argv)
+
+    # The simulated heatmaps and markers are random; keep runs comparable
+    np.random.seed(0)
+
+    pattern = re.compile(args.filter) if args.filter else None
+    results = {}
+    for name, setup in build_cases():
+        if pattern and not pattern.search(name):
+            continue
+        results[name] = run_case(setup(), args.repeat)
+        print(f"{name:<40}{results[name]['median_ms']:>12.3f} ms{results[name]['peak_kb']:>12.1f} KB",
+              file=sys.stderr)
+
+    report = {"environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        lines, regressions = compare(results, baseline, args.threshold)
+        print("\n".join(lines), file=sys.stderr)
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
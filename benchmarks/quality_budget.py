@@ -0,0 +1,121 @@
+"""
+Latency budget and sanity check for the image quality gate.
+
+Times assess_quality on synthetic frames at several resolutions and checks
+the 95th percentile against quality_gate.QUALITY_BUDGET_MS. It also runs
+the gate on degraded copies of the frame (blurred, dark, overexposed) and
+checks that each is rejected for the right reason, that the clean frame
+passes without flags, and that a frame of gum only is flagged no_teeth. The exit status is 1
+if either check fails, so the script can run in CI.
+
+Usage:
+    python benchmarks/quality_budget.py [--runs N] [--budget MS] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import cv2
+
+from pipeline import RESOLUTIONS, synthetic_image
+from quality_gate import assess_quality, QUALITY_BUDGET_MS
+
+
+def degraded_frames(image):
+    """
+    Degraded copies of a frame with the issue the gate should report.
+
+    Returns:
+        List of (name, image, "rejected" or "flagged", expected issue);
+        an issue of None means the frame must pass without any flag
+    """
+    height, width = image.shape[:2]
+    noise = np.random.default_rng(0).integers(-12, 13, size=image.shape, dtype=np.int16)
+    gum_only = np.clip(np.array([190, 60, 70], dtype=np.int16) + noise, 0, 255).astype(np.uint8)
+    return [
+        ("original", image, "rejected", None),
+        ("blurred", cv2.GaussianBlur(image, (0, 0), max(width, height) / 100), "rejected", "blurry"),
+        ("dark", (image * 0.12).astype(np.uint8), "rejected", "too_dark"),
+        ("overexposed", np.clip(image.astype(np.int16) + 140, 0, 255).astype(np.uint8), "rejected", "overexposed"),
+        ("gum_only", gum_only, "flagged", "no_teeth"),
+    ]
+
+
+def time_gate(image, runs):
+    """
+    Time assess_quality on one image.
+
+    Returns:
+        Dictionary with median and 95th percentile milliseconds
+    """
+    assess_quality(image)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        assess_quality(image)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(0.95 * len(timings)))], 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=50, help="timed runs per resolution")
+    parser.add_argument("--budget", type=float, default=QUALITY_BUDGET_MS, help="p95 budget in ms")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    failures = []
+    report = {"budget_ms": args.budget, "timings": {}, "checks": {}}
+
+    for label, (width, height) in RESOLUTIONS.items():
+        image = synthetic_image(width, height)
+
+        timing = time_gate(image, args.runs)
+        report["timings"][label] = timing
+        if timing["p95_ms"] > args.budget:
+            failures.append(f"{label}: p95 {timing['p95_ms']} ms > budget {args.budget} ms")
+
+        for name, frame, kind, expected in degraded_frames(image):
+            result = assess_quality(frame)
+            if expected is None:
+                ok = result["passed"] and not result["flagged"]
+            else:
+                ok = expected in result[kind]
+            report["checks"][f"{name}[{label}]"] = {
+                "rejected": result["rejected"],
+                "flagged": result["flagged"],
+                "ok": ok,
+            }
+            if not ok:
+                failures.append(f"{name}[{label}]: expected {expected or 'a clean pass'}, "
+                                f"got rejected={result['rejected']} flagged={result['flagged']}")
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'resolution':<12}{'median ms':>11}{'p95 ms':>9}")
+        for label, timing in report["timings"].items():
+            print(f"{label:<12}{timing['median_ms']:>11}{timing['p95_ms']:>9}")
+        print()
+        for name, check in report["checks"].items():
+            print(f"{name:<24}{'ok' if check['ok'] else 'FAIL':>6}  rejected={check['rejected']} flagged={check['flagged']}")
+
+    for failure in failures:
+        print(f"FAILED: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
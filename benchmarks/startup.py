@@ -0,0 +1,159 @@
+"""
+Cold-start benchmark: import time and resident memory of the app modules.
+
+Every module is imported in a fresh interpreter, several times, and the
+median is reported. With --check the results are compared against
+startup_budget.json and the exit status is 1 if any budget is exceeded,
+so the script can run in CI.
+
+Usage:
+    python benchmarks/startup.py [--runs N] [--json] [--check] [--budget FILE]
+    python benchmarks/startup.py --write-budget [--headroom 1.5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_budget.json")
+
+# Modules measured, "app" being the Streamlit entry point
+MODULES = [
+    "app",
+    "dental_detector",
+    "image_processing",
+    "model_utils",
+    "region_analysis",
+    "tooth_visualization",
+    "dental_report",
+    "language_support",
+    "reminder_system",
+    "reminder_scheduler",
+    "calendar_export",
+    "pdf_report",
+    "scan_history",
+    "population_analytics",
+    "session_store",
+    "duplicate_index",
+]
+
+# Runs inside the child interpreter; prints one JSON line
+_PROBE = r"""
+import importlib, json, logging, sys, time
+
+def rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage // 1024 if sys.platform == "darwin" else usage
+
+logging.disable(logging.WARNING)
+before_modules = len(sys.modules)
+before_rss = rss_kb()
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "import_ms": elapsed * 1000,
+    "rss_mb": rss_kb() / 1024,
+    "rss_delta_mb": (rss_kb() - before_rss) / 1024,
+    "modules_loaded": len(sys.modules) - before_modules,
+}))
+"""
+
+
+def measure(module, runs):
+    """
+    Import a module in fresh interpreters and take the median of each metric.
+
+    Args:
+        module: Module name to import
+        runs: Number of fresh interpreters to use
+
+    Returns:
+        Dictionary of median metrics
+    """
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE, module],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    return {key: round(statistics.median(s[key] for s in samples), 1) for key in samples[0]}
+
+
+def check_budget(results, budget):
+    """
+    Compare results against a budget.
+
+    Returns:
+        List of human readable violations
+    """
+    # A measured module without a budget would otherwise pass unchecked
+    violations = [f"{module}: no budget" for module in results if module not in budget]
+    for module, limits in budget.items():
+        measured = results.get(module)
+        if measured is None:
+            continue
+        for metric, limit in limits.items():
+            if measured[metric] > limit:
+                violations.append(f"{module}: {metric} {measured[metric]} > budget {limit}")
+    return violations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--modules", nargs="*", default=MODULES, help="modules to measure")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--check", action="store_true", help="fail if a budget is exceeded")
+    parser.add_argument("--budget", default=DEFAULT_BUDGET, help="budget file")
+    parser.add_argument("--write-budget", action="store_true", help="save current results as the budget")
+    parser.add_argument("--headroom", type=float, default=1.5, help="budget multiplier for --write-budget")
+    args = parser.parse_args(argv)
+
+    results = {module: measure(module, args.runs) for module in args.modules}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'module':<22}{'import ms':>11}{'rss MB':>9}{'+rss MB':>9}{'modules':>9}")
+        for module, r in results.items():
+            print(f"{module:<22}{r['import_ms']:>11}{r['rss_mb']:>9}{r['rss_delta_mb']:>9}{r['modules_loaded']:>9}")
+
+    if args.write_budget:
+        budget = {
+            module: {
+                "import_ms": round(r["import_ms"] * args.headroom),
+                "rss_mb": round(r["rss_mb"] * args.headroom)
+            }
+            for module, r in results.items()
+        }
+        with open(args.budget, "w") as f:
+            json.dump(budget, f, indent=2)
+            f.write("\n")
+        print(f"Budget written to {args.budget}")
+
+    if args.check:
+        with open(args.budget) as f:
+            violations = check_budget(results, json.load(f))
+        for violation in violations:
+            print(f"BUDGET EXCEEDED: {violation}", file=sys.stderr)
+        return 1 if violations else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+import hashlib
+import hmac
+import os
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+PRODID = "-//Dental Decay Detector//Dental Checkup//EN"
+UID_DOMAIN = "dentalapp.example.com"
+
+# Length of a checkup appointment in the calendar
+APPOINTMENT_LENGTH = timedelta(hours=1)
+
+CHECKUP_SUMMARY = "Dental Checkup Appointment"
+CHECKUP_DESCRIPTION = "Scheduled dental checkup based on your Dental Decay Detector app recommendation."
+CHECKUP_LOCATION = "Your Dentist's Office"
+
+
+def _format_time(value):
+    return value.strftime("%Y%m%dT%H%M%S")
+
+
+def _escape_text(value):
+    """
+    Escape a TEXT property value as required by RFC 5545.
+    """
+    return (value.replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\n", "\\n"))
+
+
+def _fold(line, limit=75):
+    """
+    Fold a content line longer than 75 octets (RFC 5545, section 3.1).
+    """
+    data = line.encode("utf-8")
+    if len(data) <= limit:
+        return line
+
+    parts = []
+    while len(data) > limit:
+        cut = limit
+        # Don't split a multi-byte character
+        while cut > 0 and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut].decode("utf-8"))
+        data = data[cut:]
+        limit = 74  # continuation lines start with a space
+    parts.append(data.decode("utf-8"))
+    return "\r\n ".join(parts)
+
+
+def checkup_uid(user_id, checkup_date):
+    """
+    Stable event UID for a user's checkup, so re-exports update the same
+    calendar entry instead of adding duplicates.
+    """
+    user_hash = hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:16]
+    return f"dentalcheckup-{user_hash}-{_format_time(checkup_date)}@{UID_DOMAIN}"
+
+
+def format_vevent(uid, start, stamp=None, summary=CHECKUP_SUMMARY,
+                  description=CHECKUP_DESCRIPTION, location=CHECKUP_LOCATION):
+    """
+    Format a single VEVENT block.
+
+    Args:
+        uid: Unique event id
+        start: Datetime of the appointment
+        stamp: Datetime the event was generated (default: now)
+        summary: Event title
+        description: Event description
+        location: Event location
+
+    Returns:
+        VEVENT text with CRLF line endings
+    """
+    stamp_str = _format_time(stamp or datetime.now())
+    lines = [
+        "BEGIN:VEVENT",
+        f"DTSTART:{_format_time(start)}",
+        f"DTEND:{_format_time(start + APPOINTMENT_LENGTH)}",
+        f"DTSTAMP:{stamp_str}",
+        f"UID:{uid}",
+        f"CREATED:{stamp_str}",
+        f"DESCRIPTION:{_escape_text(description)}",
+        f"LAST-MODIFIED:{stamp_str}",
+        f"LOCATION:{_escape_text(location)}",
+        "SEQUENCE:0",
+        "STATUS:CONFIRMED",
+        f"SUMMARY:{_escape_text(summary)}",
+        "TRANSP:OPAQUE",
+        "END:VEVENT",
+    ]
+    return "\r\n".join(_fold(line) for line in lines) + "\r\n"
+
+
+def iter_calendar(events, name=None):
+    """
+    Stream a VCALENDAR document chunk by chunk.
+
+    Args:
+        events: Iterable of VEVENT strings (may itself be a generator)
+        name: Optional calendar name shown by calendar clients
+
+    Yields:
+        Text chunks: the header, one per event, then the footer
+    """
+    header = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+    ]
+    if name:
+        header.append(f"X-WR-CALNAME:{_escape_text(name)}")
+    yield "\r\n".join(header) + "\r\n"
+
+    for event in events:
+        yield event
+
+    yield "END:VCALENDAR\r\n"
+
+
+def format_calendar(events, name=None):
+    """
+    Build a complete VCALENDAR document as one string.
+    """
+    return "".join(iter_calendar(events, name))
+
+
+def reminder_events(reminders, stamp=None):
+    """
+    Turn stored checkups into VEVENT strings, lazily.
+
+    Args:
+        reminders: Iterable of dictionaries with "user_id" and
+            "checkup_at", as from ReminderStore.for_user or iter_all
+        stamp: Generation time shared by all events
+
+    Yields:
+        VEVENT strings
+    """
+    stamp = stamp or datetime.now()
+    for reminder in reminders:
+        checkup_date = datetime.fromtimestamp(reminder["checkup_at"])
+        yield format_vevent(checkup_uid(reminder["user_id"], checkup_date), checkup_date, stamp)
+
+
+class CalendarFeeds:
+    """
+    Per-user subscription feeds and the clinic-wide export, with ETags.
+
+    A feed's ETag is derived from the checkups it contains, which costs a
+    primary-key lookup. Calendar clients polling with If-None-Match get a
+    "not modified" answer without any regeneration, and changed feeds are
+    rendered once and kept in a small LRU cache.
+    """
+
+    def __init__(self, store, cache_size=1024):
+        """
+        Initialize the feeds.
+
+        Args:
+            store: ReminderStore with the scheduled checkups
+            cache_size: Number of rendered user feeds to keep
+        """
+        self.store = store
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def user_etag(self, user_id):
+        """
+        ETag of a user's feed.
+        """
+        reminders = self.store.for_user(user_id)
+        digest = hashlib.sha1(user_id.encode("utf-8"))
+        for reminder in reminders:
+            digest.update(repr(reminder["checkup_at"]).encode("ascii"))
+        return f'"{digest.hexdigest()}"'
+
+    def user_feed(self, user_id, if_none_match=None):
+        """
+        Get a user's feed unless the client already has the current one.
+
+        Args:
+            user_id: User whose checkups to include
+            if_none_match: ETag sent by the client, if any
+
+        Returns:
+            (etag, body) where body is None if the client's copy is current
+        """
+        etag = self.user_etag(user_id)
+        if if_none_match == etag:
+            return etag, None
+
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached is not None and cached[0] == etag:
+                self._cache.move_to_end(user_id)
+                return cached
+
+        body = format_calendar(reminder_events(self.store.for_user(user_id)), "Dental Checkups")
+
+        with self._lock:
+            self._cache[user_id] = (etag, body)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return etag, body
+
+    def clinic_etag(self):
+        """
+        ETag of the clinic-wide export.
+        """
+        return f'"clinic-{self.store.checkups_version()}"'
+
+    def iter_clinic_export(self):
+        """
+        Stream every scheduled checkup as one calendar.
+
+        Checkups are paged out of the store and formatted one at a time,
+        so memory stays flat however many patients there are.
+        """
+        return iter_calendar(reminder_events(self.store.iter_all()), "Clinic Dental Checkups")
+
+
+def make_feed_handler(feeds, clinic_token=None):
+    """
+    Build an HTTP handler serving /calendar/<user_id>.ics and
+    /calendar/clinic.ics from a CalendarFeeds instance.
+
+    User feeds are public: their unguessable id is the credential. The
+    clinic-wide export lists every patient's checkups, so it is only
+    served with an "Authorization: Bearer <clinic_token>" header, and not
+    at all without a token (use the command line export instead).
+    """
+
+    class CalendarFeedHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if not (path.startswith("/calendar/") and path.endswith(".ics")):
+                self.send_error(404)
+                return
+
+            name = unquote(path[len("/calendar/"):-len(".ics")])
+            if_none_match = self.headers.get("If-None-Match")
+
+            if name == "clinic":
+                if not self._clinic_authorized():
+                    # Indistinguishable from an unknown feed
+                    self.send_error(404)
+                    return
+                etag = feeds.clinic_etag()
+                if if_none_match == etag:
+                    self._send_not_modified(etag)
+                    return
+                self.send_response(200)
+                self._send_feed_headers(etag)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in feeds.iter_clinic_export():
+                    data = chunk.encode("utf-8")
+                    self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+                return
+
+            etag, body = feeds.user_feed(name, if_none_match)
+            if body is None:
+                self._send_not_modified(etag)
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self._send_feed_headers(etag)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _clinic_authorized(self):
+            if not clinic_token:
+                return False
+            scheme, _, token = self.headers.get("Authorization", "").partition(" ")
+            return scheme.lower() == "bearer" and hmac.compare_digest(token.encode(), clinic_token.encode())
+
+        def _send_feed_headers(self, etag):
+            self.send_header("Content-Type", "text/calendar; charset=utf-8")
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "private, max-age=300")
+
+        def _send_not_modified(self, etag):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return CalendarFeedHandler
+
+
+_server = None
+_server_error = None
+_server_lock = threading.Lock()
+
+
+def start_feed_server(store, host="127.0.0.1", port=8502, clinic_token=None):
+    """
+    Serve calendar feeds over HTTP in a background thread (once per process).
+
+    If the port cannot be bound (another worker or app already has it),
+    the error is reported once and feeds stay off in this process.
+
+    Args:
+        store: ReminderStore with the scheduled checkups
+        host: Interface to listen on; only this machine by default, so a
+            reverse proxy decides what is exposed
+        port: Port to listen on
+        clinic_token: Bearer token required for the clinic-wide export;
+            None disables it over HTTP
+
+    Returns:
+        The running ThreadingHTTPServer, or None if it could not start
+    """
+    global _server, _server_error
+
+    with _server_lock:
+        if _server is None and _server_error is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), make_feed_handler(CalendarFeeds(store), clinic_token))
+            except OSError as e:
+                _server_error = e
+                print(f"Calendar feed server could not listen on {host}:{port}: {e}")
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="calendar-feeds", daemon=True).start()
+
+    return _server
+
+
+def main(argv=None):
+    """
+    Write the clinic-wide calendar export to a file.
+
+    Usage: python calendar_export.py OUTPUT.ics [REMINDER_DB]
+    """
+    from reminder_scheduler import ReminderStore, DEFAULT_DB_PATH
+
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print(main.__doc__.strip().splitlines()[-1].strip())
+        return 2
+
+    store = ReminderStore(argv[1] if len(argv) > 1 else os.environ.get("DENTAL_REMINDER_DB", DEFAULT_DB_PATH))
+    with open(argv[0], "w", encoding="utf-8", newline="") as f:
+        for chunk in CalendarFeeds(store).iter_clinic_export():
+            f.write(chunk)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
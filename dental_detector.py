@@ -1,5 +1,14 @@
 import numpy as np
-import cv2
+from region_analysis import RegionStatistics, region_rects
+from instrumentation import timed
+
+# Randomness added to each simulated score
+SCORE_VARIANCE = {
+    "Decay": 20,
+    "Plaque": 15,
+    "Cavity": 25,
+    "Gingivitis": 30
+}
 
 class DentalDecayDetector:
     """
@@ -21,6 +30,7 @@ class DentalDecayDetector:
         self.cavity_sensitivity = 1.5
         self.gingivitis_sensitivity = 1.3
     
+    @timed("detect")
     def detect(self, image):
         """
         Detect dental issues in the provided image.
@@ -60,25 +70,114 @@ class DentalDecayDetector:
         # Simulate detection results based on image characteristics
         # NOTE: This is NOT how real detection works - just a simulation
         # for demonstration purposes
+        base_scores = self._base_scores(brightness, contrast, red_channel, blue_channel)
+        
+        # Return simulated detection results
+        return {
+            issue: self._simulate_score(base, variance=SCORE_VARIANCE[issue])
+            for issue, base in base_scores.items()
+        }
+    
+    @timed("detect_batch")
+    def detect_batch(self, images):
+        """
+        Detect dental issues in several images with one vectorized pass.
+        
+        The random variation is drawn in the same order as calling detect
+        on each image in turn, so with the same seed both give the same
+        results (up to float rounding of the image statistics).
         
-        # Simulate decay detection (higher in darker regions)
-        decay_score = self._simulate_score(100 - brightness, variance=20)
+        Args:
+            images: Preprocessed images (224x224x3, RGB), as a list or
+                an (N, 224, 224, 3) array
         
-        # Simulate plaque detection (higher with less contrast)
-        plaque_score = self._simulate_score(100 - contrast, variance=15)
+        Returns:
+            List of dictionaries with issue confidence scores, one per image
+        """
+        batch = np.asarray(images)
+        if len(batch) == 0:
+            return []
         
-        # Simulate cavity detection (higher in darker regions with higher blue channel)
-        cavity_score = self._simulate_score((100 - brightness) * (blue_channel/128), variance=25)
+        # Per-image characteristics for the whole batch at once. Channel
+        # sums go through a matrix product: reducing the strided pixel axis
+        # directly is several times slower than per-image np.mean.
+        pixels = batch.reshape(len(batch), -1, 3)
+        count = pixels.shape[1]
+        channel_means = (np.ones(count, dtype=batch.dtype) @ pixels).astype(np.float64) / count
+        brightness = channel_means.mean(axis=1)
+        flat = batch.reshape(len(batch), -1)
+        mean_square = np.einsum("ij,ij->i", flat, flat).astype(np.float64) / flat.shape[1]
+        contrast = np.sqrt(np.maximum(mean_square - brightness ** 2, 0))
         
-        # Simulate gingivitis detection (higher with higher red channel)
-        gingivitis_score = self._simulate_score(red_channel, variance=30)
+        base_scores = self._base_scores(brightness, contrast, channel_means[:, 0], channel_means[:, 2])
         
-        # Return simulated detection results
+        # One row of noise per image, issues in the order detect draws them
+        issues = list(base_scores)
+        variances = np.array([SCORE_VARIANCE[issue] for issue in issues], dtype=np.float64)
+        noise = np.random.standard_normal((len(batch), len(issues))) * variances
+        scores = np.clip(np.column_stack([base_scores[issue] for issue in issues]) + noise, 0, 100)
+        
+        return [
+            {issue: float(score) for issue, score in zip(issues, row)}
+            for row in scores
+        ]
+    
+    @timed("detect_regions")
+    def detect_regions(self, image, regions=None, roi=None):
+        """
+        Score dental issues separately for each dental region.
+        
+        Summed-area tables are built once, so each additional region
+        costs a handful of lookups instead of another pass over the image.
+        
+        Args:
+            image: A preprocessed image (224x224x3) in RGB format
+            regions: Optional mapping of region name to fractional bounds
+                (default: region_analysis.DENTAL_REGIONS)
+            roi: Optional (x, y, w, h) area containing the teeth
+            
+        Returns:
+            Dictionary mapping region name to issue confidence scores
+        """
+        stats = RegionStatistics(image)
+        
+        region_scores = {}
+        for name, rect in region_rects(image.shape, regions, roi).items():
+            base_scores = self._base_scores(
+                stats.mean("brightness", rect),
+                stats.pooled_std(rect),
+                stats.mean("red", rect),
+                stats.mean("blue", rect)
+            )
+            # Regions are compared with each other, so no randomness here
+            region_scores[name] = {
+                issue: max(0, min(100, base)) for issue, base in base_scores.items()
+            }
+        
+        return region_scores
+    
+    def _base_scores(self, brightness, contrast, red_channel, blue_channel):
+        """
+        Helper method mapping image characteristics to base issue scores.
+        
+        Args:
+            brightness: Mean pixel value
+            contrast: Standard deviation of pixel values
+            red_channel: Mean of the red channel
+            blue_channel: Mean of the blue channel
+            
+        Returns:
+            Dictionary of unclamped base scores for each issue
+        """
         return {
-            "Decay": decay_score,
-            "Plaque": plaque_score,
-            "Cavity": cavity_score,
-            "Gingivitis": gingivitis_score
+            # Decay is higher in darker regions
+            "Decay": 100 - brightness,
+            # Plaque is higher with less contrast
+            "Plaque": 100 - contrast,
+            # Cavities are higher in darker regions with a higher blue channel
+            "Cavity": (100 - brightness) * (blue_channel/128),
+            # Gingivitis is higher with a higher red channel
+            "Gingivitis": red_channel
         }
     
     def _simulate_score(self, base_value, variance=10):
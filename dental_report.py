@@ -1,9 +1,37 @@
-import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
 import io
 import base64
+from functools import lru_cache
+from html import escape
+from language_support import translator
+from lazy_imports import lazy_module
+from instrumentation import timed
+
+# pyplot is slow to import and only needed for trend charts
+plt = lazy_module("matplotlib.pyplot")
+
+# Issue columns of score matrices, in order
+ISSUES = ("Decay", "Plaque", "Cavity", "Gingivitis")
+
+# Weight of each issue in the severity penalty of the health score
+ISSUE_PENALTIES = {"Decay": 0.5, "Cavity": 0.7, "Plaque": 0.3}
+
+# Health levels as (minimum score, status, color), best first
+HEALTH_LEVELS = [
+    (85, "Excellent", "#2ecc71"),  # Green
+    (70, "Good", "#3498db"),  # Blue
+    (50, "Fair", "#f39c12"),  # Orange
+    (0, "Needs Attention", "#e74c3c"),  # Red
+]
+
+# Checkup intervals as (score below, days, urgency); higher scores and
+# unknown scores get REGULAR_CHECKUP
+CHECKUP_INTERVALS = [
+    (50, 14, "Urgent"),  # 2 weeks
+    (70, 90, "Soon"),  # 3 months
+]
+REGULAR_CHECKUP = (180, "Regular")  # 6 months
 
 def generate_health_score(detection_results):
     """
@@ -25,31 +53,113 @@ def generate_health_score(detection_results):
     base_score = 100 - np.mean(issue_values)
     
     # Adjust score based on severity of specific issues
-    decay_penalty = 0.5 * detection_results.get("Decay", 0)
-    cavity_penalty = 0.7 * detection_results.get("Cavity", 0)
-    plaque_penalty = 0.3 * detection_results.get("Plaque", 0)
+    penalty = sum(weight * detection_results.get(issue, 0) for issue, weight in ISSUE_PENALTIES.items())
     
     # Calculate final score
-    final_score = max(0, min(100, base_score - (decay_penalty + cavity_penalty + plaque_penalty) / 3))
+    final_score = max(0, min(100, base_score - penalty / 3))
     final_score = round(final_score, 1)
     
     # Determine status and color based on score
-    if final_score >= 85:
-        status = "Excellent"
-        color = "#2ecc71"  # Green
-    elif final_score >= 70:
-        status = "Good"
-        color = "#3498db"  # Blue
-    elif final_score >= 50:
-        status = "Fair"
-        color = "#f39c12"  # Orange
+    for minimum, status, color in HEALTH_LEVELS:
+        if final_score >= minimum:
+            return final_score, status, color
+    
+    return final_score, HEALTH_LEVELS[-1][1], HEALTH_LEVELS[-1][2]
+
+
+def score_matrix(results_list, issues=ISSUES):
+    """
+    Stack detection results into an (N, len(issues)) score matrix.
+    
+    Args:
+        results_list: Iterable of detection result dictionaries
+        issues: Column order
+        
+    Returns:
+        float64 array, NaN where an issue is missing
+    """
+    return np.array(
+        [[results.get(issue, np.nan) for issue in issues] for results in results_list],
+        dtype=np.float64
+    ).reshape(-1, len(issues))
+
+
+@timed("health_scores")
+def health_scores(scores, issues=ISSUES):
+    """
+    Score many scans at once; the columnar form of generate_health_score.
+    
+    Missing scores (NaN, or columns absent from a DataFrame) are left out
+    of the average and add no penalty, as missing keys do for a single
+    scan. Rows with no scores at all get a NaN score and empty status and
+    color.
+    
+    Args:
+        scores: (N, len(issues)) array of issue scores, or a DataFrame
+            with issue columns
+        issues: Issue of each array column (ignored for DataFrames, whose
+            columns are looked up by name)
+        
+    Returns:
+        scores: (N,) float64 health scores rounded to 0.1
+        statuses: (N,) array of status strings
+        colors: (N,) array of color strings
+    """
+    if hasattr(scores, "columns"):
+        values = scores.reindex(columns=list(ISSUES)).to_numpy(dtype=np.float64)
+        issues = ISSUES
+    else:
+        values = np.asarray(scores, dtype=np.float64).reshape(-1, len(issues))
+    weights = np.array([ISSUE_PENALTIES.get(issue, 0.0) for issue in issues])
+    
+    missing = np.isnan(values)
+    if missing.any():
+        values = np.where(missing, 0.0, values)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = values.sum(axis=1) / (~missing).sum(axis=1)
+    else:
+        mean = values.mean(axis=1)
+    
+    final = np.round(np.clip(100 - mean - (values @ weights) / 3, 0, 100), 1)
+    
+    # Index into HEALTH_LEVELS (best first); unscored rows get the extra slot
+    minimums = [minimum for minimum, _, _ in HEALTH_LEVELS[:-1]]
+    level = len(minimums) - np.searchsorted(minimums[::-1], final, side="right")
+    level[np.isnan(final)] = len(HEALTH_LEVELS)
+    statuses = np.array([status for _, status, _ in HEALTH_LEVELS] + [""])[level]
+    colors = np.array([color for _, _, color in HEALTH_LEVELS] + [""])[level]
+    
+    return final, statuses, colors
+
+
+def trend_series(history_data):
+    """
+    Collect the data points of the health trend chart.
+    
+    Args:
+        history_data: List of history entries with timestamps and
+            results, or a ScanHistory
+        
+    Returns:
+        dates: List of scan datetimes
+        scores: List of health scores (0 for entries without results)
+    """
+    if hasattr(history_data, "timestamps"):
+        # Columnar history (scan_history.ScanHistory): no parsing needed
+        dates = history_data.timestamps.astype(datetime).tolist()
+        scores, _, _ = health_scores(history_data.scores, history_data.issues)
     else:
-        status = "Needs Attention"
-        color = "#e74c3c"  # Red
+        # Convert timestamp strings to datetimes
+        dates = [datetime.strptime(entry.get('timestamp', ''), "%Y-%m-%d %H:%M:%S") for entry in history_data]
+        scores, _, _ = health_scores(score_matrix(entry.get('results') or {} for entry in history_data))
+    
+    # Entries without results score 0
+    scores = np.nan_to_num(scores, nan=0.0).tolist()
     
-    return final_score, status, color
+    return dates, scores
 
 
+@timed("create_trend_chart")
 def create_trend_chart(history_data):
     """
     Create a chart showing dental health trend over time.
@@ -64,18 +174,7 @@ def create_trend_chart(history_data):
         return None
     
     # Collect data points
-    dates = []
-    scores = []
-    
-    for entry in history_data:
-        # Convert timestamp string to datetime
-        date = datetime.strptime(entry.get('timestamp', ''), "%Y-%m-%d %H:%M:%S")
-        dates.append(date)
-        
-        # Calculate health score
-        results = entry.get('results', {})
-        score, _, _ = generate_health_score(results)
-        scores.append(score if score is not None else 0)
+    dates, scores = trend_series(history_data)
     
     # Create plot
     plt.figure(figsize=(10, 4))
@@ -108,114 +207,129 @@ def create_trend_chart(history_data):
     return html_img
 
 
-def generate_recommendations(detection_results):
+# Recommendation rules, checked in order. Within a group only the first
+# matching rule applies. Texts are translation keys: rec_<id>_title,
+# rec_<id>_description and rec_<id>_action_<n>.
+RECOMMENDATION_RULES = [
+    {"id": "decay_treatment", "issue": "Decay", "threshold": 50, "group": "decay", "actions": 3, "urgency": "high"},
+    {"id": "early_decay", "issue": "Decay", "threshold": 30, "group": "decay", "actions": 3, "urgency": "medium"},
+    {"id": "cavity_treatment", "issue": "Cavity", "threshold": 50, "group": "cavity", "actions": 3, "urgency": "high"},
+    {"id": "plaque_buildup", "issue": "Plaque", "threshold": 40, "group": "plaque", "actions": 4, "urgency": "medium"},
+]
+
+# Shown when no rule matches
+DEFAULT_RECOMMENDATION = {"id": "maintain_health", "actions": 3, "urgency": "low"}
+
+URGENCY_COLORS = {
+    "high": "#e74c3c",  # Red
+    "medium": "#f39c12",  # Orange
+    "low": "#2ecc71"  # Green
+}
+
+_RULES_BY_ID = {rule["id"]: rule for rule in RECOMMENDATION_RULES + [DEFAULT_RECOMMENDATION]}
+
+
+def select_recommendations(detection_results):
     """
-    Generate personalized recommendations based on detection results.
+    Pick the recommendation rules that apply to detection results.
     
     Args:
         detection_results: Dictionary with detection results
         
     Returns:
-        recommendations_html: HTML formatted recommendations
+        List of rule ids, in display order
     """
-    if not detection_results:
-        return None
+    selected = []
+    matched_groups = set()
+    
+    for rule in RECOMMENDATION_RULES:
+        if rule["group"] in matched_groups:
+            continue
+        if detection_results.get(rule["issue"], 0) > rule["threshold"]:
+            selected.append(rule["id"])
+            matched_groups.add(rule["group"])
+    
+    # General recommendation if no specific issues detected
+    if not selected:
+        selected.append(DEFAULT_RECOMMENDATION["id"])
+    
+    return selected
+
+
+def recommendation_text(rule_id, language="english"):
+    """
+    Look up the texts of one recommendation in one language.
+    
+    Args:
+        rule_id: Id of a recommendation rule
+        language: Language for the recommendation texts
+        
+    Returns:
+        Dictionary with "title", "description", "actions" (list) and
+        "urgency"
+    """
+    rule = _RULES_BY_ID[rule_id]
+    t = translator.bind(language)
+    return {
+        "title": t(f"rec_{rule_id}_title"),
+        "description": t(f"rec_{rule_id}_description"),
+        "actions": [t(f"rec_{rule_id}_action_{n}") for n in range(1, rule["actions"] + 1)],
+        "urgency": rule["urgency"],
+    }
+
+
+@lru_cache(maxsize=None)
+def render_recommendation(rule_id, language="english"):
+    """
+    Render the HTML fragment for one recommendation in one language.
+    
+    Fragments depend only on the rule and language, so each is built once
+    and then reused for every result.
+    
+    Args:
+        rule_id: Id of a recommendation rule
+        language: Language for the recommendation texts
+        
+    Returns:
+        HTML fragment for the recommendation
+    """
+    texts = recommendation_text(rule_id, language)
+    color = URGENCY_COLORS[texts["urgency"]]
     
-    recommendations = []
-    
-    decay_score = detection_results.get("Decay", 0)
-    cavity_score = detection_results.get("Cavity", 0)
-    plaque_score = detection_results.get("Plaque", 0)
-    
-    # Core recommendations based on detected issues
-    if decay_score > 50:
-        recommendations.append({
-            "title": "Decay Treatment Needed",
-            "description": "Significant tooth decay detected. We recommend seeing a dentist within the next 2 weeks.",
-            "actions": [
-                "Visit a dentist for professional treatment",
-                "Use fluoride toothpaste twice daily",
-                "Consider a prescribed fluoride mouthwash"
-            ],
-            "urgency": "high"
-        })
-    elif decay_score > 30:
-        recommendations.append({
-            "title": "Early Decay Signs",
-            "description": "Early signs of tooth decay detected. Take preventive actions now.",
-            "actions": [
-                "Improve brushing technique, focusing on problem areas",
-                "Use fluoride toothpaste and mouthwash",
-                "Schedule a dental checkup within a month"
-            ],
-            "urgency": "medium"
-        })
-    
-    if cavity_score > 50:
-        recommendations.append({
-            "title": "Cavity Treatment Required",
-            "description": "Potential cavity detected. Professional treatment is recommended.",
-            "actions": [
-                "See a dentist promptly for evaluation and treatment",
-                "Avoid sweet and acidic foods in the affected area",
-                "Use sensitive teeth toothpaste until your appointment"
-            ],
-            "urgency": "high"
-        })
-    
-    if plaque_score > 40:
-        recommendations.append({
-            "title": "Plaque Buildup Detected",
-            "description": "Significant plaque buildup observed. Improved oral hygiene needed.",
-            "actions": [
-                "Brush teeth for full 2 minutes, twice daily",
-                "Use dental floss or interdental brushes daily",
-                "Consider an anti-plaque mouthwash",
-                "Schedule a professional cleaning"
-            ],
-            "urgency": "medium"
-        })
-    
-    # General recommendations if no specific issues detected
-    if not recommendations:
-        recommendations.append({
-            "title": "Maintain Good Oral Health",
-            "description": "Your dental health looks good. Keep up the good habits!",
-            "actions": [
-                "Continue regular brushing (2 minutes, twice daily)",
-                "Floss daily to maintain gum health",
-                "Visit your dentist for checkups twice a year"
-            ],
-            "urgency": "low"
-        })
-    
-    # Format recommendations as HTML
-    recommendations_html = ""
-    
-    for rec in recommendations:
-        # Set color based on urgency
-        if rec["urgency"] == "high":
-            color = "#e74c3c"  # Red
-        elif rec["urgency"] == "medium":
-            color = "#f39c12"  # Orange
-        else:
-            color = "#2ecc71"  # Green
-            
-        # Build HTML for this recommendation
-        rec_html = f"""
+    def text(value):
+        return escape(value, quote=False)
+    
+    # Build HTML for this recommendation
+    rec_html = f"""
         <div style="margin-bottom: 20px; padding: 15px; border-left: 5px solid {color}; background-color: rgba({int(color[1:3], 16)}, {int(color[3:5], 16)}, {int(color[5:7], 16)}, 0.1);">
-            <h4 style="color: {color};">{rec["title"]}</h4>
-            <p>{rec["description"]}</p>
+            <h4 style="color: {color};">{text(texts["title"])}</h4>
+            <p>{text(texts["description"])}</p>
             <ul>
         """
+    rec_html += "".join(f"<li>{text(action)}</li>" for action in texts["actions"])
+    rec_html += "</ul></div>"
+    
+    return rec_html
+
+
+def generate_recommendations(detection_results, language="english"):
+    """
+    Generate personalized recommendations based on detection results.
+    
+    Args:
+        detection_results: Dictionary with detection results
+        language: Language for the recommendation texts
         
-        for action in rec["actions"]:
-            rec_html += f"<li>{action}</li>"
-        
-        rec_html += "</ul></div>"
-        recommendations_html += rec_html
+    Returns:
+        recommendations_html: HTML formatted recommendations
+    """
+    if not detection_results:
+        return None
     
-    return recommendations_html
+    return "".join(
+        render_recommendation(rule_id, language)
+        for rule_id in select_recommendations(detection_results)
+    )
 
 
 def calculate_next_checkup(detection_results):
@@ -230,23 +344,47 @@ def calculate_next_checkup(detection_results):
         urgency: Urgency level (text)
     """
     if not detection_results:
-        return datetime.now() + timedelta(days=180), "Regular"  # 6 months
+        return datetime.now() + timedelta(days=REGULAR_CHECKUP[0]), REGULAR_CHECKUP[1]
     
     # Calculate base score
     score, status, _ = generate_health_score(detection_results)
     
     # Determine next checkup date based on health score
-    if score is None:
-        next_date = datetime.now() + timedelta(days=180)  # 6 months
-        urgency = "Regular"
-    elif score < 50:
-        next_date = datetime.now() + timedelta(days=14)  # 2 weeks
-        urgency = "Urgent"
-    elif score < 70:
-        next_date = datetime.now() + timedelta(days=90)  # 3 months
-        urgency = "Soon"
-    else:
-        next_date = datetime.now() + timedelta(days=180)  # 6 months
-        urgency = "Regular"
+    days, urgency = REGULAR_CHECKUP
+    if score is not None:
+        for below, interval, level in CHECKUP_INTERVALS:
+            if score < below:
+                days, urgency = interval, level
+                break
+    
+    return datetime.now() + timedelta(days=days), urgency
+
+
+@timed("calculate_next_checkups")
+def calculate_next_checkups(scores, dates=None):
+    """
+    Columnar form of calculate_next_checkup, over health scores.
+    
+    Args:
+        scores: (N,) health scores, as returned by health_scores; NaN for
+            unscored scans
+        dates: (N,) scan dates (datetime64 array or anything
+            np.asarray turns into one) the intervals count from;
+            default now
+        
+    Returns:
+        next_dates: (N,) datetime64[s] checkup dates
+        urgencies: (N,) array of urgency strings
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if dates is None:
+        dates = np.full(scores.shape, np.datetime64(datetime.now(), "s"))
+    dates = np.asarray(dates, dtype="datetime64[s]")
+    
+    # Index into CHECKUP_INTERVALS; past the end (and NaN) is a regular checkup
+    limits = [below for below, _, _ in CHECKUP_INTERVALS]
+    level = np.searchsorted(limits, scores, side="right")
+    days = np.array([interval for _, interval, _ in CHECKUP_INTERVALS] + [REGULAR_CHECKUP[0]])[level]
+    urgencies = np.array([urgency for _, _, urgency in CHECKUP_INTERVALS] + [REGULAR_CHECKUP[1]])[level]
     
-    return next_date, urgency
\ No newline at end of file
+    return dates + days.astype("timedelta64[D]"), urgencies
@@ -0,0 +1,181 @@
+import time
+from collections import OrderedDict
+import numpy as np
+from lazy_imports import lazy_module
+from instrumentation import timed
+
+cv2 = lazy_module("cv2")
+
+# Side of the difference hash grid; the hash has HASH_SIZE**2 bits
+HASH_SIZE = 8
+
+# Hashes at most this many bits apart count as near-duplicates. Frames
+# re-captured without moving differ by a few bits; a different view of
+# the mouth by 20 or more.
+DUPLICATE_RADIUS = 6
+
+# Number of recent scans the index remembers
+INDEX_CAPACITY = 256
+
+# Seconds a scan counts as recent: a repeated press or a re-captured
+# frame. A follow-up photo of the same mouth taken later is a new scan,
+# however similar it looks.
+DUPLICATE_WINDOW = 5 * 60
+
+
+@timed("dhash")
+def dhash(image, hash_size=HASH_SIZE):
+    """
+    Difference hash of an image.
+
+    The image is shrunk to (hash_size + 1) x hash_size gray pixels and
+    each bit records whether a pixel is brighter than its right-hand
+    neighbour, so the hash survives rescaling, recompression and small
+    exposure changes.
+
+    Args:
+        image: RGB image, uint8 or float in the 0-1 range (e.g. the
+            224x224 output of preprocess_image)
+        hash_size: Side of the hash grid
+
+    Returns:
+        Hash as a Python int of hash_size**2 bits
+    """
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a, b):
+    """
+    Number of differing bits of two hashes.
+    """
+    return (a ^ b).bit_count()
+
+
+class DuplicateIndex:
+    """
+    Index of recent image hashes answering Hamming-radius queries.
+
+    Uses multi-index hashing: each hash is split into radius + 1 bands,
+    and by the pigeonhole principle two hashes within the radius agree
+    exactly on at least one band. A query therefore looks up its bands
+    in one dictionary each and only checks the few hashes found there,
+    instead of comparing against every stored hash.
+
+    Hashes older than the window are never reported and are evicted.
+    """
+
+    def __init__(self, radius=DUPLICATE_RADIUS, capacity=INDEX_CAPACITY, bits=HASH_SIZE * HASH_SIZE,
+                 window=DUPLICATE_WINDOW):
+        """
+        Initialize the index.
+
+        Args:
+            radius: Largest Hamming distance reported as a duplicate
+            capacity: Number of hashes kept; the oldest are evicted
+            bits: Hash length in bits
+            window: Seconds after which a hash no longer counts as recent
+        """
+        self.radius = radius
+        self.capacity = capacity
+        self.window = window
+        bands = radius + 1
+        # Band boundaries as (shift, mask), covering all bits
+        edges = [round(i * bits / bands) for i in range(bands + 1)]
+        self._bands = [(edges[i], (1 << (edges[i + 1] - edges[i])) - 1) for i in range(bands)]
+        self._tables = [{} for _ in self._bands]
+        # key -> (hash, insertion number, time added), oldest first
+        self._hashes = OrderedDict()
+        self._added = 0
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __contains__(self, key):
+        return key in self._hashes
+
+    def _band_values(self, value):
+        return [(value >> shift) & mask for shift, mask in self._bands]
+
+    def _expire(self, now):
+        """
+        Evict the hashes added before the window.
+        """
+        while self._hashes:
+            key, (_, _, added_at) = next(iter(self._hashes.items()))
+            if now - added_at <= self.window:
+                break
+            self.remove(key)
+
+    def add(self, key, value, now=None):
+        """
+        Store the hash of a scan, replacing any earlier hash for the key.
+
+        Args:
+            key: Scan identifier
+            value: Hash from dhash
+            now: Time of the scan in seconds (default: time.time())
+        """
+        now = time.time() if now is None else now
+        self.remove(key)
+        self._added += 1
+        self._hashes[key] = (value, self._added, now)
+        for table, band in zip(self._tables, self._band_values(value)):
+            table.setdefault(band, set()).add(key)
+        while len(self._hashes) > self.capacity:
+            self.remove(next(iter(self._hashes)))
+        self._expire(now)
+
+    def remove(self, key):
+        """
+        Forget a scan, if it is indexed.
+        """
+        stored = self._hashes.pop(key, None)
+        if stored is None:
+            return
+        for table, band in zip(self._tables, self._band_values(stored[0])):
+            bucket = table[band]
+            bucket.discard(key)
+            if not bucket:
+                del table[band]
+
+    def clear(self):
+        """
+        Forget all scans.
+        """
+        self._hashes.clear()
+        for table in self._tables:
+            table.clear()
+
+    @timed("duplicate_lookup")
+    def find(self, value, radius=None, now=None):
+        """
+        Find the closest recent scan within the radius of a hash.
+
+        Args:
+            value: Hash from dhash
+            radius: Override the index radius (at most the index radius)
+            now: Current time in seconds (default: time.time())
+
+        Returns:
+            (key, distance) of the closest match added within the window,
+            the most recent one on ties, or None if there is none
+        """
+        radius = self.radius if radius is None else min(radius, self.radius)
+        self._expire(time.time() if now is None else now)
+        candidates = set()
+        for table, band in zip(self._tables, self._band_values(value)):
+            candidates.update(table.get(band, ()))
+
+        best, best_rank = None, None
+        for key in candidates:
+            stored, added, _ = self._hashes[key]
+            distance = hamming(stored, value)
+            # Closest first, then most recent
+            rank = (distance, -added)
+            if distance <= radius and (best_rank is None or rank < best_rank):
+                best, best_rank = (key, distance), rank
+        return best
@@ -1,47 +1,201 @@
-import cv2
+import contextvars
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
-import matplotlib.pyplot as plt
 from PIL import Image, ImageDraw, ImageFont
-from model_utils import generate_heatmap, analyze_tooth_color, enhance_dental_image
+from lazy_imports import lazy_module
+from instrumentation import timed
+from model_utils import generate_heatmap, analyze_tooth_color, enhance_dental_image, HEATMAP_MASKS
 
-def preprocess_image(image, target_size=(224, 224)):
+cv2 = lazy_module("cv2")
+
+# Downscale factors OpenCV can apply while decoding, largest first. For
+# JPEG the reduction happens in the DCT domain, so the full-size image is
+# never materialised.
+REDUCED_DECODE_FLAGS = {
+    8: "IMREAD_REDUCED_COLOR_8",
+    4: "IMREAD_REDUCED_COLOR_4",
+    2: "IMREAD_REDUCED_COLOR_2",
+}
+
+def encoded_image_size(data):
+    """
+    Read the dimensions of an encoded image from its header.
+    
+    Args:
+        data: Encoded image bytes
+        
+    Returns:
+        (width, height), or None if the header cannot be read
+    """
+    try:
+        # Image.open only parses the header; pixels are decoded lazily
+        with Image.open(io.BytesIO(data)) as header:
+            return header.size
+    except (OSError, ValueError):
+        return None
+
+def reduction_factor(image_size, min_size):
+    """
+    Pick the largest decode-time downscale factor that keeps an image at
+    least min_size in both dimensions.
+    
+    Args:
+        image_size: Full image size as (width, height)
+        min_size: Smallest acceptable size as (width, height)
+        
+    Returns:
+        1, 2, 4 or 8
+    """
+    width, height = image_size
+    min_width, min_height = min_size
+    for factor in REDUCED_DECODE_FLAGS:
+        if width // factor >= min_width and height // factor >= min_height:
+            return factor
+    return 1
+
+@timed("decode")
+def decode_image(data, min_size=None):
+    """
+    Decode image bytes, downscaling during decoding where possible.
+    
+    The bytes are wrapped without copying and the result is left in
+    OpenCV's BGR order; preprocess_image(..., channel_order="bgr") folds the
+    swap into its colour conversion instead of copying the full frame.
+    
+    Args:
+        data: Encoded image bytes (JPEG, PNG, ...)
+        min_size: Smallest acceptable result as (width, height), or None
+            to decode at full size
+        
+    Returns:
+        Image as a numpy array (BGR format), or None if decoding failed
+    """
+    buffer = np.frombuffer(data, np.uint8)
+    
+    flag = cv2.IMREAD_COLOR
+    if min_size is not None:
+        size = encoded_image_size(data)
+        factor = reduction_factor(size, min_size) if size is not None else 1
+        if factor > 1:
+            flag = getattr(cv2, REDUCED_DECODE_FLAGS[factor])
+    
+    return cv2.imdecode(buffer, flag)
+
+@timed("preprocess_image")
+def preprocess_image(image, target_size=(224, 224), channel_order="rgb"):
     """
     Preprocess the input image for the dental decay detection model.
 
     Args:
-        image: Input image as a numpy array (RGB format)
+        image: Input image as a numpy array
         target_size: Target size for model input (default: 224x224)
+        channel_order: "rgb", or "bgr" for images straight from
+            cv2.imdecode; the output is RGB either way
 
     Returns:
         Preprocessed image ready for model input
     """
     # Convert to RGB if needed
     if len(image.shape) == 3 and image.shape[2] == 3:
-        # Already in RGB format
+        # Already three channels; a BGR order is handled by the enhancement
         rgb_image = image
     else:
         # Convert to RGB
         rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        channel_order = "rgb"
     
     # Resize image to target size
     resized_image = cv2.resize(rgb_image, target_size, interpolation=cv2.INTER_AREA)
     
     # Basic preprocessing
     # Use our enhance_dental_image function from model_utils
-    enhanced_image = enhance_dental_image(resized_image)
+    enhanced_image = enhance_dental_image(resized_image, channel_order=channel_order)
     
-    # Normalize pixel values
-    normalized_image = enhanced_image.astype(np.float32) / 255.0
+    # Normalize pixel values in a single float32 allocation
+    normalized_image = np.divide(enhanced_image, np.float32(255.0), dtype=np.float32)
     
     return normalized_image
 
-def annotate_image(image, detection_results):
+def ingest_image(data, min_size=None, target_size=(224, 224), assess=None):
+    """
+    Decode and preprocess one uploaded image.
+    
+    Args:
+        data: Encoded image bytes
+        min_size: Smallest decoded size as (width, height), see decode_image
+        target_size: Model input size
+        assess: Optional quality check called as assess(image, channel_order)
+            before preprocessing, e.g. quality_gate.assess_quality; frames
+            it rejects are not preprocessed
+        
+    Returns:
+        (image, processed, quality) with the decoded image in RGB format,
+        the model input (None if the quality check rejected the frame) and
+        the quality report (None without a check), or None if the bytes
+        could not be decoded
+    """
+    image = decode_image(data, min_size=min_size)
+    if image is None:
+        return None
+    
+    quality = assess(image, "bgr") if assess is not None else None
+    processed = None
+    if quality is None or quality["passed"]:
+        processed = preprocess_image(image, target_size, channel_order="bgr")
+    cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+    return image, processed, quality
+
+def ingest_images(payloads, min_size=None, target_size=(224, 224), max_workers=None, on_progress=None,
+                  assess=None):
+    """
+    Decode and preprocess several uploaded images concurrently.
+    
+    OpenCV releases the GIL while decoding and converting, so a thread pool
+    keeps several cores busy without copying the bytes to other processes.
+    
+    Args:
+        payloads: List of encoded image bytes
+        min_size: Smallest decoded size as (width, height), see decode_image
+        target_size: Model input size
+        max_workers: Thread count (default: one per CPU, at most 8)
+        on_progress: Optional callback receiving the number of finished
+            images; it is called from the calling thread
+        assess: Optional quality check, see ingest_image
+        
+    Returns:
+        List in input order of ingest_image results (None for images that
+        could not be decoded)
+    """
+    if max_workers is None:
+        max_workers = min(8, os.cpu_count() or 1)
+    
+    results = [None] * len(payloads)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Run each task in a copy of the caller's context so stage timings
+        # still reach the active scan trace
+        futures = {
+            executor.submit(contextvars.copy_context().run, ingest_image, data, min_size, target_size, assess): index
+            for index, data in enumerate(payloads)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            if on_progress is not None:
+                on_progress(done)
+    
+    return results
+
+@timed("annotate_image")
+def annotate_image(image, detection_results, use_color_masks=True):
     """
     Annotate the input image with detection results.
 
     Args:
         image: Original input image
         detection_results: Dictionary containing detection results
+        use_color_masks: Derive heatmaps from the colour masks of
+            analyze_tooth_color instead of simulated random spots
 
     Returns:
         Annotated image with detection highlights
@@ -60,35 +214,26 @@ def annotate_image(image, detection_results):
     if not significant_issues:
         return image_copy
     
+    # One HSV conversion provides the heatmaps for every issue
+    masks = None
+    if use_color_masks:
+        masks = analyze_tooth_color(image_copy, return_masks=True)["masks"]
+    
     # Create a composite image with overlays for each issue
     result_image = image_copy.copy()
     
     # Process each issue type and overlay heatmaps
     for issue, confidence in significant_issues.items():
-        if issue == "Decay":
-            # Apply decay heatmap
-            overlay = generate_heatmap(image_copy, "decay")
-            # Blend with original based on confidence
-            alpha = confidence / 200  # Scale down to avoid too strong overlay
-            result_image = cv2.addWeighted(result_image, 1 - alpha, overlay, alpha, 0)
-            
-        elif issue == "Plaque":
-            # Apply plaque heatmap
-            overlay = generate_heatmap(image_copy, "plaque") 
-            alpha = confidence / 200
-            result_image = cv2.addWeighted(result_image, 1 - alpha, overlay, alpha, 0)
-            
-        elif issue == "Cavity":
-            # Apply cavity heatmap
-            overlay = generate_heatmap(image_copy, "cavity")
-            alpha = confidence / 200
-            result_image = cv2.addWeighted(result_image, 1 - alpha, overlay, alpha, 0)
-            
-        elif issue == "Gingivitis":
-            # Apply gingivitis heatmap
-            overlay = generate_heatmap(image_copy, "gingivitis")
-            alpha = confidence / 200
-            result_image = cv2.addWeighted(result_image, 1 - alpha, overlay, alpha, 0)
+        region_type = issue.lower()
+        if region_type not in HEATMAP_MASKS:
+            continue
+        
+        mask = masks[HEATMAP_MASKS[region_type]] if masks is not None else None
+        overlay = generate_heatmap(image_copy, region_type, mask=mask)
+        
+        # Blend with original based on confidence
+        alpha = confidence / 200  # Scale down to avoid too strong overlay
+        result_image = cv2.addWeighted(result_image, 1 - alpha, overlay, alpha, 0)
     
     # Convert to PIL for adding text labels
     pil_image = Image.fromarray(result_image)
@@ -105,18 +250,19 @@ def annotate_image(image, detection_results):
     # Convert back to numpy array
     return np.array(pil_image)
 
-def detect_teeth_region(image):
+def detect_teeth_region(image, fallback=True):
     """
     Attempt to detect the region containing teeth in the image.
     
     Args:
-        image: Input image as numpy array
+        image: Input image as numpy array (RGB or grayscale)
+        fallback: Return the central region when nothing is detected
         
     Returns:
         Coordinates of the region (x, y, w, h) or None if not detected
     """
     # Convert to grayscale
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if image.ndim == 3 else image
     
     # Apply histogram equalization
     gray = cv2.equalizeHist(gray)
@@ -140,6 +286,9 @@ def detect_teeth_region(image):
         x, y, w, h = cv2.boundingRect(largest_contour)
         return (x, y, w, h)
     
+    if not fallback:
+        return None
+    
     # If no suitable contour found, return the central region
     h, w = image.shape[:2]
     return (w//4, h//4, w//2, h//2)
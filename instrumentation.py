@@ -0,0 +1,368 @@
+import bisect
+import contextvars
+import functools
+import os
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_PREFIX = "dental"
+
+# Trace collecting the stage timings of the scan being processed, if any
+_current_trace = contextvars.ContextVar("dental_scan_trace", default=None)
+
+
+class _NoopStage:
+    """
+    Shared do-nothing context manager returned while timing is off.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_STAGE = _NoopStage()
+
+
+class Histogram:
+    """
+    Cumulative histogram in the Prometheus style.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class ScanTrace:
+    """
+    Stage timings of a single scan, in the order the stages finished.
+    """
+
+    def __init__(self):
+        self.stages = []
+        self.started = time.perf_counter()
+        # Peak Python/NumPy allocation during the scan, when traced
+        self.peak_bytes = None
+
+    def record(self, stage, seconds):
+        self.stages.append((stage, seconds))
+
+    def total_seconds(self):
+        return time.perf_counter() - self.started
+
+    def breakdown(self):
+        """
+        Get the stage timings in milliseconds, summing repeated stages.
+
+        Returns:
+            Dictionary mapping stage name to milliseconds
+        """
+        totals = {}
+        for stage, seconds in self.stages:
+            totals[stage] = totals.get(stage, 0.0) + seconds * 1000
+        return totals
+
+
+class _StageTimer:
+    """
+    Context manager timing one stage.
+    """
+
+    __slots__ = ("registry", "name", "trace", "start")
+
+    def __init__(self, registry, name, trace):
+        self.registry = registry
+        self.name = name
+        self.trace = trace
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        if self.registry.enabled:
+            self.registry.observe(self.name, elapsed)
+            if exc_type is not None:
+                self.registry.increment("stage_errors_total")
+        if self.trace is not None:
+            self.trace.record(self.name, elapsed)
+        return False
+
+
+class MetricsRegistry:
+    """
+    Process-wide stage histograms and counters.
+
+    When disabled (the default) and no scan trace is active, stage() hands
+    out a shared no-op context manager, so instrumented code pays only a
+    couple of attribute lookups.
+    """
+
+    def __init__(self, enabled=False, buckets=DEFAULT_BUCKETS):
+        """
+        Initialize the registry.
+
+        Args:
+            enabled: Collect process-wide metrics
+            buckets: Histogram bucket upper bounds in seconds
+        """
+        self.enabled = enabled
+        self.buckets = buckets
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        """
+        Time a pipeline stage.
+
+        Usage:
+            with metrics.stage("detect"):
+                results = detector.detect(image)
+
+        Args:
+            name: Stage name, used as the "stage" label
+
+        Returns:
+            Context manager
+        """
+        trace = _current_trace.get()
+        if not self.enabled and trace is None:
+            return _NOOP_STAGE
+        return _StageTimer(self, name, trace)
+
+    def observe(self, stage, seconds):
+        """
+        Record a stage duration.
+        """
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def increment(self, name, value=1):
+        """
+        Increase a counter.
+
+        Args:
+            name: Counter name, conventionally ending in _total
+            value: Amount to add
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render_prometheus(self):
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            Metrics text
+        """
+        with self._lock:
+            histograms = {
+                stage: (h.buckets, list(h.counts), h.sum, h.count)
+                for stage, h in self._histograms.items()
+            }
+            counters = dict(self._counters)
+
+        name = f"{METRIC_PREFIX}_stage_duration_seconds"
+        lines = [
+            f"# HELP {name} Time spent in each scan pipeline stage.",
+            f"# TYPE {name} histogram",
+        ]
+        for stage in sorted(histograms):
+            buckets, counts, total, count = histograms[stage]
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+
+        for counter in sorted(counters):
+            lines.append(f"# TYPE {METRIC_PREFIX}_{counter} counter")
+            lines.append(f"{METRIC_PREFIX}_{counter} {counters[counter]}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """
+        Write the metrics to a file atomically (for node_exporter's
+        textfile collector or similar).
+        """
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+
+
+metrics = MetricsRegistry(enabled=os.environ.get("DENTAL_METRICS", "").lower() in ("1", "true", "yes"))
+
+
+def stage(name):
+    """
+    Time a pipeline stage with the global registry.
+    """
+    return metrics.stage(name)
+
+
+def timed(name):
+    """
+    Decorator timing every call of a function as a pipeline stage.
+
+    Args:
+        name: Stage name
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled and _current_trace.get() is None:
+                return func(*args, **kwargs)
+            with metrics.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class trace_scan:
+    """
+    Collect the stage timings of one scan, whether or not process-wide
+    metrics are enabled.
+
+    With memory=True the peak allocation during the scan is recorded too,
+    using tracemalloc (which sees NumPy and OpenCV output arrays, but not
+    the decoders' internal buffers). Tracing is process-wide and slows
+    allocation-heavy code, so a scan never starts, resets or stops it:
+    the peak is only measured when the process is already tracing
+    (DENTAL_TRACE_MEMORY=1 or PYTHONTRACEMALLOC), and only when the
+    process peak rose during the scan. Other sessions' allocations in the
+    meantime are included.
+
+    Usage:
+        with trace_scan(memory=True) as trace:
+            ...
+        trace.breakdown(), trace.peak_bytes
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self._traced = None
+
+    def __enter__(self):
+        self.trace = ScanTrace()
+        # (current, peak) at the start, when the process is tracing
+        self._traced = tracemalloc.get_traced_memory() if self.memory and tracemalloc.is_tracing() else None
+        self._token = _current_trace.set(self.trace)
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_trace.reset(self._token)
+        if self._traced is not None and tracemalloc.is_tracing():
+            baseline, peak_before = self._traced
+            peak = tracemalloc.get_traced_memory()[1]
+            if peak > peak_before:
+                self.trace.peak_bytes = peak - baseline
+        return False
+
+
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """
+    Serve the metrics at http://host:port/metrics in a background thread.
+
+    Returns:
+        The running ThreadingHTTPServer
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            data = metrics.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+def start_file_exporter(path, interval=15.0):
+    """
+    Write the metrics to a file every interval seconds in a background thread.
+    """
+
+    def export_loop():
+        while True:
+            try:
+                metrics.write_prometheus(path)
+            except OSError as e:
+                print(f"Metrics export failed: {e}")
+            time.sleep(interval)
+
+    threading.Thread(target=export_loop, name="metrics-exporter", daemon=True).start()
+
+
+def configure_from_environment():
+    """
+    Start the exporters requested through environment variables, once per
+    process. Exporters imply DENTAL_METRICS=1.
+
+        DENTAL_METRICS_PORT: serve /metrics on this local port
+        DENTAL_METRICS_FILE: write the metrics to this file periodically
+        DENTAL_TRACE_MEMORY: trace allocations (tracemalloc) for the whole
+            process, so traced scans report their peak memory
+    """
+    global _exporters_started
+
+    with _exporters_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+
+        port = os.environ.get("DENTAL_METRICS_PORT")
+        path = os.environ.get("DENTAL_METRICS_FILE")
+        if port or path:
+            metrics.enabled = True
+        if port:
+            start_metrics_server(int(port))
+        if path:
+            start_file_exporter(path)
+        if os.environ.get("DENTAL_TRACE_MEMORY", "").lower() in ("1", "true", "yes") and not tracemalloc.is_tracing():
+            tracemalloc.start()
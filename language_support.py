@@ -1,180 +1,206 @@
+import json
+import marshal
+import os
+import sys
+import threading
+from types import MappingProxyType
+
+# Directory holding one <language>.json translation catalog per language
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "locales")
+
+# Subdirectory of LOCALES_DIR for the compiled (marshal) catalogs
+COMPILED_DIR = "__compiled__"
+
+
+class _CompiledTable(dict):
+    """
+    Flat translation table for one language, already merged with English.
+    Missing keys translate to themselves.
+    """
+    
+    def __missing__(self, key):
+        return key
+
+
+class BoundTranslator:
+    """
+    Translation lookup bound to a single language.
+    
+    Bound translators are immutable and hold no reference to the service's
+    current language, so one can be kept per session and shared across
+    threads without locking.
+    """
+    
+    __slots__ = ("language", "table")
+    
+    def __init__(self, language, table):
+        """
+        Initialize the bound translator.
+        
+        Args:
+            language: Language the table was compiled for
+            table: Read-only compiled translation table
+        """
+        self.language = language
+        self.table = table
+    
+    def __call__(self, key):
+        """
+        Translate a key; a single dict access.
+        """
+        return self.table[key]
+    
+    translate = __call__
+
+
 class TranslationService:
     """
     A simple translation service for the Dental Decay Detector.
     Provides multi-language support for key messages and UI elements.
+    
+    Translations live in one JSON catalog per language under locales/ and
+    are only loaded the first time a language is used. A marshal copy of
+    each catalog is kept under locales/__compiled__/ for fast reloading.
     """
     
-    def __init__(self, default_language="english"):
+    def __init__(self, default_language="english", catalog_dir=LOCALES_DIR):
         """
         Initialize the translation service with a default language.
         
         Args:
             default_language: The default language to use
+            catalog_dir: Directory containing <language>.json catalogs
         """
         self.current_language = default_language
         self.supported_languages = ["english", "spanish", "french", "chinese", "arabic"]
-        self.translations = self._load_translations()
+        self.catalog_dir = catalog_dir
+        self.translations = {}
+        self.compiled = {}
+        self._bound = {}
+        self._lock = threading.Lock()
+    
+    def _catalog_path(self, language):
+        return os.path.join(self.catalog_dir, f"{language}.json")
+    
+    def _compiled_path(self, language):
+        return os.path.join(self.catalog_dir, COMPILED_DIR, f"{language}.marshal")
     
-    def _load_translations(self):
+    def _load_catalog(self, language):
         """
-        Load translations for all supported languages.
+        Load the translations for one language from disk.
         
-        Returns:
-            Dictionary of translations for each language
-        """
-        # Define translations for various elements of the app
-        return {
-            "english": {
-                # App title and welcome messages
-                "app_title": "Dental Decay Detector",
-                "app_description": "Take a picture of your teeth with your mobile camera to detect potential dental issues.",
-                "app_subtitle": "This app uses image analysis to identify common dental problems like decay, cavities, and plaque.",
-                
-                # Tab names
-                "tab_scan": "Scan Teeth",
-                "tab_results": "Results",
-                "tab_history": "History",
-                "tab_report": "My Report",
-                
-                # Scan tab
-                "scan_header": "Take a Photo of Your Teeth",
-                "instructions_title": "Instructions:",
-                "instruction_1": "Position your camera to get a clear view of your teeth",
-                "instruction_2": "Ensure good lighting for best results",
-                "instruction_3": "Try to keep your mouth open wide enough to see the teeth clearly",
-                "camera_options": "Camera Options:",
-                "turn_on_camera": "Turn On Camera",
-                "use_last_image": "Use Last Image",
-                "take_picture": "Take a picture of your teeth",
-                "last_captured": "Last captured image",
-                "no_image": "No image captured yet. Turn on the camera to take a picture.",
-                "turn_off_camera": "Turn Off Camera",
-                "analyze_image": "Analyze Image",
-                "analyzing": "Analyzing your dental image...",
-                "analysis_complete": "Analysis complete! Go to the Results tab to see details.",
-                "model_error": "Model not loaded properly. Please refresh the page and try again.",
-                
-                # Results tab
-                "results_header": "Analysis Results",
-                "no_results": "No analysis results yet. Please take a photo in the Scan tab first.",
-                "detected_issues": "Detected Issues",
-                "issue_column": "Issue",
-                "confidence_column": "Confidence",
-                "status_column": "Status",
-                "attention_needed": "⚠️ Attention needed",
-                "likely_healthy": "✅ Likely healthy",
-                "health_assessment": "Overall Dental Health Assessment",
-                "health_good": "Your dental health appears to be good. Keep up with regular dental hygiene.",
-                "health_minor": "Some minor issues detected. Consider scheduling a dental checkup.",
-                "health_significant": "Significant dental issues detected. We recommend consulting a dentist soon.",
-                "annotated_image": "Annotated Image",
-                "recommendations": "Recommendations",
-                "decay_detected": "Dental Decay Detected",
-                "plaque_detected": "Plaque Buildup Detected",
-                "cavity_detected": "Possible Cavity Detected",
-                "visit_dentist": "Visit your dentist for a professional assessment",
-                "improve_brushing": "Improve brushing technique, focusing on all tooth surfaces",
-                "use_fluoride": "Consider using fluoride toothpaste and mouthwash",
-                "brush_frequently": "Increase brushing frequency to at least twice daily",
-                "floss_daily": "Start using dental floss daily if you don't already",
-                "use_mouthwash": "Consider using an antibacterial mouthwash",
-                "schedule_appointment": "Schedule a dental appointment soon",
-                "avoid_sugar": "Avoid sugary foods and drinks",
-                "maintain_hygiene": "Maintain thorough oral hygiene while waiting for your appointment",
-                "regular_brushing": "Maintain regular brushing (2 minutes, twice daily)",
-                "continue_flossing": "Continue flossing daily",
-                "regular_checkups": "Schedule regular dental checkups twice a year",
-                "disclaimer": "Note: This app provides preliminary analysis only and is not a substitute for professional dental care.",
-                
-                # History tab
-                "history_header": "Scan History",
-                "no_history": "No scan history available yet. Complete a scan to record your history.",
-                "scan_from": "Scan from",
-                "captured_image": "Captured Image",
-                "clear_history": "Clear History",
-                "history_cleared": "History cleared successfully!",
-                
-                # 3D Visualization
-                "tooth_model": "3D Tooth Model",
-                "visualization": "Interactive 3D Visualization",
-                "rotate_model": "Drag to rotate the model",
-                "decay_area": "Decay Area",
-                
-                # Report tab
-                "report_header": "Your Dental Health Report",
-                "health_score": "Dental Health Score",
-                "excellent": "Excellent",
-                "good": "Good",
-                "fair": "Fair",
-                "needs_attention": "Needs Attention",
-                "trend_chart": "Health Trend Chart",
-                "not_enough_data": "Not enough data to generate trend chart. Complete at least two scans.",
-                "personalized_recommendations": "Personalized Recommendations",
-                "next_checkup": "Recommended Next Checkup",
-                "checkup_urgent": "Urgent (within 2 weeks)",
-                "checkup_soon": "Soon (within 3 months)",
-                "checkup_regular": "Regular (within 6 months)",
-                "download_report": "Download Full Report",
-                "email_report": "Email Report",
-                "share_doctor": "Share with Doctor",
-                
-                # Settings
-                "settings": "Settings",
-                "language": "Language",
-                "notifications": "Checkup Reminders",
-                "enable_reminders": "Enable Reminders",
-                "reminder_frequency": "Reminder Frequency",
-                "save_settings": "Save Settings",
-            },
+        The marshal copy is used when it matches the JSON catalog's size and
+        modification time; otherwise the JSON is parsed and the copy rebuilt.
+        
+        Args:
+            language: Language to load
             
-            "spanish": {
-                # App title and welcome messages
-                "app_title": "Detector de Caries Dental",
-                "app_description": "Toma una foto de tus dientes con la cámara de tu móvil para detectar posibles problemas dentales.",
-                "app_subtitle": "Esta aplicación utiliza análisis de imágenes para identificar problemas dentales comunes como caries, cavidades y placa.",
-                
-                # Tab names
-                "tab_scan": "Escanear Dientes",
-                "tab_results": "Resultados",
-                "tab_history": "Historial",
-                "tab_report": "Mi Informe",
-                
-                # Scan tab
-                "scan_header": "Toma una Foto de tus Dientes",
-                "instructions_title": "Instrucciones:",
-                "instruction_1": "Posiciona tu cámara para obtener una vista clara de tus dientes",
-                "instruction_2": "Asegúrate de tener buena iluminación para mejores resultados",
-                "instruction_3": "Intenta mantener tu boca lo suficientemente abierta para ver los dientes claramente",
-                "camera_options": "Opciones de Cámara:",
-                "turn_on_camera": "Encender Cámara",
-                "use_last_image": "Usar Última Imagen",
-                "take_picture": "Toma una foto de tus dientes",
-                "last_captured": "Última imagen capturada",
-                "no_image": "Aún no hay imagen capturada. Enciende la cámara para tomar una foto.",
-                "turn_off_camera": "Apagar Cámara",
-                "analyze_image": "Analizar Imagen",
-                "analyzing": "Analizando tu imagen dental...",
-                "analysis_complete": "¡Análisis completo! Ve a la pestaña de Resultados para ver los detalles.",
-                "model_error": "El modelo no se cargó correctamente. Por favor, actualiza la página e inténtalo de nuevo.",
-                
-                # Results tab - other translations omitted for brevity
-                "results_header": "Resultados del Análisis",
-                "no_results": "Aún no hay resultados de análisis. Por favor, toma una foto en la pestaña Escanear primero.",
-                
-                # more translations would be added here...
-            },
+        Returns:
+            Dictionary of translations (empty if the language has no catalog)
+        """
+        path = self._catalog_path(language)
+        try:
+            source = os.stat(path)
+        except FileNotFoundError:
+            return {}
+        signature = (source.st_mtime_ns, source.st_size)
+        
+        compiled_path = self._compiled_path(language)
+        try:
+            with open(compiled_path, "rb") as f:
+                cached_signature, table = marshal.load(f)
+            if tuple(cached_signature) == signature:
+                return table
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+        
+        with open(path, encoding="utf-8") as f:
+            table = json.load(f)
+        
+        # The compiled copy is only an optimisation, so failing to write
+        # it (e.g. on a read-only filesystem) is not an error
+        try:
+            os.makedirs(os.path.dirname(compiled_path), exist_ok=True)
+            tmp_path = f"{compiled_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                marshal.dump((signature, table), f)
+            os.replace(tmp_path, compiled_path)
+        except OSError:
+            pass
+        
+        return table
+    
+    def _get_translations(self, language):
+        """
+        Get the raw translations for a language, loading them on first use.
+        """
+        table = self.translations.get(language)
+        if table is None:
+            table = self._load_catalog(language)
+            self.translations[language] = table
+        return table
+    
+    def _compile_language(self, language):
+        """
+        Merge one language with its English fallbacks into a flat table.
+        
+        Args:
+            language: Language to compile
             
-            "french": {
-                # App title and welcome messages
-                "app_title": "Détecteur de Caries Dentaires",
-                "app_description": "Prenez une photo de vos dents avec votre caméra mobile pour détecter d'éventuels problèmes dentaires.",
-                "app_subtitle": "Cette application utilise l'analyse d'image pour identifier les problèmes dentaires courants comme les caries, les cavités et la plaque dentaire.",
-                
-                # Other French translations would be added here...
-            },
+        Returns:
+            Read-only translation table
+        """
+        table = _CompiledTable(self._get_translations("english"))
+        if language != "english":
+            table.update(self._get_translations(language))
+        return MappingProxyType(table)
+    
+    def bind(self, language):
+        """
+        Get a translator bound to one language, for per-session use.
+        
+        The language is loaded and compiled on first use; later calls
+        return the cached translator without locking.
+        
+        Args:
+            language: The language to use (falls back to English)
             
-            # Other languages would be implemented similarly
-        }
+        Returns:
+            BoundTranslator for the language
+        """
+        if language not in self.supported_languages:
+            language = "english"
+        
+        bound = self._bound.get(language)
+        if bound is None:
+            with self._lock:
+                bound = self._bound.get(language)
+                if bound is None:
+                    table = self._compile_language(language)
+                    self.compiled[language] = table
+                    bound = BoundTranslator(language, table)
+                    self._bound[language] = bound
+        return bound
+    
+    def validate_catalogs(self):
+        """
+        Compare every language's catalog against the English one.
+        
+        Returns:
+            Dictionary mapping each supported language to its "missing"
+            keys (present in English only) and "unknown" keys (absent
+            from English)
+        """
+        english = self._load_catalog("english")
+        
+        report = {}
+        for language in self.supported_languages:
+            table = self._load_catalog(language)
+            report[language] = {
+                "missing": [key for key in english if key not in table],
+                "unknown": [key for key in table if key not in english]
+            }
+        return report
     
     def set_language(self, language):
         """
@@ -208,16 +234,35 @@ class TranslationService:
         Returns:
             Translated text or the key itself if translation not found
         """
-        # Get translations for current language
-        lang_dict = self.translations.get(self.current_language, {})
-        
-        # Return translation or fallback to English or the key itself
-        if key in lang_dict:
-            return lang_dict[key]
-        elif key in self.translations.get("english", {}):
-            return self.translations["english"][key]
-        else:
-            return key
+        return self.bind(self.current_language)(key)
 
 # Create a global instance for use throughout the app
-translator = TranslationService()
\ No newline at end of file
+translator = TranslationService()
+
+
+def main(argv=None):
+    """
+    Report missing translation keys for each language.
+    
+    Usage: python language_support.py [--strict]
+    
+    With --strict the exit status is 1 when any key is missing.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    report = translator.validate_catalogs()
+    
+    total_missing = 0
+    for language, result in report.items():
+        missing, unknown = result["missing"], result["unknown"]
+        total_missing += len(missing)
+        print(f"{language}: {len(missing)} missing, {len(unknown)} unknown")
+        for key in missing:
+            print(f"    missing: {key}")
+        for key in unknown:
+            print(f"    unknown: {key}")
+    
+    return 1 if "--strict" in argv and total_missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+import importlib
+import sys
+import threading
+
+_import_lock = threading.Lock()
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access.
+
+    Heavy libraries (matplotlib, pandas, OpenCV, ...) cost hundreds of
+    milliseconds to import. Deferring them keeps app start-up fast and
+    only charges the cost to the first code path that needs them.
+    """
+
+    def __init__(self, name):
+        """
+        Initialize the lazy module.
+
+        Args:
+            name: Fully qualified module name, e.g. "matplotlib.pyplot"
+        """
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_module", None)
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            with _import_lock:
+                module = self._module
+                if module is None:
+                    module = importlib.import_module(self._name)
+                    object.__setattr__(self, "_module", module)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_module(name):
+    """
+    Get a module, deferring the import until it is first used.
+
+    Args:
+        name: Fully qualified module name
+
+    Returns:
+        The module itself if it is already imported, otherwise a LazyModule
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
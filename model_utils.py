@@ -1,15 +1,33 @@
 import os
 import numpy as np
-import cv2
-import matplotlib.pyplot as plt
+from lazy_imports import lazy_module
 
-def generate_heatmap(image, region_type="decay"):
+cv2 = lazy_module("cv2")
+
+# Resolution (width, height) at which colour masks are kept for heatmaps
+HEATMAP_SIZE = (64, 64)
+
+# Box blur kernel applied to the low resolution masks
+HEATMAP_BLUR = (5, 5)
+
+# Which colour mask drives the heatmap of each issue type
+HEATMAP_MASKS = {
+    "decay": "dark",
+    "plaque": "yellow",
+    "cavity": "dark",
+    "gingivitis": "red"
+}
+
+def generate_heatmap(image, region_type="decay", mask=None):
     """
     Generate a simple heatmap visualization for dental issues.
     
     Args:
         image: Input image
         region_type: Type of dental issue to visualize
+        mask: Optional low resolution heatmap (values 0-1) from
+            analyze_tooth_color(image, return_masks=True). When given it
+            is used instead of the simulated random spots.
         
     Returns:
         Image with overlay heatmap
@@ -26,7 +44,12 @@ def generate_heatmap(image, region_type="decay"):
     # Different regions for different issues
     h, w = image.shape[:2]
     
-    if region_type == "decay":
+    if mask is not None:
+        # Upscale the smoothed colour mask to the image size
+        heatmap = cv2.resize(mask.astype(np.float32), (w, h), interpolation=cv2.INTER_LINEAR)
+        heatmap = np.clip(heatmap, 0, 1)
+    
+    elif region_type == "decay":
         # Simulate decay in certain areas (e.g., centers of teeth)
         cx, cy = w // 2, h // 2
         for i in range(3):
@@ -76,6 +99,7 @@ def generate_heatmap(image, region_type="decay"):
         # Create a band along the center
         y_indices, x_indices = np.ogrid[:h, :w]
         mask = (y_indices > gum_y - thickness//2) & (y_indices < gum_y + thickness//2)
+        mask = np.broadcast_to(mask, (h, w))
         
         # Add some randomness to the intensity
         heatmap[mask] = np.random.uniform(0.5, 1.0, size=(np.sum(mask),))
@@ -101,12 +125,59 @@ def generate_heatmap(image, region_type="decay"):
     # Superimpose heatmap on original image
     return cv2.addWeighted(img_rgb, 0.7, heatmap_colored, 0.3, 0)
 
-def analyze_tooth_color(image):
+def compute_color_masks(hsv):
+    """
+    Compute the colour masks used to flag potential dental issues.
+    
+    Args:
+        hsv: Image in HSV color space (uint8, OpenCV ranges)
+        
+    Returns:
+        Dictionary of boolean masks for yellow, dark and red areas
+    """
+    h, s, v = cv2.split(hsv)
+    
+    return {
+        # Yellow tint (potential plaque/tartar), hue around 20-40
+        "yellow": (h > 20) & (h < 40) & (s > 100),
+        # Dark spots (potential cavities)
+        "dark": v < 80,
+        # Redness (potential gingivitis), hue around 0-10 or 170-180
+        "red": ((h < 10) | (h > 170)) & (s > 100)
+    }
+
+def smooth_mask(mask, size=HEATMAP_SIZE, blur=HEATMAP_BLUR):
+    """
+    Reduce a full resolution mask to a smooth low resolution heatmap.
+    
+    Args:
+        mask: Boolean mask
+        size: Output size as (width, height)
+        blur: Box blur kernel size
+        
+    Returns:
+        Float32 heatmap with values scaled to 0-1
+    """
+    # Area interpolation averages the mask over each output cell
+    small = cv2.resize(mask.astype(np.float32), size, interpolation=cv2.INTER_AREA)
+    small = cv2.blur(small, blur)
+    
+    # Scale so the strongest area is fully highlighted
+    peak = small.max()
+    if peak > 0:
+        small /= peak
+    
+    return small
+
+def analyze_tooth_color(image, return_masks=False, mask_size=HEATMAP_SIZE):
     """
     Analyze the color distribution in the image to identify potential dental issues.
     
     Args:
         image: Input image
+        return_masks: Also return smoothed low resolution masks under
+            the "masks" key, usable as heatmaps for generate_heatmap
+        mask_size: Size (width, height) of the returned masks
         
     Returns:
         Dictionary with tooth color analysis results
@@ -114,47 +185,39 @@ def analyze_tooth_color(image):
     # Convert to HSV for better color analysis
     hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
     
-    # Extract channels
-    h, s, v = cv2.split(hsv)
-    
     # Calculate statistics
-    avg_hue = np.mean(h)
-    avg_saturation = np.mean(s)
-    avg_value = np.mean(v)
-    
-    # Detect yellow tint (potential plaque/tartar)
-    # Yellow in HSV has hue values around 20-40
-    yellow_mask = ((h > 20) & (h < 40) & (s > 100))
-    yellow_ratio = np.sum(yellow_mask) / (image.shape[0] * image.shape[1])
+    avg_value = np.mean(hsv[:, :, 2])
     
-    # Detect dark spots (potential cavities)
-    dark_mask = (v < 80)
-    dark_ratio = np.sum(dark_mask) / (image.shape[0] * image.shape[1])
+    masks = compute_color_masks(hsv)
+    num_pixels = image.shape[0] * image.shape[1]
     
-    # Detect redness (potential gingivitis)
-    # Red in HSV has hue values around 0-10 or 170-180
-    red_mask = (((h < 10) | (h > 170)) & (s > 100))
-    red_ratio = np.sum(red_mask) / (image.shape[0] * image.shape[1])
-    
-    return {
-        "yellow_ratio": yellow_ratio,
-        "dark_ratio": dark_ratio,
-        "red_ratio": red_ratio,
+    analysis = {
+        "yellow_ratio": np.count_nonzero(masks["yellow"]) / num_pixels,
+        "dark_ratio": np.count_nonzero(masks["dark"]) / num_pixels,
+        "red_ratio": np.count_nonzero(masks["red"]) / num_pixels,
         "avg_brightness": avg_value
     }
+    
+    if return_masks:
+        analysis["masks"] = {name: smooth_mask(mask, mask_size) for name, mask in masks.items()}
+    
+    return analysis
 
-def enhance_dental_image(image):
+def enhance_dental_image(image, channel_order="rgb"):
     """
     Enhance a dental image for better visibility.
     
     Args:
         image: Input image
+        channel_order: "rgb", or "bgr" to convert from OpenCV's channel
+            order as part of the LAB conversion
         
     Returns:
-        Enhanced image
+        Enhanced image (RGB format)
     """
     # Convert to LAB color space
-    lab = cv2.cvtColor(image, cv2.COLOR_RGB2LAB)
+    to_lab = cv2.COLOR_BGR2LAB if channel_order == "bgr" else cv2.COLOR_RGB2LAB
+    lab = cv2.cvtColor(image, to_lab)
     
     # Split channels
     l, a, b = cv2.split(lab)
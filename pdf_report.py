@@ -0,0 +1,368 @@
+import io
+import json
+import os
+import sys
+import textwrap
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from lazy_imports import lazy_module
+from language_support import translator
+from instrumentation import timed
+from dental_report import (
+    generate_health_score, calculate_next_checkup, select_recommendations,
+    recommendation_text, trend_series, URGENCY_COLORS
+)
+from tooth_snapshot import render_tooth_snapshot
+
+cv2 = lazy_module("cv2")
+mpl_figure = lazy_module("matplotlib.figure")
+mpl_patches = lazy_module("matplotlib.patches")
+backend_pdf = lazy_module("matplotlib.backends.backend_pdf")
+
+# A4 portrait, in inches
+PAGE_SIZE = (8.27, 11.69)
+
+# Size of the tooth snapshot, (width, height) in pixels
+PDF_SNAPSHOT_SIZE = (360, 360)
+
+# Characters per line of wrapped report text
+WRAP_WIDTH = 90
+
+
+def _plain(text):
+    """
+    Drop emoji and other symbols the PDF fonts cannot draw.
+    """
+    return "".join(
+        c for c in text if unicodedata.category(c) != "So" and c != "\ufe0f"
+    ).strip()
+
+
+def _new_page():
+    """
+    Create a standalone A4 figure.
+
+    Figures are created without pyplot, whose global state is not safe to
+    share between the worker threads and the Streamlit script thread.
+    """
+    return mpl_figure.Figure(figsize=PAGE_SIZE)
+
+
+def _summary_page(report):
+    """
+    Draw the first page: score, next checkup, findings and recommendations.
+    """
+    t = translator.bind(report["language"])
+    results = report["results"]
+
+    fig = _new_page()
+    fig.text(0.08, 0.95, t("report_title"), fontsize=22, weight="bold")
+    subtitle = f"{report['timestamp']}    {t('scan_label')} {report['scan_id']}"
+    if report.get("patient_name"):
+        subtitle = f"{report['patient_name']}    {subtitle}"
+    fig.text(0.08, 0.925, subtitle, fontsize=10, color="#555555")
+
+    # Health score box
+    score, status, color = generate_health_score(results)
+    if score is not None:
+        fig.add_artist(mpl_patches.Rectangle((0.08, 0.79), 0.38, 0.115, transform=fig.transFigure, color=color))
+        fig.text(0.27, 0.88, t("health_score"), ha="center", color="white", fontsize=12)
+        fig.text(0.27, 0.835, f"{score}", ha="center", color="white", fontsize=26, weight="bold")
+        fig.text(0.27, 0.805, status, ha="center", color="white", fontsize=12)
+
+    # Next checkup
+    next_date, urgency = calculate_next_checkup(results)
+    fig.text(0.54, 0.875, t("next_checkup"), fontsize=12, weight="bold")
+    fig.text(0.54, 0.85, next_date.strftime("%B %d, %Y"), fontsize=12)
+    fig.text(0.54, 0.825, t("checkup_priority").format(urgency=t(f"checkup_{urgency.lower()}")), fontsize=11)
+
+    # Findings table
+    fig.text(0.08, 0.76, t("detected_issues"), fontsize=14, weight="bold")
+    y = 0.735
+    fig.text(0.08, y, t("issue_column"), fontsize=10, weight="bold")
+    fig.text(0.35, y, t("confidence_column"), fontsize=10, weight="bold")
+    fig.text(0.55, y, t("status_column"), fontsize=10, weight="bold")
+    for issue, confidence in results.items():
+        y -= 0.022
+        fig.text(0.08, y, issue, fontsize=10)
+        fig.text(0.35, y, f"{confidence:.1f}%", fontsize=10)
+        fig.text(0.55, y, _plain(t("attention_needed") if confidence > 50 else t("likely_healthy")), fontsize=10)
+
+    # Recommendations
+    y -= 0.045
+    fig.text(0.08, y, t("recommendations"), fontsize=14, weight="bold")
+    for rule_id in select_recommendations(results):
+        texts = recommendation_text(rule_id, report["language"])
+        y -= 0.03
+        fig.text(0.08, y, texts["title"], fontsize=11, weight="bold", color=URGENCY_COLORS[texts["urgency"]])
+        for line in textwrap.wrap(texts["description"], WRAP_WIDTH):
+            y -= 0.02
+            fig.text(0.08, y, line, fontsize=9)
+        for action in texts["actions"]:
+            for n, line in enumerate(textwrap.wrap(action, WRAP_WIDTH - 4)):
+                y -= 0.018
+                fig.text(0.1, y, ("• " if n == 0 else "  ") + line, fontsize=9)
+
+    return fig
+
+
+def _draw_trend(ax, history, t):
+    """
+    Draw the health trend on an axes (the create_trend_chart layout).
+    """
+    dates, scores = trend_series(history)
+    ax.plot(dates, scores, marker="o", linestyle="-", color="#3498db")
+    ax.axhline(y=70, color="#f39c12", linestyle="--", alpha=0.7)
+    ax.axhline(y=85, color="#2ecc71", linestyle="--", alpha=0.7)
+    ax.set_ylabel(t("health_score"))
+    ax.set_title(t("trend_title"))
+    ax.set_ylim(0, 100)
+    ax.grid(axis="y", alpha=0.3)
+    ax.tick_params(axis="x", labelrotation=30, labelsize=8)
+
+
+def _draw_tooth_snapshot(ax, decay_areas, t):
+    """
+    Draw a still of the 3D tooth model, rendered by tooth_snapshot.
+    """
+    ax.imshow(render_tooth_snapshot(decay_areas, PDF_SNAPSHOT_SIZE))
+    ax.set_axis_off()
+    ax.set_title(t("tooth_model"))
+
+
+def _images_page(report):
+    """
+    Draw the second page: trend chart, annotated image and tooth snapshot.
+    """
+    # Imported here: image_processing pulls in the drawing code only
+    # needed for this page
+    from image_processing import annotate_image
+
+    t = translator.bind(report["language"])
+    fig = _new_page()
+
+    history = report.get("history") or []
+    if len(history) >= 2:
+        _draw_trend(fig.add_axes((0.1, 0.7, 0.82, 0.24)), history, t)
+    else:
+        fig.text(0.5, 0.82, t("not_enough_data"), ha="center", fontsize=10, color="#555555")
+
+    if report.get("image") is not None:
+        ax = fig.add_axes((0.05, 0.2, 0.45, 0.42))
+        ax.imshow(annotate_image(report["image"], report["results"]))
+        ax.set_title(t("annotated_image"))
+        ax.set_axis_off()
+
+    _draw_tooth_snapshot(fig.add_axes((0.52, 0.2, 0.45, 0.42)), report.get("decay_areas") or [], t)
+    return fig
+
+
+@timed("render_pdf_report")
+def render_pdf_report(report):
+    """
+    Render a dental health report as a PDF.
+
+    Args:
+        report: Dictionary with "scan_id", "language", "timestamp",
+            "results", and optionally "patient_name", "history" (entries
+            with timestamp and results), "image" (RGB array) and
+            "decay_areas"
+
+    Returns:
+        PDF file contents as bytes
+    """
+    buffer = io.BytesIO()
+    with backend_pdf.PdfPages(buffer) as pdf:
+        for page in (_summary_page, _images_page):
+            pdf.savefig(page(report))
+        info = pdf.infodict()
+        info["Title"] = f"{translator.bind(report['language'])('report_title')} {report['scan_id']}"
+        info["CreationDate"] = datetime.now()
+    return buffer.getvalue()
+
+
+class ReportRenderer:
+    """
+    Renders PDF reports in a background thread pool and caches them.
+
+    Reports are keyed by scan id and language: a scan's report never
+    changes, so repeated downloads are served from the cache, and requests
+    for a report that is still rendering share the pending result.
+    """
+
+    def __init__(self, max_workers=2, cache_size=32):
+        """
+        Initialize the renderer.
+
+        Args:
+            max_workers: Reports rendered at the same time
+            cache_size: Finished reports kept in memory
+        """
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+        self._executor = None
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get(self, scan_id, language):
+        """
+        Get a finished report from the cache.
+
+        Returns:
+            PDF bytes, or None if the report has not been rendered
+        """
+        with self._lock:
+            data = self._cache.get((scan_id, language))
+            if data is not None:
+                self._cache.move_to_end((scan_id, language))
+            return data
+
+    def submit(self, scan_id, language, build_report):
+        """
+        Start rendering a report unless it is cached or already rendering.
+
+        Args:
+            scan_id: Id of the scan the report is for
+            language: Report language
+            build_report: Callable returning the report dictionary for
+                render_pdf_report; it runs on the calling thread, and only
+                when the report has to be rendered
+
+        Returns:
+            Future resolving to the PDF bytes
+        """
+        key = (scan_id, language)
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+                future = Future()
+                future.set_result(data)
+                return future
+            if key in self._pending:
+                return self._pending[key]
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="pdf-report")
+            future = self._executor.submit(render_pdf_report, build_report())
+            self._pending[key] = future
+
+        future.add_done_callback(lambda done: self._finish(key, done))
+        return future
+
+    def _finish(self, key, future):
+        """
+        Move a finished render from the pending set to the cache.
+        """
+        with self._lock:
+            self._pending.pop(key, None)
+            if future.cancelled() or future.exception() is not None:
+                return
+            self._cache[key] = future.result()
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+def _export_one(report, output_dir):
+    """
+    Render one report to a file (runs in a worker process).
+
+    Returns:
+        Path of the written PDF
+    """
+    if report.get("image") is None and report.get("image_path"):
+        image = cv2.imread(report["image_path"], cv2.IMREAD_COLOR)
+        if image is not None:
+            report["image"] = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    path = os.path.join(output_dir, f"{report['scan_id']}_{report['language']}.pdf")
+    with open(path, "wb") as f:
+        f.write(render_pdf_report(report))
+    return path
+
+
+def export_reports(reports, output_dir, max_workers=None, max_pending=None):
+    """
+    Render many reports to PDF files in parallel worker processes.
+
+    Reports are consumed lazily and at most max_pending are queued or
+    rendering at any time, so memory stays bounded however many patients
+    are exported. Each worker writes its PDF itself; only the path comes
+    back.
+
+    Args:
+        reports: Iterable of report dictionaries (see render_pdf_report);
+            "image_path" may be given instead of "image"
+        output_dir: Directory the PDFs are written to
+        max_workers: Worker processes (default: one per CPU)
+        max_pending: Reports in flight (default: twice the workers)
+
+    Yields:
+        Paths of the written PDFs, in completion order
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * max_workers
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for report in reports:
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(_export_one, report, output_dir))
+        for future in pending:
+            yield future.result()
+
+
+def _read_reports(path, default_language):
+    """
+    Read report dictionaries from a JSON Lines file, one scan per line.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                report = json.loads(line)
+                report.setdefault("language", default_language)
+                report.setdefault("timestamp", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+                yield report
+
+
+def main(argv=None):
+    """
+    Bulk export: render a PDF for every scan in a JSON Lines file.
+
+    Usage:
+        python pdf_report.py scans.jsonl [--output-dir reports] [--workers N] [--language english]
+
+    Each line holds at least "scan_id" and "results"; "timestamp",
+    "language", "patient_name", "history" and "image_path" are optional.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Render PDF reports for many scans in parallel.")
+    parser.add_argument("input", help="JSON Lines file with one scan per line")
+    parser.add_argument("--output-dir", default="reports", help="directory for the PDFs")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes")
+    parser.add_argument("--language", default="english", help="default report language")
+    args = parser.parse_args(argv)
+
+    count = 0
+    for path in export_reports(_read_reports(args.input, args.language), args.output_dir, args.workers):
+        count += 1
+        print(path)
+    print(f"{count} reports written to {args.output_dir}", file=sys.stderr)
+    return 0
+
+
+# Configured through DENTAL_REPORT_WORKERS (default 2)
+report_renderer = ReportRenderer(max_workers=int(os.environ.get("DENTAL_REPORT_WORKERS", 2)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
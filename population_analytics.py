@@ -0,0 +1,349 @@
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+import numpy as np
+from dental_report import ISSUES, HEALTH_LEVELS, health_scores, calculate_next_checkups
+from instrumentation import timed
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_DB_PATH = os.path.join(DATA_DIR, "analytics.db")
+
+# Rollup granularities; a week is stored under the day number of its Monday
+GRAINS = ("day", "week")
+
+# Score distributions are kept as histograms with bins of this width
+BIN_WIDTH = 10
+BIN_COUNT = 100 // BIN_WIDTH
+
+# Distributions kept per period: the four issues and the health score
+METRICS = ISSUES + ("Health",)
+
+# Dashboard time windows, in days (None for everything)
+WINDOWS = {
+    "Last 7 days": 7,
+    "Last 30 days": 30,
+    "Last 90 days": 90,
+    "Last year": 365,
+    "All time": None,
+}
+
+
+def day_number(value):
+    """
+    Days since 1970-01-01 of a date, datetime or datetime64 (array).
+    """
+    if isinstance(value, np.ndarray):
+        return value.astype("datetime64[D]").astype(np.int64)
+    if isinstance(value, datetime):
+        value = value.date()
+    return (value - date(1970, 1, 1)).days
+
+
+def week_start(days):
+    """
+    Day number of the Monday starting the week of a day number (or array).
+    """
+    # 1970-01-01 was a Thursday
+    return days - (days + 3) % 7
+
+
+class AnalyticsStore:
+    """
+    Population statistics over all scans, pre-aggregated per day and week.
+
+    Every recorded scan increments the rollup rows of its day and week:
+    the scan count, status-band and urgency counts, a histogram and
+    running sums of each issue score and of the health score. Queries
+    only read rollup rows (weekly ones for the whole weeks of a window,
+    daily ones for the edges), so their cost depends on the length of
+    the window, not on the number of scans.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        """
+        Open (and create if needed) the analytics database.
+
+        Args:
+            path: SQLite database file, or ":memory:"
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            # metric is "scans", "status", "urgency" or a METRICS histogram;
+            # bucket is the status, urgency or lower bin edge ("" for scans)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS rollup_counts (
+                    grain TEXT NOT NULL,
+                    period INTEGER NOT NULL,
+                    metric TEXT NOT NULL,
+                    bucket TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (grain, period, metric, bucket)
+                ) WITHOUT ROWID
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS rollup_sums (
+                    grain TEXT NOT NULL,
+                    period INTEGER NOT NULL,
+                    metric TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    total REAL NOT NULL,
+                    total_sq REAL NOT NULL,
+                    PRIMARY KEY (grain, period, metric)
+                ) WITHOUT ROWID
+            """)
+
+    @timed("analytics_record")
+    def record_scans(self, scores, timestamps):
+        """
+        Add scans to the rollups.
+
+        The scans are scored with the columnar health_scores and
+        calculate_next_checkups and aggregated per period in NumPy, so
+        a batch costs one upsert per touched rollup row.
+
+        Args:
+            scores: (N, 4) issue scores in dental_report.ISSUES order
+            timestamps: (N,) scan times (datetime64 array or anything
+                np.asarray turns into one)
+        """
+        scores = np.asarray(scores, dtype=np.float64).reshape(-1, len(ISSUES))
+        if len(scores) == 0:
+            return
+        days = day_number(np.asarray(timestamps, dtype="datetime64[s]"))
+
+        health, statuses, _ = health_scores(scores)
+        _, urgencies = calculate_next_checkups(health)
+        values = np.column_stack([scores, health])
+
+        counts, sums = [], []
+        for grain in GRAINS:
+            periods, index = np.unique(week_start(days) if grain == "week" else days, return_inverse=True)
+            periods = periods.tolist()
+
+            for period, count in zip(periods, np.bincount(index).tolist()):
+                counts.append((grain, period, "scans", "", count))
+
+            for metric, labels in (("status", statuses), ("urgency", urgencies)):
+                # Unscored scans have an empty status and are not counted
+                names, codes = np.unique(labels, return_inverse=True)
+                table = np.bincount(index * len(names) + codes, minlength=len(periods) * len(names))
+                for (row, column) in zip(*np.nonzero(table.reshape(len(periods), len(names)))):
+                    if names[column]:
+                        counts.append((grain, periods[row], metric, str(names[column]),
+                                       int(table[row * len(names) + column])))
+
+            for column, metric in enumerate(METRICS):
+                value = values[:, column]
+                present = ~np.isnan(value)
+                rows, value = index[present], value[present]
+                bins = np.clip((value // BIN_WIDTH).astype(np.int64), 0, BIN_COUNT - 1)
+                table = np.bincount(rows * BIN_COUNT + bins, minlength=len(periods) * BIN_COUNT)
+                for (row, column_bin) in zip(*np.nonzero(table.reshape(len(periods), BIN_COUNT))):
+                    counts.append((grain, periods[row], metric, str(column_bin * BIN_WIDTH),
+                                   int(table[row * BIN_COUNT + column_bin])))
+
+                number = np.bincount(rows, minlength=len(periods))
+                total = np.bincount(rows, weights=value, minlength=len(periods))
+                total_sq = np.bincount(rows, weights=value * value, minlength=len(periods))
+                for row in np.flatnonzero(number):
+                    sums.append((grain, periods[row], metric, int(number[row]), float(total[row]),
+                                 float(total_sq[row])))
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                """
+                INSERT INTO rollup_counts (grain, period, metric, bucket, count) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (grain, period, metric, bucket) DO UPDATE SET count = count + excluded.count
+                """,
+                counts
+            )
+            self._conn.executemany(
+                """
+                INSERT INTO rollup_sums (grain, period, metric, count, total, total_sq) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (grain, period, metric) DO UPDATE SET
+                    count = count + excluded.count,
+                    total = total + excluded.total,
+                    total_sq = total_sq + excluded.total_sq
+                """,
+                sums
+            )
+
+    def record_scan(self, results, timestamp):
+        """
+        Add one scan to the rollups.
+
+        Args:
+            results: Dictionary of issue scores
+            timestamp: Scan time (datetime or "%Y-%m-%d %H:%M:%S" string)
+        """
+        self.record_scans(
+            [[results.get(issue, np.nan) for issue in ISSUES]],
+            np.array([np.datetime64(timestamp, "s")])
+        )
+
+    def _ranges(self, start_day, end_day):
+        """
+        Split [start_day, end_day) into rollup ranges.
+
+        Returns:
+            List of (grain, first period, end period) covering the window
+            with whole weeks where possible and days at the edges
+        """
+        first_week = week_start(start_day + 6)
+        last_week = week_start(end_day)
+        if first_week >= last_week:
+            return [("day", start_day, end_day)]
+        ranges = [("week", first_week, last_week)]
+        if start_day < first_week:
+            ranges.append(("day", start_day, first_week))
+        if last_week < end_day:
+            ranges.append(("day", last_week, end_day))
+        return ranges
+
+    def _window(self, start, end):
+        """
+        Day numbers of a window; open ends are filled from the data.
+        """
+        if start is None:
+            with self._lock:
+                row = self._conn.execute("SELECT MIN(period) FROM rollup_counts WHERE grain = 'day'").fetchone()
+            start = row[0] if row[0] is not None else day_number(date.today())
+        elif not isinstance(start, int):
+            start = day_number(start)
+        if end is None:
+            end = day_number(date.today()) + 1
+        elif not isinstance(end, int):
+            end = day_number(end)
+        return start, end
+
+    @timed("analytics_summary")
+    def summary(self, start=None, end=None):
+        """
+        Population statistics of the scans in a time window.
+
+        Args:
+            start: First day (date, datetime or day number); None for the
+                first recorded day
+            end: Day after the last one; None for up to and including today
+
+        Returns:
+            Dictionary with "start" and "end" dates, "scans",
+            "status" and "urgency" counts, and per metric (METRICS) the
+            "mean", "std", "count" and "histogram" (BIN_COUNT counts)
+        """
+        start_day, end_day = self._window(start, end)
+        ranges = self._ranges(start_day, end_day)
+
+        counts = {}
+        sums = {metric: [0, 0.0, 0.0] for metric in METRICS}
+        with self._lock:
+            for grain, first, last in ranges:
+                for metric, bucket, count in self._conn.execute(
+                    """
+                    SELECT metric, bucket, SUM(count) FROM rollup_counts
+                    WHERE grain = ? AND period >= ? AND period < ?
+                    GROUP BY metric, bucket
+                    """,
+                    (grain, first, last)
+                ):
+                    counts[(metric, bucket)] = counts.get((metric, bucket), 0) + count
+                for metric, count, total, total_sq in self._conn.execute(
+                    """
+                    SELECT metric, SUM(count), SUM(total), SUM(total_sq) FROM rollup_sums
+                    WHERE grain = ? AND period >= ? AND period < ?
+                    GROUP BY metric
+                    """,
+                    (grain, first, last)
+                ):
+                    if metric in sums:
+                        sums[metric][0] += count
+                        sums[metric][1] += total
+                        sums[metric][2] += total_sq
+
+        distributions = {}
+        for metric, (count, total, total_sq) in sums.items():
+            mean = total / count if count else None
+            variance = max(total_sq / count - mean * mean, 0.0) if count else None
+            distributions[metric] = {
+                "count": count,
+                "mean": mean,
+                "std": variance ** 0.5 if count else None,
+                "histogram": [counts.get((metric, str(b * BIN_WIDTH)), 0) for b in range(BIN_COUNT)],
+            }
+
+        epoch = date(1970, 1, 1)
+        return {
+            "start": epoch + timedelta(days=start_day),
+            "end": epoch + timedelta(days=end_day),
+            "scans": counts.get(("scans", ""), 0),
+            "status": {
+                status: counts.get(("status", status), 0) for _, status, _ in HEALTH_LEVELS
+            },
+            "urgency": {
+                bucket: count for (metric, bucket), count in counts.items() if metric == "urgency"
+            },
+            "metrics": distributions,
+        }
+
+    @timed("analytics_series")
+    def series(self, start=None, end=None, grain="day"):
+        """
+        Scan counts and mean health score per period of a window.
+
+        Args:
+            start: First day, as for summary
+            end: Day after the last one, as for summary
+            grain: "day" or "week"
+
+        Returns:
+            List of (period start date, scans, mean health score or None)
+        """
+        start_day, end_day = self._window(start, end)
+        if grain == "week":
+            start_day = week_start(start_day)
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT c.period, c.count, s.total / s.count FROM rollup_counts c
+                LEFT JOIN rollup_sums s
+                    ON s.grain = c.grain AND s.period = c.period AND s.metric = 'Health'
+                WHERE c.grain = ? AND c.metric = 'scans' AND c.bucket = '' AND c.period >= ? AND c.period < ?
+                ORDER BY c.period
+                """,
+                (grain, start_day, end_day)
+            ).fetchall()
+        epoch = date(1970, 1, 1)
+        return [(epoch + timedelta(days=period), count, health) for period, count, health in rows]
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        with self._lock:
+            self._conn.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_analytics_store():
+    """
+    The process-wide analytics store, opened on first use.
+
+    The database path is taken from DENTAL_ANALYTICS_DB (default
+    data/analytics.db).
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = AnalyticsStore(os.environ.get("DENTAL_ANALYTICS_DB", DEFAULT_DB_PATH))
+        return _store
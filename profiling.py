@@ -0,0 +1,193 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+DEFAULT_PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "profiles")
+
+
+class SlowScanProfiler:
+    """
+    Opt-in profiler that keeps a profile only when a scan turns out slow.
+
+    Every profiled block runs under cProfile. If it takes longer than the
+    threshold, the profile (.prof), a summary of the top functions (.txt)
+    and the input metadata (.json) are written to a directory that keeps
+    only the most recent profiles.
+    """
+
+    def __init__(self, threshold_ms=1000, directory=DEFAULT_PROFILE_DIR, max_profiles=20,
+                 top_n=25, enabled=False):
+        """
+        Initialize the profiler.
+
+        Args:
+            threshold_ms: Blocks slower than this are saved
+            directory: Where profiles are written
+            max_profiles: Number of saved profiles to keep
+            top_n: Functions listed in each summary
+            enabled: Profile by default (can be overridden per call)
+        """
+        self.threshold_ms = threshold_ms
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self.top_n = top_n
+        self.enabled = enabled
+        # cProfile cannot run twice at once, so concurrent scans skip profiling
+        self._active = threading.Lock()
+
+    @contextmanager
+    def profile(self, label, metadata=None, enabled=None):
+        """
+        Profile a block and save the profile if it was slow.
+
+        Usage:
+            with slow_scan_profiler.profile("scan", {"resolution": "640x480"}):
+                run_pipeline()
+
+        Args:
+            label: Name of the profiled block, used in file names
+            metadata: Dictionary describing the input (resolution, dtype, ...)
+            enabled: Override the profiler's default for this block
+
+        Yields:
+            None
+        """
+        if not (self.enabled if enabled is None else enabled) or not self._active.acquire(blocking=False):
+            yield
+            return
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if elapsed_ms >= self.threshold_ms:
+                self._save(profiler, label, elapsed_ms, metadata or {})
+        finally:
+            self._active.release()
+
+    def _save(self, profiler, label, elapsed_ms, metadata):
+        """
+        Write the profile, its summary and metadata, then rotate old ones.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        safe_label = re.sub(r"[^A-Za-z0-9_-]", "_", label)
+        stem = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{safe_label}_{elapsed_ms:.0f}ms"
+        base = os.path.join(self.directory, stem)
+
+        profiler.dump_stats(f"{base}.prof")
+
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats("cumulative").print_stats(self.top_n)
+        stream.write("\n")
+        stats.sort_stats("tottime").print_stats(self.top_n)
+        with open(f"{base}.txt", "w") as f:
+            f.write(f"{label}: {elapsed_ms:.1f} ms (threshold {self.threshold_ms} ms)\n")
+            f.write(f"metadata: {json.dumps(metadata, default=str)}\n\n")
+            f.write(stream.getvalue())
+
+        with open(f"{base}.json", "w") as f:
+            json.dump({
+                "label": label,
+                "elapsed_ms": round(elapsed_ms, 1),
+                "threshold_ms": self.threshold_ms,
+                "metadata": metadata,
+                "top_functions": self._top_functions(stats, "cumtime_ms"),
+                "hotspots": self._top_functions(stats, "tottime_ms"),
+            }, f, indent=2, default=str)
+
+        self._rotate()
+
+    def _top_functions(self, stats, sort_key):
+        """
+        The slowest functions by cumulative or own time, for the JSON summary.
+        """
+        rows = []
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                "function": f"{os.path.basename(filename)}:{line}({name})",
+                "calls": calls,
+                "tottime_ms": round(tottime * 1000, 2),
+                "cumtime_ms": round(cumtime * 1000, 2),
+            })
+        rows.sort(key=lambda row: row[sort_key], reverse=True)
+        return rows[:self.top_n]
+
+    def _rotate(self):
+        """
+        Delete all but the newest max_profiles profiles.
+        """
+        stems = sorted({
+            os.path.splitext(name)[0]
+            for name in os.listdir(self.directory)
+            if name.endswith((".prof", ".txt", ".json"))
+        })
+        for stem in stems[:-self.max_profiles] if len(stems) > self.max_profiles else []:
+            for extension in (".prof", ".txt", ".json"):
+                try:
+                    os.remove(os.path.join(self.directory, stem + extension))
+                except FileNotFoundError:
+                    pass
+
+    def recent_profiles(self, limit=5):
+        """
+        Summaries of the most recently saved profiles, newest first.
+
+        Returns:
+            List of dictionaries as stored in the .json files
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted((n for n in os.listdir(self.directory) if n.endswith(".json")), reverse=True)
+        summaries = []
+        for name in names[:limit]:
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    summaries.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return summaries
+
+
+def image_metadata(image, history_length=None):
+    """
+    Describe an input image for profile metadata.
+
+    Args:
+        image: Numpy image or None
+        history_length: Number of history entries, if relevant
+
+    Returns:
+        Dictionary with resolution, dtype and history length
+    """
+    metadata = {}
+    if image is not None:
+        metadata["resolution"] = f"{image.shape[1]}x{image.shape[0]}"
+        metadata["channels"] = image.shape[2] if image.ndim == 3 else 1
+        metadata["dtype"] = str(image.dtype)
+    if history_length is not None:
+        metadata["history_length"] = history_length
+    return metadata
+
+
+# Configured through environment variables:
+#   DENTAL_PROFILE=1                enable for every session
+#   DENTAL_PROFILE_THRESHOLD_MS     latency above which profiles are kept
+#   DENTAL_PROFILE_DIR              output directory
+slow_scan_profiler = SlowScanProfiler(
+    threshold_ms=float(os.environ.get("DENTAL_PROFILE_THRESHOLD_MS", 1000)),
+    directory=os.environ.get("DENTAL_PROFILE_DIR", DEFAULT_PROFILE_DIR),
+    enabled=os.environ.get("DENTAL_PROFILE", "").lower() in ("1", "true", "yes"),
+)
@@ -0,0 +1,216 @@
+import time
+import numpy as np
+from lazy_imports import lazy_module
+from instrumentation import metrics, timed
+
+cv2 = lazy_module("cv2")
+
+# Longest side of the proxy the checks run on, in pixels
+PROXY_SIZE = 192
+
+# Latency budget of the whole assessment; overruns are counted in the
+# quality_budget_exceeded_total metric
+QUALITY_BUDGET_MS = 5.0
+
+# Thresholds, calibrated on the PROXY_SIZE proxy. "reject" stops the frame
+# before the pipeline runs; "flag" lets it through with a warning.
+QUALITY_THRESHOLDS = {
+    # Variance of the Laplacian; lower is blurrier
+    "sharpness": {"reject": 20.0, "flag": 80.0},
+    # Mean luminance (0-255)
+    "min_brightness": {"reject": 35.0, "flag": 60.0},
+    "max_brightness": {"reject": 235.0, "flag": 215.0},
+    # Fraction of pixels crushed to black or clipped to white
+    "dark_clip": {"flag": 0.4},
+    "bright_clip": {"flag": 0.3},
+    # Fraction of the frame covered by the detected teeth region
+    "coverage": {"flag": 0.15},
+}
+
+# Luminance levels counted as crushed or clipped
+DARK_LEVEL = 16
+BRIGHT_LEVEL = 250
+
+# Teeth are looked for as the largest bright blob of the proxy: frames
+# whose blurred luminance varies less than MIN_CONTRAST (standard
+# deviation) show nothing, and blobs under MIN_TEETH_AREA of the frame
+# are ignored
+MIN_CONTRAST = 8.0
+MIN_TEETH_AREA = 0.05
+
+# Issue codes reported by judge_quality
+QUALITY_ISSUES = ("blurry", "too_dark", "overexposed", "no_teeth", "low_coverage")
+
+
+def make_proxy(image, channel_order="rgb", size=PROXY_SIZE):
+    """
+    Shrink an image to a grayscale proxy for the quality checks.
+
+    Args:
+        image: Image as a numpy array (RGB, BGR or grayscale)
+        channel_order: "rgb" or "bgr"
+        size: Longest side of the proxy
+
+    Returns:
+        Grayscale uint8 proxy
+    """
+    # Decimate large frames with a stride (a view) down to between one and
+    # two times the proxy size, so only that many pixels are copied, and
+    # convert to gray before averaging the rest away with INTER_AREA
+    step = max(image.shape[:2]) // size
+    if step > 1:
+        image = image[::step, ::step]
+    if image.ndim == 3:
+        image = cv2.cvtColor(np.ascontiguousarray(image),
+                             cv2.COLOR_BGR2GRAY if channel_order == "bgr" else cv2.COLOR_RGB2GRAY)
+
+    height, width = image.shape[:2]
+    scale = min(1.0, size / max(height, width))
+    if scale < 1.0:
+        image = cv2.resize(np.ascontiguousarray(image),
+                           (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    if image.dtype != np.uint8:
+        image = np.clip(image * 255 if image.max() <= 1.0 else image, 0, 255).astype(np.uint8)
+    return image
+
+
+def find_teeth(gray):
+    """
+    Locate the teeth on a grayscale proxy.
+
+    Teeth are the brightest large structure of an intraoral photo, so the
+    blurred proxy is split at its Otsu threshold and the largest bright
+    connected blob is taken. Unlike the edge contours of
+    detect_teeth_region, this does not depend on the noise level, and so
+    on the resolution the proxy was made from.
+
+    Args:
+        gray: Grayscale uint8 proxy
+
+    Returns:
+        Bounding box (x, y, w, h) of the teeth, or None if none were found
+    """
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    if blurred.std() < MIN_CONTRAST:
+        return None
+
+    _, mask = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if count < 2:
+        return None
+    # Label 0 is the dark background
+    largest = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    if stats[largest, cv2.CC_STAT_AREA] < MIN_TEETH_AREA * gray.size:
+        return None
+    x, y, w, h = stats[largest, :4]
+    return (int(x), int(y), int(w), int(h))
+
+
+def measure_quality(gray):
+    """
+    Compute the quality metrics of a grayscale proxy.
+
+    Args:
+        gray: Grayscale uint8 proxy
+
+    Returns:
+        Dictionary with sharpness, brightness, dark_clip, bright_clip,
+        teeth_found and coverage
+    """
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+    histogram = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+    total = histogram.sum()
+    brightness = float(np.dot(histogram, np.arange(256)) / total)
+    dark_clip = float(histogram[:DARK_LEVEL].sum() / total)
+    bright_clip = float(histogram[BRIGHT_LEVEL:].sum() / total)
+
+    region = find_teeth(gray)
+    coverage = region[2] * region[3] / gray.size if region is not None else 0.0
+
+    return {
+        "sharpness": sharpness,
+        "brightness": brightness,
+        "dark_clip": dark_clip,
+        "bright_clip": bright_clip,
+        "teeth_found": region is not None,
+        "coverage": float(coverage),
+    }
+
+
+def judge_quality(measured, thresholds=QUALITY_THRESHOLDS):
+    """
+    Turn quality metrics into rejected and flagged issues.
+
+    Args:
+        measured: Metrics from measure_quality
+        thresholds: Threshold table like QUALITY_THRESHOLDS
+
+    Returns:
+        rejected: Issue codes that should stop the frame
+        flagged: Issue codes that should only be reported
+    """
+    rejected, flagged = [], []
+
+    def check(issue, value, limits, below=True):
+        failed = (lambda limit: value < limit) if below else (lambda limit: value > limit)
+        if "reject" in limits and failed(limits["reject"]):
+            rejected.append(issue)
+        elif "flag" in limits and failed(limits["flag"]):
+            flagged.append(issue)
+
+    check("too_dark", measured["brightness"], thresholds["min_brightness"])
+    check("overexposed", measured["brightness"], thresholds["max_brightness"], below=False)
+    # Exposure problems also lower the Laplacian, so blur is only judged
+    # on frames that are not already rejected for exposure
+    if not rejected:
+        check("blurry", measured["sharpness"], thresholds["sharpness"])
+    if "too_dark" not in rejected + flagged:
+        check("too_dark", measured["dark_clip"], thresholds["dark_clip"], below=False)
+    if "overexposed" not in rejected + flagged:
+        check("overexposed", measured["bright_clip"], thresholds["bright_clip"], below=False)
+
+    if not measured["teeth_found"]:
+        flagged.append("no_teeth")
+    else:
+        check("low_coverage", measured["coverage"], thresholds["coverage"])
+
+    return rejected, flagged
+
+
+@timed("quality_gate")
+def assess_quality(image, channel_order="rgb", thresholds=QUALITY_THRESHOLDS):
+    """
+    Check whether a frame is good enough to analyse.
+
+    Runs on a small grayscale proxy, so the cost hardly depends on the
+    input resolution.
+
+    Args:
+        image: Decoded image as a numpy array
+        channel_order: "rgb", or "bgr" for an image straight from decode_image
+        thresholds: Threshold table like QUALITY_THRESHOLDS
+
+    Returns:
+        Dictionary with "passed" (False if any issue is rejected),
+        "rejected" and "flagged" issue codes, the "metrics" and "elapsed_ms"
+    """
+    start = time.perf_counter()
+
+    measured = measure_quality(make_proxy(image, channel_order))
+    rejected, flagged = judge_quality(measured, thresholds)
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if elapsed_ms > QUALITY_BUDGET_MS:
+        metrics.increment("quality_budget_exceeded_total")
+    if rejected:
+        metrics.increment("quality_rejected_total")
+
+    return {
+        "passed": not rejected,
+        "rejected": rejected,
+        "flagged": flagged,
+        "metrics": measured,
+        "elapsed_ms": round(elapsed_ms, 3),
+    }
@@ -0,0 +1,197 @@
+import numpy as np
+from lazy_imports import lazy_module
+from model_utils import compute_color_masks
+
+cv2 = lazy_module("cv2")
+
+# Dental regions as fractions of the analysed area: (x0, y0, x1, y1).
+# Left and right refer to the image, which mirrors the patient's mouth.
+DENTAL_REGIONS = {
+    "full_mouth": (0.0, 0.0, 1.0, 1.0),
+    "upper": (0.0, 0.0, 1.0, 0.5),
+    "lower": (0.0, 0.5, 1.0, 1.0),
+    "left": (0.0, 0.0, 0.5, 1.0),
+    "right": (0.5, 0.0, 1.0, 1.0),
+    "anterior": (1/3, 0.0, 2/3, 1.0),
+    "posterior_left": (0.0, 0.0, 1/3, 1.0),
+    "posterior_right": (2/3, 0.0, 1.0, 1.0),
+    "upper_left": (0.0, 0.0, 0.5, 0.5),
+    "upper_right": (0.5, 0.0, 1.0, 0.5),
+    "lower_left": (0.0, 0.5, 0.5, 1.0),
+    "lower_right": (0.5, 0.5, 1.0, 1.0),
+    "upper_anterior": (1/3, 0.0, 2/3, 0.5),
+    "lower_anterior": (1/3, 0.5, 2/3, 1.0),
+}
+
+# Channels available for mean/variance queries, in table order
+CHANNELS = ("red", "green", "blue", "brightness")
+
+# Colour masks available for ratio queries, in table order
+MASKS = ("yellow", "dark", "red")
+
+
+class RegionStatistics:
+    """
+    Summed-area tables for one image, answering rectangle statistics in O(1).
+
+    The tables are built once per image; every mean, variance or mask ratio
+    query afterwards costs four lookups per table regardless of region size.
+    """
+
+    def __init__(self, image):
+        """
+        Build the summed-area tables for an image.
+
+        Args:
+            image: RGB image, either uint8 or float in the 0-1 range
+        """
+        if image.ndim == 2:
+            image = np.dstack([image] * 3)
+
+        self.height, self.width = image.shape[:2]
+
+        # Per-channel values plus per-pixel brightness (mean of the channels)
+        values = image.astype(np.float64)
+        brightness = values.mean(axis=2, keepdims=True)
+        stacked = np.concatenate([values, brightness], axis=2)
+        self._sum, self._sqsum = cv2.integral2(stacked, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+
+        # HSV masks need the uint8 OpenCV ranges
+        if image.dtype != np.uint8:
+            image = np.clip(image * 255 if image.max() <= 1.0 else image, 0, 255).astype(np.uint8)
+        hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
+        masks = compute_color_masks(hsv)
+        mask_stack = np.dstack([masks[name] for name in MASKS]).astype(np.uint8)
+        self._mask_sum = cv2.integral(mask_stack, sdepth=cv2.CV_32S)
+
+    def _rect_sum(self, table, rect):
+        """
+        Sum a summed-area table over a rectangle (x, y, w, h).
+        """
+        x, y, w, h = rect
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(self.width, x + w), min(self.height, y + h)
+        return table[y1, x1] - table[y0, x1] - table[y1, x0] + table[y0, x0]
+
+    def _area(self, rect):
+        """
+        Number of pixels of a rectangle that fall inside the image.
+        """
+        x, y, w, h = rect
+        width = max(0, min(self.width, x + w) - max(0, x))
+        height = max(0, min(self.height, y + h) - max(0, y))
+        return width * height
+
+    def mean(self, channel, rect):
+        """
+        Mean of a channel over a rectangle.
+
+        Args:
+            channel: One of CHANNELS
+            rect: Region as (x, y, w, h) in pixels
+
+        Returns:
+            Mean value, or 0 for an empty region
+        """
+        area = self._area(rect)
+        if area == 0:
+            return 0.0
+        return float(self._rect_sum(self._sum, rect)[CHANNELS.index(channel)] / area)
+
+    def variance(self, channel, rect):
+        """
+        Variance of a channel over a rectangle.
+
+        Args:
+            channel: One of CHANNELS
+            rect: Region as (x, y, w, h) in pixels
+
+        Returns:
+            Variance, or 0 for an empty region
+        """
+        area = self._area(rect)
+        if area == 0:
+            return 0.0
+        index = CHANNELS.index(channel)
+        mean = self._rect_sum(self._sum, rect)[index] / area
+        mean_sq = self._rect_sum(self._sqsum, rect)[index] / area
+        return float(max(0.0, mean_sq - mean ** 2))
+
+    def pooled_std(self, rect):
+        """
+        Standard deviation over all RGB values of a rectangle.
+
+        This matches np.std(image[region]) as used for contrast in
+        DentalDecayDetector.detect.
+        """
+        area = self._area(rect)
+        if area == 0:
+            return 0.0
+        count = 3 * area
+        mean = self._rect_sum(self._sum, rect)[:3].sum() / count
+        mean_sq = self._rect_sum(self._sqsum, rect)[:3].sum() / count
+        return float(np.sqrt(max(0.0, mean_sq - mean ** 2)))
+
+    def ratio(self, mask, rect):
+        """
+        Fraction of a rectangle covered by a colour mask.
+
+        Args:
+            mask: One of MASKS
+            rect: Region as (x, y, w, h) in pixels
+
+        Returns:
+            Ratio between 0 and 1
+        """
+        area = self._area(rect)
+        if area == 0:
+            return 0.0
+        return float(self._rect_sum(self._mask_sum, rect)[MASKS.index(mask)] / area)
+
+    def describe(self, rect):
+        """
+        Collect every statistic for a rectangle.
+
+        Args:
+            rect: Region as (x, y, w, h) in pixels
+
+        Returns:
+            Dictionary with channel means, contrast and mask ratios
+        """
+        stats = {f"avg_{channel}": self.mean(channel, rect) for channel in CHANNELS}
+        stats["contrast"] = self.pooled_std(rect)
+        for mask in MASKS:
+            stats[f"{mask}_ratio"] = self.ratio(mask, rect)
+        return stats
+
+
+def region_rects(image_shape, regions=None, roi=None):
+    """
+    Convert fractional region definitions to pixel rectangles.
+
+    Args:
+        image_shape: Shape of the analysed image
+        regions: Mapping of region name to fractional bounds
+            (default: DENTAL_REGIONS)
+        roi: Optional (x, y, w, h) area the regions are laid out in,
+            e.g. the result of detect_teeth_region
+
+    Returns:
+        Dictionary mapping region name to (x, y, w, h)
+    """
+    if regions is None:
+        regions = DENTAL_REGIONS
+
+    if roi is None:
+        roi = (0, 0, image_shape[1], image_shape[0])
+    rx, ry, rw, rh = roi
+
+    rects = {}
+    for name, (fx0, fy0, fx1, fy1) in regions.items():
+        x0 = rx + int(round(fx0 * rw))
+        y0 = ry + int(round(fy0 * rh))
+        x1 = rx + int(round(fx1 * rw))
+        y1 = ry + int(round(fy1 * rh))
+        rects[name] = (x0, y0, x1 - x0, y1 - y0)
+
+    return rects
@@ -0,0 +1,624 @@
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import smtplib
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from email.message import EmailMessage
+
+# Seconds between reminders for each frequency
+FREQUENCY_INTERVALS = {
+    "daily": 24 * 3600,
+    "weekly": 7 * 24 * 3600,
+    "monthly": 30 * 24 * 3600
+}
+
+# Default locations, overridable through environment variables
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_DB_PATH = os.path.join(DATA_DIR, "reminders.db")
+DEFAULT_OUTBOX_PATH = os.path.join(DATA_DIR, "reminder_outbox.jsonl")
+DEFAULT_SECRET_PATH = os.path.join(DATA_DIR, "reminder_secret")
+
+# Seconds to wait before retrying a batch whose delivery failed
+RETRY_DELAY = 300
+
+# Seconds a claimed batch is hidden from other schedulers while it is
+# delivered; if the claiming process dies, the batch is due again after it
+CLAIM_LEASE = 300
+
+
+class FileTransport:
+    """
+    Delivers notifications by appending them as JSON lines to a local file.
+    Useful for development and tests in place of a mail server.
+    """
+
+    def __init__(self, path=DEFAULT_OUTBOX_PATH):
+        """
+        Initialize the file transport.
+
+        Args:
+            path: Outbox file to append to
+        """
+        self.path = path
+
+    def send_batch(self, notifications):
+        """
+        Write a batch of notifications with a single file open.
+
+        Args:
+            notifications: List of notification dictionaries
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            for notification in notifications:
+                f.write(json.dumps(notification, ensure_ascii=False) + "\n")
+
+
+class SMTPTransport:
+    """
+    Delivers notifications as emails, reusing one SMTP connection per batch.
+    """
+
+    def __init__(self, host="localhost", port=25, sender="reminders@dentalapp.example.com",
+                 username=None, password=None, use_tls=False):
+        """
+        Initialize the SMTP transport.
+
+        Args:
+            host: SMTP server host
+            port: SMTP server port
+            sender: From address for reminder emails
+            username: Optional login user
+            password: Optional login password
+            use_tls: Upgrade the connection with STARTTLS
+        """
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+
+    def send_batch(self, notifications):
+        """
+        Send a batch of notifications over one SMTP connection.
+
+        Args:
+            notifications: List of notification dictionaries
+        """
+        with smtplib.SMTP(self.host, self.port) as smtp:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+
+            for notification in notifications:
+                message = EmailMessage()
+                message["From"] = self.sender
+                message["To"] = notification["email"]
+                message["Subject"] = notification["subject"]
+                message.set_content(notification["body"])
+                smtp.send_message(message)
+
+
+class ReminderStore:
+    """
+    Persistent reminder queue in SQLite, indexed by next fire time.
+
+    Each user has at most one pending reminder. Finding due reminders is an
+    index range scan, so the cost of a tick does not grow with the number
+    of users.
+
+    The scheduled checkup of each user is kept in its own table, which
+    outlives the reminders: the calendar feeds keep showing a checkup after
+    its last reminder was sent or the reminders were turned off.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        """
+        Open (and create if needed) the reminder database.
+
+        Args:
+            path: SQLite database file, or ":memory:"
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS reminders (
+                    user_id TEXT PRIMARY KEY,
+                    email TEXT NOT NULL,
+                    frequency TEXT NOT NULL,
+                    checkup_at REAL NOT NULL,
+                    next_fire REAL NOT NULL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_reminders_next_fire ON reminders (next_fire)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkups (user_id TEXT PRIMARY KEY, checkup_at REAL NOT NULL)"
+            )
+            # Databases from before the checkups table: the pending
+            # reminders are the only record of their checkups
+            self._conn.execute(
+                "INSERT OR IGNORE INTO checkups (user_id, checkup_at) SELECT user_id, checkup_at FROM reminders"
+            )
+            # Bumped whenever a checkup is added, changed or removed, so
+            # calendar feeds can tell cheaply whether they are still current
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "INSERT OR IGNORE INTO store_meta (key, value) VALUES ('checkups_version', 0)"
+            )
+
+    def upsert(self, user_id, email, frequency, checkup_at, next_fire):
+        """
+        Add or replace the pending reminder of a user, and record the
+        checkup it is for.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO reminders (user_id, email, frequency, checkup_at, next_fire)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    email = excluded.email,
+                    frequency = excluded.frequency,
+                    checkup_at = excluded.checkup_at,
+                    next_fire = excluded.next_fire
+                """,
+                (user_id, email, frequency, checkup_at, next_fire)
+            )
+            self._set_checkup(user_id, checkup_at)
+
+    def remove(self, user_id):
+        """
+        Remove the pending reminder of a user, if any. The checkup stays
+        scheduled.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM reminders WHERE user_id = ?", (user_id,))
+
+    def set_checkup(self, user_id, checkup_at):
+        """
+        Record the scheduled checkup of a user, without a reminder.
+        """
+        with self._lock, self._conn:
+            self._set_checkup(user_id, checkup_at)
+
+    def _set_checkup(self, user_id, checkup_at):
+        # Caller holds the lock and an open transaction
+        changed = self._conn.execute(
+            """
+            INSERT INTO checkups (user_id, checkup_at) VALUES (?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET checkup_at = excluded.checkup_at
+            WHERE checkup_at != excluded.checkup_at
+            """,
+            (user_id, checkup_at)
+        ).rowcount
+        if changed > 0:
+            self._bump_version()
+
+    def get(self, user_id):
+        """
+        Get the pending reminder of a user.
+
+        Returns:
+            Reminder dictionary or None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT user_id, email, frequency, checkup_at, next_fire FROM reminders WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def next_fire_time(self):
+        """
+        Earliest next fire time of all reminders (an index lookup).
+
+        Returns:
+            Unix timestamp or None if the queue is empty
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(next_fire) FROM reminders").fetchone()
+        return row[0]
+
+    def claim(self, now, limit, lease=CLAIM_LEASE):
+        """
+        Take the reminders whose fire time has passed, earliest first.
+
+        The rows are read and their fire time moved to the end of the lease
+        in one write transaction, so schedulers of several processes sharing
+        the database never claim the same reminder. A batch that is not
+        completed (the process died while sending) is due again once the
+        lease ends.
+
+        Args:
+            now: Current Unix timestamp
+            limit: Maximum number of reminders to claim
+            lease: Seconds the claimed reminders are held
+
+        Returns:
+            (reminders, claimed_until): reminder dictionaries with their
+            fire time before the claim, and the lease end to pass to
+            complete()
+        """
+        claimed_until = now + lease
+        with self._lock, self._conn:
+            # Take the write lock before reading, not at the first update
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute(
+                """
+                SELECT user_id, email, frequency, checkup_at, next_fire FROM reminders
+                WHERE next_fire <= ? ORDER BY next_fire LIMIT ?
+                """,
+                (now, limit)
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE reminders SET next_fire = ? WHERE user_id = ?",
+                [(claimed_until, row[0]) for row in rows]
+            )
+        return [self._to_dict(row) for row in rows], claimed_until
+
+    def complete(self, rescheduled, finished, claimed_until=None):
+        """
+        Record the outcome of a delivered batch in one transaction.
+
+        Args:
+            rescheduled: List of (user_id, next_fire) pairs
+            finished: List of user ids whose reminders are done
+            claimed_until: Lease end returned by claim(); rows rescheduled
+                by the user in the meantime no longer carry it and are
+                left alone
+        """
+        condition = "" if claimed_until is None else " AND next_fire = ?"
+        extra = () if claimed_until is None else (claimed_until,)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE reminders SET next_fire = ? WHERE user_id = ?" + condition,
+                [(next_fire, user_id) + extra for user_id, next_fire in rescheduled]
+            )
+            self._conn.executemany(
+                "DELETE FROM reminders WHERE user_id = ?" + condition,
+                [(user_id,) + extra for user_id in finished]
+            )
+
+    def for_user(self, user_id):
+        """
+        Get every scheduled checkup of a user.
+
+        Returns:
+            List of dictionaries with "user_id" and "checkup_at"
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, checkup_at FROM checkups WHERE user_id = ?", (user_id,)
+            ).fetchall()
+        return [{"user_id": user_id, "checkup_at": checkup_at} for user_id, checkup_at in rows]
+
+    def iter_all(self, batch_size=1000):
+        """
+        Iterate over all scheduled checkups in user id order, one batch at
+        a time.
+
+        Rows are paged by user id rather than held in one cursor, so memory
+        stays flat and the store is not locked between batches.
+
+        Args:
+            batch_size: Rows fetched per query
+
+        Yields:
+            Dictionaries with "user_id" and "checkup_at"
+        """
+        last_user_id = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    """
+                    SELECT user_id, checkup_at FROM checkups
+                    WHERE user_id > ? ORDER BY user_id LIMIT ?
+                    """,
+                    (last_user_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for user_id, checkup_at in rows:
+                yield {"user_id": user_id, "checkup_at": checkup_at}
+            last_user_id = rows[-1][0]
+
+    def checkups_version(self):
+        """
+        Counter that changes whenever any scheduled checkup changes.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT value FROM store_meta WHERE key = 'checkups_version'"
+            ).fetchone()[0]
+
+    def _bump_version(self):
+        # Caller holds the lock and an open transaction
+        self._conn.execute(
+            "UPDATE store_meta SET value = value + 1 WHERE key = 'checkups_version'"
+        )
+
+    def count(self):
+        """
+        Number of pending reminders.
+        """
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM reminders").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _to_dict(row):
+        user_id, email, frequency, checkup_at, next_fire = row
+        return {
+            "user_id": user_id,
+            "email": email,
+            "frequency": frequency,
+            "checkup_at": checkup_at,
+            "next_fire": next_fire
+        }
+
+
+class ReminderScheduler:
+    """
+    Background scheduler that sends checkup reminders when they are due.
+
+    A single timer thread sleeps until the earliest reminder in the store is
+    due (or until an earlier one is scheduled), then delivers all due
+    reminders in batches through the transport. Each batch is claimed in
+    the store before it is sent, so every app process can run its own
+    scheduler on a shared database without sending a reminder twice.
+    """
+
+    def __init__(self, store, transport, batch_size=500, clock=time.time):
+        """
+        Initialize the scheduler.
+
+        Args:
+            store: ReminderStore holding the pending reminders
+            transport: Object with a send_batch(notifications) method
+            batch_size: Maximum reminders delivered per transport call
+            clock: Function returning the current Unix timestamp
+        """
+        self.store = store
+        self.transport = transport
+        self.batch_size = batch_size
+        self.clock = clock
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def schedule(self, user_id, email, checkup_date, frequency="monthly"):
+        """
+        Schedule (or replace) the reminders for a user's next checkup.
+
+        Reminders repeat at the given frequency, with a final one on the
+        checkup date.
+
+        Args:
+            user_id: Unique user identifier
+            email: Address to send reminders to
+            checkup_date: Datetime of the next checkup
+            frequency: "daily", "weekly" or "monthly"
+        """
+        if frequency not in FREQUENCY_INTERVALS:
+            raise ValueError(f"Unknown reminder frequency: {frequency}")
+
+        checkup_at = checkup_date.timestamp()
+        next_fire = self._next_fire(self.clock(), frequency, checkup_at)
+        self.store.upsert(user_id, email, frequency, checkup_at, next_fire)
+
+        # Let the timer loop recompute its sleep in case this one is earlier
+        self._wakeup.set()
+
+    def cancel(self, user_id):
+        """
+        Cancel the pending reminders of a user.
+        """
+        self.store.remove(user_id)
+
+    def run_pending(self, now=None):
+        """
+        Deliver every reminder that is due.
+
+        Args:
+            now: Current Unix timestamp (default: the scheduler clock)
+
+        Returns:
+            Number of reminders delivered
+        """
+        now = self.clock() if now is None else now
+        delivered = 0
+
+        while True:
+            due, claimed_until = self.store.claim(now, self.batch_size)
+            if not due:
+                break
+
+            notifications = [self._build_notification(reminder, now) for reminder in due]
+            try:
+                self.transport.send_batch(notifications)
+            except Exception as e:
+                # Leave the batch in the queue and try again later
+                print(f"Reminder delivery failed, retrying in {RETRY_DELAY}s: {e}")
+                self.store.complete(
+                    [(reminder["user_id"], now + RETRY_DELAY) for reminder in due], [], claimed_until
+                )
+                break
+
+            rescheduled = []
+            finished = []
+            for reminder in due:
+                if reminder["next_fire"] >= reminder["checkup_at"] or reminder["checkup_at"] <= now:
+                    # The checkup day reminder was the last one
+                    finished.append(reminder["user_id"])
+                else:
+                    next_fire = self._next_fire(now, reminder["frequency"], reminder["checkup_at"])
+                    rescheduled.append((reminder["user_id"], next_fire))
+            self.store.complete(rescheduled, finished, claimed_until)
+
+            delivered += len(due)
+            if len(due) < self.batch_size:
+                break
+
+        return delivered
+
+    def start(self):
+        """
+        Start the timer thread (no-op if already running).
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """
+        Stop the timer thread.
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        """
+        Timer loop: sleep until the earliest reminder is due, then deliver.
+        """
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            self.run_pending()
+
+            next_fire = self.store.next_fire_time()
+            timeout = None if next_fire is None else max(0.0, next_fire - self.clock())
+            self._wakeup.wait(timeout)
+
+    @staticmethod
+    def _next_fire(after, frequency, checkup_at):
+        """
+        Next reminder time after a given time, capped at the checkup.
+        """
+        return min(after + FREQUENCY_INTERVALS[frequency], checkup_at)
+
+    @staticmethod
+    def _build_notification(reminder, now):
+        """
+        Build the notification sent for a due reminder.
+        """
+        checkup = datetime.fromtimestamp(reminder["checkup_at"])
+        days_until = max(0, int((reminder["checkup_at"] - now) // (24 * 3600)))
+
+        if days_until == 0:
+            body = f"Your dental checkup is scheduled for today ({checkup.strftime('%B %d, %Y')})."
+        else:
+            body = f"Your next dental checkup is in {days_until} days ({checkup.strftime('%B %d, %Y')})."
+
+        return {
+            "user_id": reminder["user_id"],
+            "email": reminder["email"],
+            "subject": "Dental Checkup Reminder",
+            "body": body,
+            "checkup_at": checkup.isoformat(),
+            "sent_at": datetime.fromtimestamp(now).isoformat()
+        }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+_secret = None
+
+
+def _get_secret():
+    """
+    Secret used to derive user ids, from DENTAL_REMINDER_SECRET or a key
+    file created on first use.
+    """
+    global _secret
+
+    if _secret is None:
+        secret = os.environ.get("DENTAL_REMINDER_SECRET")
+        if secret:
+            _secret = secret.encode("utf-8")
+        else:
+            try:
+                with open(DEFAULT_SECRET_PATH, "rb") as f:
+                    _secret = f.read()
+            except FileNotFoundError:
+                os.makedirs(DATA_DIR, exist_ok=True)
+                _secret = secrets.token_bytes(32)
+                with open(DEFAULT_SECRET_PATH, "wb") as f:
+                    f.write(_secret)
+
+    return _secret
+
+
+def reminder_user_id(email):
+    """
+    Opaque, stable user id for an email address.
+
+    The id is used as the reminder key and in calendar feed URLs, so it
+    must not be guessable from the email alone.
+
+    Args:
+        email: User's email address
+
+    Returns:
+        Hex string identifying the user
+    """
+    normalized = email.strip().lower().encode("utf-8")
+    return hmac.new(_get_secret(), normalized, hashlib.sha256).hexdigest()[:32]
+
+
+def get_reminder_scheduler():
+    """
+    Get the process-wide reminder scheduler, starting it on first use.
+
+    Configured through environment variables:
+        DENTAL_REMINDER_DB: SQLite database path
+        DENTAL_REMINDER_SMTP_HOST / _PORT / _SENDER: send real emails;
+            otherwise reminders are appended to DENTAL_REMINDER_OUTBOX
+
+    Returns:
+        The running ReminderScheduler
+    """
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            store = ReminderStore(os.environ.get("DENTAL_REMINDER_DB", DEFAULT_DB_PATH))
+
+            smtp_host = os.environ.get("DENTAL_REMINDER_SMTP_HOST")
+            if smtp_host:
+                transport = SMTPTransport(
+                    host=smtp_host,
+                    port=int(os.environ.get("DENTAL_REMINDER_SMTP_PORT", 25)),
+                    sender=os.environ.get("DENTAL_REMINDER_SMTP_SENDER", "reminders@dentalapp.example.com")
+                )
+            else:
+                transport = FileTransport(os.environ.get("DENTAL_REMINDER_OUTBOX", DEFAULT_OUTBOX_PATH))
+
+            _scheduler = ReminderScheduler(store, transport)
+            _scheduler.start()
+
+    return _scheduler
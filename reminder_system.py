@@ -2,6 +2,8 @@ import streamlit as st
 from datetime import datetime, timedelta
 import json
 import os
+from reminder_scheduler import get_reminder_scheduler, reminder_user_id
+from calendar_export import checkup_uid, format_calendar, format_vevent, start_feed_server
 
 class DentalReminderSystem:
     """
@@ -50,6 +52,40 @@ class DentalReminderSystem:
             date: Datetime object for the next checkup
         """
         st.session_state.next_checkup_date = date
+        self.sync_scheduled_reminder()
+    
+    def sync_scheduled_reminder(self):
+        """
+        Bring the background reminder scheduler in line with this session.
+        
+        The scheduler is only updated when the email, frequency or checkup
+        date changed, so reruns don't keep pushing the next reminder back.
+        """
+        email = st.session_state.get("reminder_email", "")
+        checkup_date = st.session_state.get("next_checkup_date")
+        
+        # The calendar feed shows the checkup whether or not reminders are on
+        checkup = (email, checkup_date) if email and checkup_date is not None else None
+        if checkup is not None and checkup != st.session_state.get("recorded_checkup"):
+            get_reminder_scheduler().store.set_checkup(reminder_user_id(email), checkup_date.timestamp())
+            st.session_state.recorded_checkup = checkup
+        
+        if st.session_state.get("reminders_enabled") and email and checkup_date is not None:
+            wanted = (email, st.session_state.reminder_frequency, checkup_date)
+        else:
+            wanted = None
+        
+        scheduled = st.session_state.get("scheduled_reminder")
+        if wanted == scheduled:
+            return
+        
+        scheduler = get_reminder_scheduler()
+        if scheduled is not None and (wanted is None or wanted[0] != scheduled[0]):
+            scheduler.cancel(reminder_user_id(scheduled[0]))
+        if wanted is not None:
+            scheduler.schedule(reminder_user_id(email), email, checkup_date, wanted[1])
+        
+        st.session_state.scheduled_reminder = wanted
     
     def get_next_checkup_date(self):
         """
@@ -84,36 +120,41 @@ class DentalReminderSystem:
             return None
         
         checkup_date = st.session_state.next_checkup_date
-        end_date = checkup_date + timedelta(hours=1)  # Assume 1-hour appointment
-        
-        # Format dates for iCalendar
-        start_str = checkup_date.strftime("%Y%m%dT%H%M%S")
-        end_str = end_date.strftime("%Y%m%dT%H%M%S")
-        now_str = datetime.now().strftime("%Y%m%dT%H%M%S")
+        user_id = reminder_user_id(st.session_state.get("reminder_email") or "anonymous")
         
         # Create iCalendar content
-        ical_content = f"""BEGIN:VCALENDAR
-VERSION:2.0
-PRODID:-//Dental Decay Detector//Dental Checkup//EN
-CALSCALE:GREGORIAN
-BEGIN:VEVENT
-DTSTART:{start_str}
-DTEND:{end_str}
-DTSTAMP:{now_str}
-UID:dentalcheckup{start_str}@dentalapp.example.com
-CREATED:{now_str}
-DESCRIPTION:Scheduled dental checkup based on your Dental Decay Detector app recommendation.
-LAST-MODIFIED:{now_str}
-LOCATION:Your Dentist's Office
-SEQUENCE:0
-STATUS:CONFIRMED
-SUMMARY:Dental Checkup Appointment
-TRANSP:OPAQUE
-END:VEVENT
-END:VCALENDAR
-"""
+        ical_content = format_calendar([format_vevent(checkup_uid(user_id, checkup_date), checkup_date)])
         return ical_content
     
+    def get_feed_url(self):
+        """
+        Get the calendar subscription URL for this session's email.
+        
+        Feeds are served only when DENTAL_CALENDAR_URL (the public base URL
+        of the feed server) is set. DENTAL_CALENDAR_HOST and
+        DENTAL_CALENDAR_PORT select the interface (default 127.0.0.1) and
+        port; DENTAL_CALENDAR_CLINIC_TOKEN enables the clinic-wide export
+        for requests bearing that token.
+        
+        Returns:
+            Feed URL or None if feeds are not enabled or the feed server
+            could not start
+        """
+        base_url = os.environ.get("DENTAL_CALENDAR_URL")
+        email = st.session_state.get("reminder_email")
+        if not base_url or not email:
+            return None
+        
+        server = start_feed_server(
+            get_reminder_scheduler().store,
+            host=os.environ.get("DENTAL_CALENDAR_HOST", "127.0.0.1"),
+            port=int(os.environ.get("DENTAL_CALENDAR_PORT", 8502)),
+            clinic_token=os.environ.get("DENTAL_CALENDAR_CLINIC_TOKEN")
+        )
+        if server is None:
+            return None
+        return f"{base_url.rstrip('/')}/calendar/{reminder_user_id(email)}.ics"
+    
     def display_reminder_ui(self):
         """
         Display UI for managing reminders.
@@ -133,7 +174,7 @@ END:VCALENDAR
         # Enable/disable reminders with default value
         reminders_enabled = st.toggle(
             "Enable Checkup Reminders", 
-            value=False
+            value=st.session_state.reminders_enabled
         )
         self.enable_reminders(reminders_enabled)
         
@@ -150,7 +191,7 @@ END:VCALENDAR
             frequency = st.select_slider(
                 "Reminder Frequency",
                 options=["Daily", "Weekly", "Monthly"],
-                value="Monthly"  # Default to monthly
+                value=st.session_state.reminder_frequency.capitalize()  # Monthly by default
             )
             self.set_reminder_frequency(frequency.lower())
             
@@ -165,15 +206,24 @@ END:VCALENDAR
                     st.info(f"🦷 Your next dental checkup is in {days_until} days ({next_date}).")
                 
                 # Add calendar button
-                if st.button("Add to Calendar"):
-                    ical_content = self.generate_ical_file()
-                    if ical_content:
-                        # In a real app, we would serve this file for download
-                        # Since we can't do actual downloads in this demo, just show confirmation
-                        st.success("Calendar event generated! In a production app, this would download an .ics file you can import to your calendar.")
+                ical_content = self.generate_ical_file()
+                if ical_content:
+                    st.download_button(
+                        "Add to Calendar",
+                        data=ical_content,
+                        file_name="dental_checkup.ics",
+                        mime="text/calendar"
+                    )
+                
+                # Subscription feed, when a public feed URL is configured
+                feed_url = self.get_feed_url()
+                if feed_url and email:
+                    st.caption(f"Subscribe to all your checkups: {feed_url}")
             else:
                 st.warning("No checkup scheduled yet. Complete a dental scan for a recommended date.")
         
+        self.sync_scheduled_reminder()
+        
         st.markdown("---")
         
         # Reminder settings explanation
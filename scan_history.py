@@ -0,0 +1,228 @@
+import io
+import numpy as np
+from lazy_imports import lazy_module
+from dental_report import ISSUES
+
+pd = lazy_module("pandas")
+pa = lazy_module("pyarrow")
+
+# Format of the timestamp strings in history entries
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class ScanHistory:
+    """
+    Scan history stored by column, usable as the list of entry dicts it replaces.
+
+    Next to the entries themselves, every append fills typed columns:
+    datetime64 timestamps, a float32 score matrix (NaN where an issue is
+    missing), scan ids, and references to the images. The columns grow
+    by doubling, so appends are amortized O(1), and the scores,
+    timestamps, DataFrame and Arrow views share their memory with the
+    store instead of copying it.
+
+    Iterating, indexing, len(), append() and extend() behave like the
+    list of dicts, so existing code keeps working; vectorized consumers
+    read the columns instead of the dicts.
+    """
+
+    def __init__(self, entries=None, issues=ISSUES, capacity=64):
+        """
+        Initialize the history.
+
+        Args:
+            entries: Optional iterable of history entry dicts to start with
+            issues: Issue columns of the score matrix
+            capacity: Initial number of rows allocated
+        """
+        self.issues = tuple(issues)
+        self._entries = []
+        self._timestamps = np.empty(capacity, dtype="datetime64[s]")
+        # One contiguous row per issue, so each issue column is contiguous
+        self._scores = np.empty((len(self.issues), capacity), dtype=np.float32)
+        self._scan_ids = np.empty(capacity, dtype=object)
+        if entries is not None:
+            self.extend(entries)
+
+    def _reserve(self, count):
+        """
+        Grow the columns, doubling, to hold at least count rows.
+        """
+        capacity = len(self._timestamps)
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+        size = len(self._entries)
+
+        timestamps = np.empty(capacity, dtype=self._timestamps.dtype)
+        timestamps[:size] = self._timestamps[:size]
+        scores = np.empty((len(self.issues), capacity), dtype=np.float32)
+        scores[:, :size] = self._scores[:, :size]
+        scan_ids = np.empty(capacity, dtype=object)
+        scan_ids[:size] = self._scan_ids[:size]
+        self._timestamps, self._scores, self._scan_ids = timestamps, scores, scan_ids
+
+    def append(self, entry):
+        """
+        Add a history entry.
+
+        Args:
+            entry: Dictionary with "timestamp" (TIMESTAMP_FORMAT string),
+                "results" (issue scores) and optionally "scan_id", "image"
+                and other fields, which are kept as they are
+        """
+        row = len(self._entries)
+        self._reserve(row + 1)
+        results = entry.get("results") or {}
+        self._timestamps[row] = np.datetime64(entry["timestamp"], "s")
+        self._scores[:, row] = [results.get(issue, np.nan) for issue in self.issues]
+        self._scan_ids[row] = entry.get("scan_id")
+        self._entries.append(entry)
+
+    def extend(self, entries):
+        """
+        Add several history entries.
+        """
+        entries = list(entries)
+        self._reserve(len(self._entries) + len(entries))
+        for entry in entries:
+            self.append(entry)
+
+    def clear(self):
+        """
+        Remove all entries; the allocated columns are kept.
+        """
+        self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __reversed__(self):
+        return reversed(self._entries)
+
+    def __getitem__(self, index):
+        return self._entries[index]
+
+    def __repr__(self):
+        return f"ScanHistory({len(self)} scans)"
+
+    def __getstate__(self):
+        # Only the entries are pickled; the columns are rebuilt from them
+        return {"issues": self.issues, "entries": self._entries}
+
+    def __setstate__(self, state):
+        self.__init__(state["entries"], state["issues"])
+
+    def find(self, scan_id):
+        """
+        The most recent entry with a scan id, or None if there is none.
+        """
+        rows = np.flatnonzero(self.scan_ids == scan_id)
+        return self._entries[rows[-1]] if len(rows) else None
+
+    @property
+    def timestamps(self):
+        """
+        Scan times as a datetime64[s] array (a view, do not modify).
+        """
+        return self._timestamps[:len(self._entries)]
+
+    @property
+    def scores(self):
+        """
+        Issue scores as an (N, len(issues)) float32 array (a view).
+        """
+        return self._scores[:, :len(self._entries)].T
+
+    @property
+    def scan_ids(self):
+        """
+        Scan ids as an object array, None for entries without one (a view).
+        """
+        return self._scan_ids[:len(self._entries)]
+
+    @property
+    def images(self):
+        """
+        The image of each entry, None where there is none.
+        """
+        return [entry.get("image") for entry in self._entries]
+
+    def score_series(self, issue):
+        """
+        Scores of one issue as a contiguous float32 array (a view).
+        """
+        return self._scores[self.issues.index(issue), :len(self._entries)]
+
+    def to_pandas(self):
+        """
+        The history as a DataFrame with scan_id, timestamp and issue columns.
+
+        The timestamp and score columns wrap the store's arrays without
+        copying; images stay in the store, referenced by row position.
+
+        Returns:
+            pandas DataFrame, one row per scan
+        """
+        size = len(self._entries)
+        columns = {"scan_id": self._scan_ids[:size], "timestamp": self._timestamps[:size]}
+        for issue in self.issues:
+            columns[issue] = self.score_series(issue)
+        return pd.DataFrame(columns, copy=False)
+
+    def to_arrow(self):
+        """
+        The history as an Arrow table (requires pyarrow).
+
+        Timestamp and score buffers are shared with the store; the scan id
+        strings are converted.
+
+        Returns:
+            pyarrow.Table with the columns of to_pandas
+        """
+        size = len(self._entries)
+        columns = {
+            "scan_id": pa.array(self._scan_ids[:size].tolist(), type=pa.string()),
+            "timestamp": pa.array(self._timestamps[:size]),
+        }
+        for issue in self.issues:
+            columns[issue] = pa.array(self.score_series(issue))
+        return pa.table(columns)
+
+    def to_parquet(self, path=None):
+        """
+        Export the history to Parquet (requires pyarrow).
+
+        Args:
+            path: File path or binary file object; None to return the bytes
+
+        Returns:
+            Parquet file contents if path is None, else None
+        """
+        # Imported here: pyarrow.parquet is a separate, heavy module
+        import pyarrow.parquet as pq
+
+        if path is not None:
+            pq.write_table(self.to_arrow(), path)
+            return None
+        buffer = io.BytesIO()
+        pq.write_table(self.to_arrow(), buffer)
+        return buffer.getvalue()
+
+    def to_csv(self, path=None):
+        """
+        Export the history to CSV.
+
+        Args:
+            path: File path or text file object; None to return the text
+
+        Returns:
+            CSV text if path is None, else None
+        """
+        frame = self.to_pandas()
+        frame["timestamp"] = frame["timestamp"].dt.strftime(TIMESTAMP_FORMAT)
+        return frame.to_csv(path, index=False, float_format="%.2f")
@@ -0,0 +1,493 @@
+import hashlib
+import io
+import os
+import pickle
+import re
+import secrets
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+import numpy as np
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_DB_PATH = os.path.join(DATA_DIR, "sessions.db")
+DEFAULT_FILE_DIR = os.path.join(DATA_DIR, "sessions")
+
+# Arrays of at least this many bytes (images) are stored once, as blobs,
+# and referenced from the pickled state instead of being embedded in it
+BLOB_MIN_BYTES = 16 * 1024
+
+# Sessions whose stored digests are remembered between flushes
+KNOWN_SESSIONS = 1024
+
+_SESSION_ID = re.compile(r"[0-9a-f]{32}")
+
+
+def new_session_id():
+    """
+    Create an unguessable session id; anyone holding it can load the session.
+    """
+    return secrets.token_hex(16)
+
+
+def valid_session_id(session_id):
+    """
+    Whether a string (e.g. from the URL) is a well-formed session id.
+    """
+    return isinstance(session_id, str) and _SESSION_ID.fullmatch(session_id) is not None
+
+
+def _prefix_end(prefix):
+    """
+    Smallest string greater than every string starting with prefix.
+    """
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class MemoryBackend:
+    """
+    Key-value backend held in process memory.
+
+    A local stand-in for a networked key-value store: it has the same
+    three operations a Redis or Memcached backend would implement, with
+    write() as one pipelined round trip. State survives reruns and
+    reconnects, but not a restart, and is not shared between processes.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def items(self, prefix):
+        """
+        All keys starting with prefix and their values, in one round trip.
+        """
+        with self._lock:
+            return {key: value for key, value in self._data.items() if key.startswith(prefix)}
+
+    def write(self, items, deleted=()):
+        """
+        Set and delete keys in one round trip.
+
+        Args:
+            items: Dictionary of key to bytes
+            deleted: Keys to remove
+        """
+        with self._lock:
+            self._data.update(items)
+            for key in deleted:
+                self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        """
+        Remove all keys starting with prefix.
+        """
+        with self._lock:
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                del self._data[key]
+
+
+class SQLiteBackend:
+    """
+    Key-value backend in a SQLite database, for replicas on one node.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        """
+        Open (and create if needed) the session database.
+
+        Args:
+            path: SQLite database file, or ":memory:"
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            if path != ":memory:":
+                # Readers in other processes do not block the writer
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS session_kv (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    updated REAL NOT NULL
+                ) WITHOUT ROWID
+            """)
+
+    def items(self, prefix):
+        """
+        All keys starting with prefix and their values, in one query.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM session_kv WHERE key >= ? AND key < ?",
+                (prefix, _prefix_end(prefix))
+            ).fetchall()
+        return dict(rows)
+
+    def write(self, items, deleted=()):
+        """
+        Set and delete keys in one transaction.
+
+        Args:
+            items: Dictionary of key to bytes
+            deleted: Keys to remove
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                """
+                INSERT INTO session_kv (key, value, updated) VALUES (?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated = excluded.updated
+                """,
+                [(key, value, now) for key, value in items.items()]
+            )
+            self._conn.executemany("DELETE FROM session_kv WHERE key = ?", [(key,) for key in deleted])
+
+    def delete_prefix(self, prefix):
+        """
+        Remove all keys starting with prefix.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM session_kv WHERE key >= ? AND key < ?", (prefix, _prefix_end(prefix))
+            )
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        with self._lock:
+            self._conn.close()
+
+
+class FileBackend:
+    """
+    Key-value backend with one file per key, for a shared or local volume.
+
+    Keys are ":"-separated path segments, so each session gets its own
+    directory. Files are replaced atomically, so readers never see a
+    partial value.
+    """
+
+    def __init__(self, directory=DEFAULT_FILE_DIR):
+        """
+        Args:
+            directory: Root directory of the store
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, *key.split(":"))
+
+    def items(self, prefix):
+        """
+        All keys starting with prefix and their values.
+
+        The prefix must end with ":", i.e. name a directory.
+        """
+        root = self._path(prefix.rstrip(":"))
+        result = {}
+        for folder, _, files in os.walk(root):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(folder, name)
+                key = os.path.relpath(path, self.directory).replace(os.sep, ":")
+                try:
+                    with open(path, "rb") as f:
+                        result[key] = f.read()
+                except FileNotFoundError:
+                    # Deleted by another replica meanwhile
+                    continue
+        return result
+
+    def write(self, items, deleted=()):
+        """
+        Set and delete keys.
+
+        Args:
+            items: Dictionary of key to bytes
+            deleted: Keys to remove
+        """
+        for key, value in items.items():
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = f"{path}.{secrets.token_hex(4)}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(value)
+            os.replace(temporary, path)
+        for key in deleted:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def delete_prefix(self, prefix):
+        """
+        Remove all keys starting with prefix (a directory, ending with ":").
+        """
+        # Imported here: only needed when sessions are deleted
+        import shutil
+
+        shutil.rmtree(self._path(prefix.rstrip(":")), ignore_errors=True)
+
+
+class _StatePickler(pickle.Pickler):
+    """
+    Pickler storing large arrays as blob references.
+    """
+
+    def __init__(self, file, store, blobs):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._store = store
+        self._blobs = blobs
+
+    def persistent_id(self, obj):
+        if (isinstance(obj, np.ndarray) and obj.nbytes >= self._store.blob_min_bytes
+                and not obj.dtype.hasobject):
+            digest = self._store._blob_digest(obj)
+            self._blobs[digest] = obj
+            return ("blob", digest)
+        return None
+
+
+class _StateUnpickler(pickle.Unpickler):
+    """
+    Unpickler resolving blob references from the loaded blobs.
+    """
+
+    def __init__(self, file, blobs, arrays):
+        super().__init__(file)
+        self._blobs = blobs
+        self._arrays = arrays
+        self.refs = set()
+
+    def persistent_load(self, pid):
+        kind, digest = pid
+        if kind != "blob":
+            raise pickle.UnpicklingError(f"Unknown persistent id {kind!r}")
+        self.refs.add(digest)
+        # An image referenced from several keys is loaded once
+        if digest not in self._arrays:
+            array = np.load(io.BytesIO(self._blobs[digest]), allow_pickle=False)
+            array.flags.writeable = False
+            self._arrays[digest] = array
+        return self._arrays[digest]
+
+
+class SessionStore:
+    """
+    Session state kept in an external key-value backend.
+
+    Each state key is pickled to its own value, "<session id>:<key>",
+    with large arrays stored once as "<session id>:blob:<digest>" and
+    referenced by digest. A flush compares every key with what was
+    last stored and sends only the changed keys and new blobs, plus the
+    deletion of blobs nothing refers to any more, in one backend write.
+
+    Arrays stored as blobs are made read-only, so their digest can be
+    remembered instead of re-hashing every image on every flush.
+    """
+
+    def __init__(self, backend, blob_min_bytes=BLOB_MIN_BYTES):
+        """
+        Args:
+            backend: MemoryBackend, SQLiteBackend, FileBackend or another
+                object with items(), write() and delete_prefix()
+            blob_min_bytes: Size from which arrays are stored as blobs
+        """
+        self.backend = backend
+        self.blob_min_bytes = blob_min_bytes
+        self._lock = threading.Lock()
+        # session id -> {"digests": {key: digest}, "refs": {key: blob digests}, "blobs": set}
+        self._sessions = OrderedDict()
+        # id(array) -> (weak reference, digest) of read-only arrays
+        self._array_digests = {}
+
+    def _blob_digest(self, array):
+        """
+        Content digest of an array, cached for arrays that own their data.
+        """
+        with self._lock:
+            cached = self._array_digests.get(id(array))
+        if cached is not None and cached[0]() is array:
+            return cached[1]
+
+        digest = hashlib.blake2b(f"{array.dtype.str}{array.shape}".encode(), digest_size=16)
+        digest.update(np.ascontiguousarray(array).data)
+        digest = digest.hexdigest()
+
+        if array.flags.owndata:
+            # The digest stays valid as long as the contents cannot change
+            array.flags.writeable = False
+            self._cache_digest(array, digest)
+        return digest
+
+    def _cache_digest(self, array, digest):
+        key = id(array)
+        reference = weakref.ref(array, lambda _, key=key: self._forget_array(key))
+        with self._lock:
+            self._array_digests[key] = (reference, digest)
+
+    def _forget_array(self, key):
+        with self._lock:
+            cached = self._array_digests.get(key)
+            if cached is not None and cached[0]() is None:
+                del self._array_digests[key]
+
+    def _dumps(self, value, blobs):
+        buffer = io.BytesIO()
+        _StatePickler(buffer, self, blobs).dump(value)
+        return buffer.getvalue()
+
+    def _remember(self, session_id, known):
+        with self._lock:
+            self._sessions[session_id] = known
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > KNOWN_SESSIONS:
+                self._sessions.popitem(last=False)
+
+    def load(self, session_id):
+        """
+        Read a session's state.
+
+        Args:
+            session_id: Session id from new_session_id
+
+        Returns:
+            Dictionary of state key to value; empty for an unknown session
+        """
+        prefix = f"{session_id}:"
+        stored = self.backend.items(prefix)
+        blobs = {
+            key[len(prefix) + 5:]: value for key, value in stored.items() if key.startswith(f"{prefix}blob:")
+        }
+
+        state = {}
+        known = {"digests": {}, "refs": {}, "blobs": set(blobs)}
+        arrays = {}
+        for key, value in stored.items():
+            name = key[len(prefix):]
+            if name.startswith("blob:"):
+                continue
+            unpickler = _StateUnpickler(io.BytesIO(value), blobs, arrays)
+            try:
+                state[name] = unpickler.load()
+            except Exception:
+                # Unreadable (e.g. a class changed shape); start that key afresh
+                continue
+            known["digests"][name] = hashlib.blake2b(value, digest_size=16).digest()
+            known["refs"][name] = unpickler.refs
+
+        # Loaded arrays are read-only, so their digests can be kept
+        for digest, array in arrays.items():
+            self._cache_digest(array, digest)
+
+        self._remember(session_id, known)
+        return state
+
+    def flush(self, session_id, state, keys):
+        """
+        Store the changed keys of a session in one backend write.
+
+        Args:
+            session_id: Session id
+            state: Mapping holding the values (e.g. st.session_state)
+            keys: State keys to persist; keys missing from state are skipped
+
+        Returns:
+            Number of keys and blobs written or deleted
+        """
+        with self._lock:
+            known = self._sessions.get(session_id)
+        if known is None:
+            # Not seen by this process yet (or forgotten): learn what is stored
+            self.load(session_id)
+            with self._lock:
+                known = self._sessions[session_id]
+
+        prefix = f"{session_id}:"
+        items, digests, refs, new_blobs = {}, {}, {}, {}
+        for name in keys:
+            if name not in state:
+                continue
+            blobs = {}
+            data = self._dumps(state[name], blobs)
+            digest = hashlib.blake2b(data, digest_size=16).digest()
+            refs[name] = set(blobs)
+            if known["digests"].get(name) != digest:
+                items[prefix + name] = data
+                digests[name] = digest
+            for blob, array in blobs.items():
+                if blob not in known["blobs"] and blob not in new_blobs:
+                    new_blobs[blob] = array
+
+        for blob, array in new_blobs.items():
+            buffer = io.BytesIO()
+            np.save(buffer, array, allow_pickle=False)
+            items[f"{prefix}blob:{blob}"] = buffer.getvalue()
+
+        # Blobs of replaced values (e.g. images of a cleared history)
+        referenced = set().union(*{**known["refs"], **refs}.values())
+        orphans = known["blobs"] - referenced
+        deleted = [f"{prefix}blob:{blob}" for blob in orphans]
+
+        if not items and not deleted:
+            return 0
+        self.backend.write(items, deleted)
+
+        known["digests"].update(digests)
+        known["refs"].update(refs)
+        known["blobs"] = (known["blobs"] | set(new_blobs)) - orphans
+        return len(items) + len(deleted)
+
+    def delete(self, session_id):
+        """
+        Remove a session and its blobs from the backend.
+        """
+        self.backend.delete_prefix(f"{session_id}:")
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """
+    The process-wide session store, or None if sessions are not shared.
+
+    Configured through environment variables:
+        DENTAL_SESSION_STORE: "sqlite", "file" or "memory"; unset keeps
+            sessions in process memory only
+        DENTAL_SESSION_PATH: Database file (sqlite) or directory (file)
+
+    Raises:
+        ValueError: If DENTAL_SESSION_STORE names an unknown backend
+    """
+    global _store
+    kind = os.environ.get("DENTAL_SESSION_STORE", "").lower()
+    if not kind:
+        return None
+
+    with _store_lock:
+        if _store is None:
+            path = os.environ.get("DENTAL_SESSION_PATH")
+            if kind == "sqlite":
+                backend = SQLiteBackend(path or DEFAULT_DB_PATH)
+            elif kind == "file":
+                backend = FileBackend(path or DEFAULT_FILE_DIR)
+            elif kind == "memory":
+                backend = MemoryBackend()
+            else:
+                raise ValueError(f"Unknown session store {kind!r}; use sqlite, file or memory")
+            _store = SessionStore(backend)
+        return _store
@@ -0,0 +1,323 @@
+from functools import lru_cache
+import numpy as np
+from lazy_imports import lazy_module
+from instrumentation import timed
+from tooth_visualization import tooth_surfaces, marker_color
+
+cv2 = lazy_module("cv2")
+
+# Default snapshot size as (width, height), in pixels
+SNAPSHOT_SIZE = (320, 320)
+
+# Camera direction in degrees, close to the default view of the
+# interactive model (eye at (1.5, 1.5, 1))
+VIEW_ELEVATION = 25.0
+VIEW_AZIMUTH = 45.0
+
+# Fraction of the image left empty around the tooth
+MARGIN = 0.06
+
+# Share of the light that reaches surfaces facing away from the lamp
+AMBIENT = 0.35
+
+SURFACE_COLORS = {
+    "crown": (158, 202, 225),
+    "root": (189, 189, 189),
+}
+
+MARKER_COLORS = {
+    "red": (230, 40, 40),
+    "orange": (255, 150, 20),
+    "yellow": (250, 220, 30),
+}
+
+# Marker sizes are Plotly pixel diameters for a figure about this tall
+MARKER_REFERENCE_HEIGHT = 450
+
+# Bounding boxes of triangles are rounded up to multiples of this many
+# pixels to group them for rasterization
+TILE = 4
+
+# Number of distinct marker sets whose snapshots are kept
+SNAPSHOT_CACHE_SIZE = 64
+
+
+def _view_basis(elevation=VIEW_ELEVATION, azimuth=VIEW_AZIMUTH):
+    """
+    Unit vectors (right, up, towards the viewer) of the orthographic camera.
+    """
+    elevation, azimuth = np.radians(elevation), np.radians(azimuth)
+    eye = np.array([
+        np.cos(elevation) * np.cos(azimuth),
+        np.cos(elevation) * np.sin(azimuth),
+        np.sin(elevation),
+    ])
+    right = np.cross(-eye, [0.0, 0.0, 1.0])
+    right /= np.linalg.norm(right)
+    up = np.cross(right, -eye)
+    return right, up, eye
+
+
+@lru_cache(maxsize=1)
+def _tooth_mesh():
+    """
+    Triangulate the crown and root grids.
+
+    Returns:
+        vertices: (V, 3) positions
+        triangles: (T, 3) vertex indices, wound so that the normals point
+            out of each (closed) surface
+        colors: (T, 3) RGB color of each triangle
+    """
+    vertices, triangles, colors = [], [], []
+    offset = 0
+    for name, grids in tooth_surfaces().items():
+        rows, cols = grids[0].shape
+        points = np.stack([grid.ravel() for grid in grids], axis=1)
+        vertices.append(points)
+
+        # Two triangles per grid cell
+        index = np.arange(rows * cols).reshape(rows, cols)
+        a, b = index[:-1, :-1].ravel(), index[1:, :-1].ravel()
+        c, d = index[1:, 1:].ravel(), index[:-1, 1:].ravel()
+        cells = np.concatenate([np.stack([a, b, c], axis=1), np.stack([a, c, d], axis=1)])
+
+        # Flip the triangles whose normal points towards the axis
+        corners = points[cells]
+        normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        outward = corners.mean(axis=1) - [0.0, 0.0, points[:, 2].mean()]
+        inverted = np.einsum("ij,ij->i", normals, outward) < 0
+        cells[inverted] = cells[inverted][:, ::-1]
+
+        triangles.append(cells + offset)
+        colors.append(np.tile(SURFACE_COLORS[name], (len(cells), 1)))
+        offset += rows * cols
+
+    return np.concatenate(vertices), np.concatenate(triangles), np.concatenate(colors).astype(np.float32)
+
+
+def _rasterize(screen, depth, triangles, width, height):
+    """
+    Rasterize front-facing triangles into a z-buffer.
+
+    Triangles are grouped by bounding-box size (rounded up to TILE
+    pixels), and each group is rasterized as one array operation over
+    all of its candidate pixels.
+
+    Args:
+        screen: (V, 2) vertex positions in pixels, y pointing down
+        depth: (V,) vertex depths, larger is closer to the viewer
+        triangles: (T, 3) vertex indices, wound outwards
+        width: Image width
+        height: Image height
+
+    Returns:
+        zbuffer: (height, width) depth of the nearest surface, -inf if empty
+        faces: (height, width) index of the visible triangle, -1 if empty
+    """
+    # Single precision is plenty at image scale and halves the memory traffic
+    screen, depth = screen.astype(np.float32), depth.astype(np.float32)
+    p0, p1, p2 = (screen[triangles[:, k]] for k in range(3))
+    d0, d1, d2 = (depth[triangles[:, k]] for k in range(3))
+    # Twice the signed screen area; with y pointing down, outward-wound
+    # triangles facing the viewer come out negative
+    area = (p1[:, 0] - p0[:, 0]) * (p2[:, 1] - p0[:, 1]) - (p1[:, 1] - p0[:, 1]) * (p2[:, 0] - p0[:, 0])
+
+    corners = np.stack([p0, p1, p2])
+    low = np.clip(np.floor(corners.min(axis=0) - 0.5), 0, [width - 1, height - 1]).astype(np.int64)
+    high = np.clip(np.ceil(corners.max(axis=0) - 0.5), 0, [width - 1, height - 1]).astype(np.int64)
+    tiles = (high - low) // TILE + 1
+
+    # Back faces are hidden by the closed surfaces; degenerate triangles
+    # (the poles of the grids) cover no pixels
+    live = np.flatnonzero(area < -1e-9)
+    groups = {}
+    for triangle, key in zip(live, map(tuple, tiles[live])):
+        groups.setdefault(key, []).append(triangle)
+
+    pixels, depths, owners = [], [], []
+    for (tiles_x, tiles_y), tri in groups.items():
+        tri = np.array(tri)
+        xs = low[tri, 0, None] + np.arange(tiles_x * TILE)
+        ys = low[tri, 1, None] + np.arange(tiles_y * TILE)
+        px = (xs + 0.5).astype(np.float32)[:, None, :]
+        py = (ys + 0.5).astype(np.float32)[:, :, None]
+
+        # Barycentric weights are linear in the pixel position
+        inverse = 1.0 / area[tri]
+        weights = []
+        for a, b in ((p1, p2), (p2, p0)):
+            step_x = (a[tri, 1] - b[tri, 1]) * inverse
+            step_y = (b[tri, 0] - a[tri, 0]) * inverse
+            start = -(step_x * a[tri, 0] + step_y * a[tri, 1])
+            weights.append(step_x[:, None, None] * px + (step_y[:, None, None] * py + start[:, None, None]))
+        w0, w1 = weights
+        w2 = 1.0 - w0 - w1
+        inside = (w0 >= 0) & (w1 >= 0) & (w2 >= 0)
+        inside &= (xs < width)[:, None, :] & (ys < height)[:, :, None]
+
+        z = d2[tri, None, None] + w0 * (d0 - d2)[tri, None, None] + w1 * (d1 - d2)[tri, None, None]
+        pixels.append((ys[:, :, None] * width + xs[:, None, :])[inside])
+        depths.append(z[inside])
+        owners.append(np.broadcast_to(tri[:, None, None], inside.shape)[inside])
+
+    zbuffer = np.full(height * width, -np.inf, dtype=np.float32)
+    faces = np.full(height * width, -1, dtype=np.int64)
+    if pixels:
+        pixels, depths, owners = np.concatenate(pixels), np.concatenate(depths), np.concatenate(owners)
+        np.maximum.at(zbuffer, pixels, depths)
+        # The samples that won the depth test (on exact ties any of them)
+        nearest = depths == zbuffer[pixels]
+        faces[pixels[nearest]] = owners[nearest]
+
+    return zbuffer.reshape(height, width), faces.reshape(height, width)
+
+
+def _render(markers, width, height):
+    """
+    Render the tooth and its markers to an RGBA image.
+
+    Args:
+        markers: Tuple of (x, y, z, size, severity) marker tuples
+        width: Image width
+        height: Image height
+
+    Returns:
+        (height, width, 4) uint8 RGBA image with a transparent background
+    """
+    right, up, eye = _view_basis()
+    # Fixed to the camera: from the upper left, slightly in front
+    light = eye + 0.6 * up - 0.4 * right
+    light /= np.linalg.norm(light)
+
+    vertices, triangles, colors = _tooth_mesh()
+    u, v, depth = vertices @ right, vertices @ up, vertices @ eye
+
+    scale = (1 - 2 * MARGIN) * min(width / np.ptp(u), height / np.ptp(v))
+    u_center, v_center = (u.max() + u.min()) / 2, (v.max() + v.min()) / 2
+
+    def to_screen(u, v):
+        return (u - u_center) * scale + width / 2, height / 2 - (v - v_center) * scale
+
+    screen = np.stack(to_screen(u, v), axis=1)
+    _, faces = _rasterize(screen, depth, triangles, width, height)
+
+    # Flat Lambert shading
+    a, b, c = (vertices[triangles[:, k]] for k in range(3))
+    normals = np.cross(b - a, c - a)
+    normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+    shade = AMBIENT + (1 - AMBIENT) * np.clip(normals @ light, 0, 1)
+    face_colors = colors * shade[:, None].astype(np.float32)
+
+    image = np.zeros((height, width, 4), dtype=np.uint8)
+    covered = faces >= 0
+    image[covered, :3] = face_colors[faces[covered]]
+    image[covered, 3] = 255
+
+    # Markers sit on or just under the translucent surfaces of the
+    # interactive model, so they are drawn over the tooth, as shaded
+    # spheres depth-tested against each other
+    light_view = np.array([light @ right, light @ up, light @ eye])
+    radius_scale = min(width, height) / MARKER_REFERENCE_HEIGHT
+    marker_depth = np.full((height, width), -np.inf)
+    for x, y, z, size, severity in markers:
+        position = np.array([x, y, z])
+        cx, cy = to_screen(position @ right, position @ up)
+        radius = max(1.0, size / 2 * radius_scale)
+
+        x0, x1 = int(max(0, np.floor(cx - radius))), int(min(width, np.ceil(cx + radius) + 1))
+        y0, y1 = int(max(0, np.floor(cy - radius))), int(min(height, np.ceil(cy + radius) + 1))
+        if x0 >= x1 or y0 >= y1:
+            continue
+        dx = (np.arange(x0, x1) + 0.5 - cx)[None, :] / radius
+        dy = (cy - np.arange(y0, y1) - 0.5)[:, None] / radius
+        dz = np.sqrt(np.maximum(1 - dx ** 2 - dy ** 2, 0))
+        inside = dx ** 2 + dy ** 2 <= 1
+
+        sphere_depth = position @ eye + dz * radius / scale
+        window = marker_depth[y0:y1, x0:x1]
+        visible = inside & (sphere_depth > window)
+        window[visible] = sphere_depth[visible]
+
+        intensity = AMBIENT + (1 - AMBIENT) * np.clip(
+            dx * light_view[0] + dy * light_view[1] + dz * light_view[2], 0, 1
+        )
+        rgb = np.array(MARKER_COLORS[marker_color(severity)], dtype=np.float32)
+        patch = image[y0:y1, x0:x1]
+        patch[visible, :3] = intensity[visible, None] * rgb
+        patch[visible, 3] = 255
+
+    return image
+
+
+def marker_key(decay_areas):
+    """
+    Hashable description of a set of decay markers, used as the cache key.
+
+    Args:
+        decay_areas: List of dictionaries with position, size and severity
+
+    Returns:
+        Tuple of (x, y, z, size, severity) tuples
+    """
+    return tuple(
+        tuple(round(float(value), 4) for value in (*area["position"], area["size"], area["severity"]))
+        for area in decay_areas or ()
+    )
+
+
+@lru_cache(maxsize=SNAPSHOT_CACHE_SIZE)
+def _cached_snapshot(markers, width, height):
+    image = _render(markers, width, height)
+    image.flags.writeable = False
+    return image
+
+
+@lru_cache(maxsize=SNAPSHOT_CACHE_SIZE)
+def _cached_png(markers, width, height):
+    # OpenCV expects BGRA
+    ok, encoded = cv2.imencode(".png", cv2.cvtColor(_cached_snapshot(markers, width, height), cv2.COLOR_RGBA2BGRA))
+    if not ok:
+        raise ValueError("Could not encode the tooth snapshot")
+    return encoded.tobytes()
+
+
+@timed("render_tooth_snapshot")
+def render_tooth_snapshot(decay_areas=None, size=SNAPSHOT_SIZE):
+    """
+    Render a still image of the 3D tooth model with a software rasterizer.
+
+    Uses an orthographic projection, a z-buffer and Lambert shading in
+    pure NumPy, so no browser or plotting backend is needed. Snapshots are
+    cached per set of markers; the returned array is shared and read-only.
+
+    Args:
+        decay_areas: List of dictionaries with decay coordinates and severity
+        size: Image size as (width, height)
+
+    Returns:
+        (height, width, 4) uint8 RGBA image with a transparent background
+    """
+    return _cached_snapshot(marker_key(decay_areas), int(size[0]), int(size[1]))
+
+
+def tooth_snapshot_png(decay_areas=None, size=SNAPSHOT_SIZE):
+    """
+    Render the tooth snapshot as PNG bytes (for emails and thumbnails).
+
+    Args:
+        decay_areas: List of dictionaries with decay coordinates and severity
+        size: Image size as (width, height)
+
+    Returns:
+        PNG file contents as bytes
+    """
+    return _cached_png(marker_key(decay_areas), int(size[0]), int(size[1]))
+
+
+def clear_snapshot_cache():
+    """
+    Drop all cached snapshots.
+    """
+    _cached_png.cache_clear()
+    _cached_snapshot.cache_clear()
@@ -1,17 +1,35 @@
 import numpy as np
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import random
+from functools import lru_cache
+from lazy_imports import lazy_module
+from instrumentation import timed
 
-def generate_3d_tooth_model(decay_areas=None):
+go = lazy_module("plotly.graph_objects")
+plotly_subplots = lazy_module("plotly.subplots")
+
+# Compact figures round coordinates to this step, in model units
+COMPACT_STEP = 1e-3
+
+def marker_color(severity):
     """
-    Generate a 3D model of a tooth with optional decay areas highlighted.
+    Color name of a decay marker for its severity.
+    """
+    if severity > 75:
+        return 'red'
+    elif severity > 50:
+        return 'orange'
+    return 'yellow'
+
+@lru_cache(maxsize=1)
+def tooth_surfaces():
+    """
+    Build the crown and root surface grids of the tooth model.
+    
+    The geometry never changes, so it is built once; the arrays are
+    read-only because they are shared by every caller.
     
-    Args:
-        decay_areas: List of dictionaries with decay coordinates and severity
-        
     Returns:
-        A plotly figure object with the 3D tooth model
+        Dictionary mapping "crown" and "root" to (x, y, z) grids
     """
     # Create parameters for a tooth shape
     u = np.linspace(0, 2*np.pi, 30)
@@ -49,8 +67,125 @@ def generate_3d_tooth_model(decay_areas=None):
                 root_x[i][j] *= (1 - 0.7 * tapering)
                 root_y[i][j] *= (1 - 0.7 * tapering)
     
+    surfaces = {"crown": (crown_x, crown_y, crown_z), "root": (root_x, root_y, root_z)}
+    for grids in surfaces.values():
+        for grid in grids:
+            grid.flags.writeable = False
+    return surfaces
+
+def tooth_layout():
+    """
+    Layout of the 3D tooth model figures.
+    
+    Returns:
+        Dictionary of plotly layout properties
+    """
+    return dict(
+        title='3D Tooth Model',
+        scene=dict(
+            xaxis_title='X',
+            yaxis_title='Y',
+            zaxis_title='Z',
+            aspectmode='data',
+            camera=dict(
+                up=dict(x=0, y=0, z=1),
+                center=dict(x=0, y=0, z=0),
+                eye=dict(x=1.5, y=1.5, z=1)
+            )
+        ),
+        margin=dict(l=0, r=0, b=0, t=30)
+    )
+
+def quantize(values, step=COMPACT_STEP):
+    """
+    Round coordinates to a grid and narrow them to float32.
+    
+    Args:
+        values: Array-like of coordinates
+        step: Grid step in model units
+        
+    Returns:
+        float32 numpy array
+    """
+    return (np.round(np.asarray(values, dtype=np.float64) / step) * step).astype(np.float32)
+
+@lru_cache(maxsize=1)
+def _compact_base_traces():
+    """
+    Crown and root traces shared by every compact figure.
+    
+    The surfaces are quantized once; plotly serializes the float32 arrays
+    as binary typed arrays, at half the size of the float64 originals.
+    
+    Returns:
+        Tuple of plotly Surface traces
+    """
+    surfaces = tooth_surfaces()
+    traces = []
+    for name, colorscale, opacity in (("crown", "Blues", 0.9), ("root", "Greys", 0.85)):
+        x, y, z = (quantize(grid) for grid in surfaces[name])
+        traces.append(go.Surface(
+            x=x,
+            y=y,
+            z=z,
+            colorscale=colorscale,
+            opacity=opacity,
+            showscale=False,
+            name=name.capitalize()
+        ))
+    return tuple(traces)
+
+def _compact_marker_trace(decay_areas):
+    """
+    All decay markers of a compact figure as one Scatter3d trace.
+    """
+    positions = quantize([area['position'] for area in decay_areas])
+    return go.Scatter3d(
+        x=positions[:, 0],
+        y=positions[:, 1],
+        z=positions[:, 2],
+        mode='markers',
+        marker=dict(
+            size=quantize([area['size'] for area in decay_areas], step=0.1),
+            color=[marker_color(area['severity']) for area in decay_areas],
+            opacity=0.8,
+            symbol='circle'
+        ),
+        text=[f"Decay ({area['severity']:.0f}%)" for area in decay_areas],
+        hovertemplate="%{text}<extra></extra>",
+        name="Decay"
+    )
+
+@timed("generate_3d_tooth_model")
+def generate_3d_tooth_model(decay_areas=None, compact=False):
+    """
+    Generate a 3D model of a tooth with optional decay areas highlighted.
+    
+    The compact mode is meant for pages showing many models (the history
+    tab): coordinates are quantized to COMPACT_STEP and sent as float32
+    typed arrays, the surface traces are built once and shared by every
+    figure, and all markers go into a single trace, so figures differ
+    only in their marker data.
+    
+    Args:
+        decay_areas: List of dictionaries with decay coordinates and severity
+        compact: Build the smaller, quantized figure
+        
+    Returns:
+        A plotly figure object with the 3D tooth model
+    """
+    if compact:
+        fig = go.Figure(data=_compact_base_traces(), layout=tooth_layout())
+        if decay_areas:
+            fig.add_trace(_compact_marker_trace(decay_areas))
+        return fig
+    
+    surfaces = tooth_surfaces()
+    crown_x, crown_y, crown_z = surfaces["crown"]
+    root_x, root_y, root_z = surfaces["root"]
+    
     # Create figure
-    fig = make_subplots(rows=1, cols=1, specs=[[{'type': 'surface'}]])
+    fig = plotly_subplots.make_subplots(rows=1, cols=1, specs=[[{'type': 'surface'}]])
     
     # Add crown surface
     fig.add_trace(
@@ -86,12 +221,7 @@ def generate_3d_tooth_model(decay_areas=None):
             severity = area['severity']
             
             # Color based on severity
-            if severity > 75:
-                color = 'red'
-            elif severity > 50:
-                color = 'orange'
-            else:
-                color = 'yellow'
+            color = marker_color(severity)
             
             # Add decay marker
             fig.add_trace(
@@ -111,25 +241,297 @@ def generate_3d_tooth_model(decay_areas=None):
             )
     
     # Update layout
-    fig.update_layout(
-        title='3D Tooth Model',
-        scene=dict(
-            xaxis_title='X',
-            yaxis_title='Y',
-            zaxis_title='Z',
-            aspectmode='data'
-        ),
-        margin=dict(l=0, r=0, b=0, t=30),
-        scene_camera=dict(
-            up=dict(x=0, y=0, z=1),
-            center=dict(x=0, y=0, z=0),
-            eye=dict(x=1.5, y=1.5, z=1)
+    fig.update_layout(**tooth_layout())
+    
+    return fig
+
+
+# Template shapes of the full-arch model. Heights and widths are in the
+# units of the single-tooth model; "profile" gives the outline scale at
+# fractions of the tooth height (0 = root apex, 1 = occlusal surface),
+# "edge_depth" the bucco-lingual thickness left at the occlusal edge and
+# "cusps" the number of cusps around the occlusal rim.
+TOOTH_TEMPLATES = {
+    "incisor": {
+        "width": 0.85, "depth": 0.7, "crown": 1.0, "root": 1.3,
+        "profile": [(0.0, 0.25), (0.55, 0.7), (0.75, 1.0), (1.0, 0.9)],
+        "edge_depth": 0.2, "cusps": 0, "cusp_height": 0.0,
+    },
+    "canine": {
+        "width": 0.8, "depth": 0.8, "crown": 1.05, "root": 1.7,
+        "profile": [(0.0, 0.25), (0.6, 0.75), (0.78, 1.0), (1.0, 0.15)],
+        "edge_depth": 0.6, "cusps": 0, "cusp_height": 0.0,
+    },
+    "premolar": {
+        "width": 0.7, "depth": 0.9, "crown": 0.85, "root": 1.4,
+        "profile": [(0.0, 0.3), (0.6, 0.75), (0.8, 1.0), (1.0, 0.75)],
+        "edge_depth": 1.0, "cusps": 2, "cusp_height": 0.08,
+    },
+    "molar": {
+        "width": 1.0, "depth": 1.0, "crown": 0.75, "root": 1.2,
+        "profile": [(0.0, 0.4), (0.6, 0.8), (0.8, 1.0), (1.0, 0.85)],
+        "edge_depth": 1.0, "cusps": 4, "cusp_height": 0.08,
+    },
+}
+
+# Teeth of one quadrant, from the midline back (FDI positions 1-8)
+QUADRANT_TEETH = ("incisor", "incisor", "canine", "premolar", "premolar", "molar", "molar", "molar")
+
+# Half-axes of the ellipse the lower arch follows, and the upper arch scale
+ARCH_WIDTH = 3.2
+ARCH_DEPTH = 4.2
+UPPER_ARCH_SCALE = 1.06
+
+# Space between neighbouring teeth and between the jaws
+TOOTH_GAP = 0.06
+OCCLUSAL_GAP = 0.15
+
+# Colors of the arch model by issue score (0-100)
+ARCH_COLORSCALE = [[0.0, "#2ecc71"], [0.5, "#f39c12"], [1.0, "#e74c3c"]]
+
+@lru_cache(maxsize=None)
+def tooth_template(kind, segments=12, rings=10):
+    """
+    Build the triangle mesh of one tooth type.
+    
+    The mesh is a stack of elliptical rings from the root apex to the
+    occlusal surface, closed by a vertex at each end. It is built once
+    per type and shared, read-only, by every tooth of that type.
+    
+    Args:
+        kind: Key of TOOTH_TEMPLATES
+        segments: Vertices per ring
+        rings: Number of rings
+        
+    Returns:
+        vertices: (V, 3) float array, occlusal surface up at z = crown
+        faces: (F, 3) int array of vertex indices
+    """
+    shape = TOOTH_TEMPLATES[kind]
+    height = shape["crown"] + shape["root"]
+    
+    u = np.linspace(0, 2*np.pi, segments, endpoint=False)
+    t = np.linspace(0, 1, rings)
+    knots, scales = zip(*shape["profile"])
+    scale = np.interp(t, knots, scales)
+    # The crown narrows bucco-lingually towards the occlusal edge
+    crown_start = shape["root"] / height
+    depth = np.interp(t, [crown_start, 1.0], [1.0, shape["edge_depth"]])
+    
+    x = 0.5 * shape["width"] * np.outer(scale, np.cos(u))
+    y = 0.5 * shape["depth"] * np.outer(scale * depth, np.sin(u))
+    z = np.outer(t * height - shape["root"], np.ones(segments))
+    if shape["cusps"]:
+        z[-1] += shape["cusp_height"] * np.cos(shape["cusps"] * u)
+    
+    tip = 0.0 if kind == "canine" else -shape["cusp_height"]
+    vertices = np.vstack([
+        np.column_stack([x.ravel(), y.ravel(), z.ravel()]),
+        [[0.0, 0.0, -shape["root"]], [0.0, 0.0, shape["crown"] + tip]]
+    ])
+    
+    # Two triangles between each pair of neighbouring rings, plus the end fans
+    ring = np.arange(segments)
+    following = (ring + 1) % segments
+    faces = []
+    for r in range(rings - 1):
+        low, high = r * segments, (r + 1) * segments
+        faces.append(np.column_stack([low + ring, low + following, high + following]))
+        faces.append(np.column_stack([low + ring, high + following, high + ring]))
+    bottom, top = rings * segments, rings * segments + 1
+    faces.append(np.column_stack([np.full(segments, bottom), following, ring]))
+    last = (rings - 1) * segments
+    faces.append(np.column_stack([last + ring, last + following, np.full(segments, top)]))
+    faces = np.vstack(faces).astype(np.int32)
+    
+    vertices.flags.writeable = False
+    faces.flags.writeable = False
+    return vertices, faces
+
+def tooth_region(jaw, side, kind):
+    """
+    Region of region_analysis.DENTAL_REGIONS whose scores color a tooth.
+    
+    Args:
+        jaw: "upper" or "lower"
+        side: "left" or "right", as seen in the image (facing the patient)
+        kind: Tooth type
+        
+    Returns:
+        Region name
+    """
+    if kind in ("incisor", "canine"):
+        return f"{jaw}_anterior"
+    return f"{jaw}_{side}"
+
+def _arch_positions(widths, scale):
+    """
+    Place teeth of the given widths along one side of the arch.
+    
+    Returns:
+        (N, 2) centers and (N,) rotation angles about the z axis, for the
+        side with positive x; the midline is at x = 0, the front at +y
+    """
+    phi = np.linspace(0, 0.62 * np.pi, 400)
+    curve = scale * np.column_stack([ARCH_WIDTH * np.sin(phi), ARCH_DEPTH * np.cos(phi)])
+    arc = np.concatenate([[0.0], np.cumsum(np.linalg.norm(np.diff(curve, axis=0), axis=1))])
+    
+    widths = np.asarray(widths)
+    centers_s = np.cumsum(widths + TOOTH_GAP) - widths / 2 - TOOTH_GAP / 2
+    centers = np.column_stack([np.interp(centers_s, arc, curve[:, 0]), np.interp(centers_s, arc, curve[:, 1])])
+    tangent_x = np.interp(centers_s, arc, np.gradient(curve[:, 0]))
+    tangent_y = np.interp(centers_s, arc, np.gradient(curve[:, 1]))
+    return centers, np.arctan2(tangent_y, tangent_x)
+
+@lru_cache(maxsize=1)
+def arch_geometry():
+    """
+    Merge the 32 tooth instances into one mesh per jaw.
+    
+    Each tooth is its type's template, transformed (mirrored, rotated
+    along the arch and translated); only the transforms differ between
+    teeth of the same type.
+    
+    Returns:
+        Dictionary mapping "upper" and "lower" to a dictionary with
+        "vertices" (V, 3), "faces" (F, 3), "tooth" (V,) index of the tooth
+        owning each vertex and "teeth", a list of (FDI number, type,
+        region) per tooth
+    """
+    widths = [TOOTH_TEMPLATES[kind]["width"] for kind in QUADRANT_TEETH]
+    geometry = {}
+    for jaw, quadrants in (("upper", (1, 2)), ("lower", (4, 3))):
+        scale = UPPER_ARCH_SCALE if jaw == "upper" else 1.0
+        centers, angles = _arch_positions(widths, scale)
+        
+        vertices, faces, owners, teeth = [], [], [], []
+        offset = 0
+        # The patient's right quadrant is on the image (and viewer's) left
+        for quadrant, side, mirror in ((quadrants[0], "left", -1.0), (quadrants[1], "right", 1.0)):
+            for position, kind in enumerate(QUADRANT_TEETH):
+                template, template_faces = tooth_template(kind)
+                crown = TOOTH_TEMPLATES[kind]["crown"]
+                
+                angle = angles[position]
+                rotation = np.array([
+                    [np.cos(angle), -np.sin(angle), 0.0],
+                    [np.sin(angle), np.cos(angle), 0.0],
+                    [0.0, 0.0, 1.0],
+                ])
+                # Upper teeth hang crown down
+                flip = -1.0 if jaw == "upper" else 1.0
+                placed = template @ rotation.T
+                placed[:, 2] = flip * (template[:, 2] - crown - OCCLUSAL_GAP)
+                placed[:, 0] *= mirror
+                placed[:, 0] += mirror * centers[position, 0]
+                placed[:, 1] += centers[position, 1]
+                
+                # Each mirror inverts the winding; undo it when there is one
+                tri = template_faces + offset
+                if flip * mirror < 0:
+                    tri = tri[:, ::-1]
+                vertices.append(placed)
+                faces.append(tri)
+                owners.append(np.full(len(placed), len(teeth), dtype=np.int32))
+                teeth.append((quadrant * 10 + position + 1, kind, tooth_region(jaw, side, kind)))
+                offset += len(placed)
+        
+        geometry[jaw] = {
+            "vertices": quantize(np.vstack(vertices)),
+            # Fewer than 65536 vertices per jaw, so indices fit in uint16
+            "faces": np.vstack(faces).astype(np.uint16),
+            "tooth": np.concatenate(owners),
+            "teeth": teeth,
+        }
+    return geometry
+
+def tooth_scores(region_results, issues=("Decay", "Cavity")):
+    """
+    Score every tooth of the arch from the per-region issue scores.
+    
+    Args:
+        region_results: Dictionary mapping region name to issue scores, as
+            returned by DentalDecayDetector.detect_regions
+        issues: Issues whose highest score colors the tooth
+        
+    Returns:
+        Dictionary mapping "upper" and "lower" to (32 / 2,) score arrays,
+        NaN for teeth whose region has no scores
+    """
+    scores = {}
+    for jaw, parts in arch_geometry().items():
+        values = []
+        for _, _, region in parts["teeth"]:
+            region_scores = (region_results or {}).get(region)
+            values.append(max(region_scores[issue] for issue in issues) if region_scores else np.nan)
+        scores[jaw] = np.array(values, dtype=np.float32)
+    return scores
+
+@timed("generate_arch_model")
+def generate_arch_model(region_results=None, issues=("Decay", "Cavity")):
+    """
+    Generate a 3D model of the full dental arch, colored by region scores.
+    
+    The 32 teeth are instances of four cached template meshes, merged
+    into one Mesh3d trace per jaw; only the vertex colors depend on the
+    scores.
+    
+    Args:
+        region_results: Dictionary mapping region name to issue scores
+            (DentalDecayDetector.detect_regions); None draws a neutral arch
+        issues: Issues whose highest score colors each tooth
+        
+    Returns:
+        A plotly figure object with the arch model
+    """
+    geometry = arch_geometry()
+    scores = tooth_scores(region_results, issues) if region_results else None
+    
+    fig = go.Figure()
+    for jaw, parts in geometry.items():
+        vertices, faces = parts["vertices"], parts["faces"]
+        trace = dict(
+            x=vertices[:, 0],
+            y=vertices[:, 1],
+            z=vertices[:, 2],
+            i=faces[:, 0],
+            j=faces[:, 1],
+            k=faces[:, 2],
+            name=f"{jaw.capitalize()} teeth",
+            flatshading=False,
+            lighting=dict(ambient=0.45, diffuse=0.8, specular=0.2, roughness=0.6),
         )
+        if scores is None:
+            trace.update(color="#e8e4d8", hoverinfo="name")
+        else:
+            # Teeth without a region score are drawn as healthy
+            intensity = np.rint(np.nan_to_num(scores[jaw], nan=0.0)).astype(np.uint8)[parts["tooth"]]
+            trace.update(
+                intensity=intensity,
+                coloraxis="coloraxis",
+                hovertemplate="%{intensity:.0f}%<extra>" + f"{jaw.capitalize()} teeth" + "</extra>",
+            )
+        fig.add_trace(go.Mesh3d(**trace))
+    
+    layout = tooth_layout()
+    layout["title"] = 'Full Arch Model'
+    layout["scene"]["camera"]["eye"] = dict(x=0, y=1.6, z=0.9)
+    layout["scene"].update(
+        xaxis=dict(visible=False),
+        yaxis=dict(visible=False),
+        zaxis=dict(visible=False)
     )
+    if scores is not None:
+        layout["coloraxis"] = dict(
+            colorscale=ARCH_COLORSCALE,
+            cmin=0,
+            cmax=100,
+            colorbar=dict(title=" / ".join(issues) + " %", thickness=12)
+        )
+    fig.update_layout(**layout)
     
     return fig
 
-
 def generate_decay_visualization(detection_results):
     """
     Generate decay areas for 3D visualization based on detection results.
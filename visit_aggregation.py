@@ -0,0 +1,233 @@
+import hashlib
+import numpy as np
+from image_processing import ingest_images
+from quality_gate import assess_quality
+from instrumentation import timed
+
+# Standard views of one visit, in display order
+VIEWS = ("front", "left", "right", "upper", "lower")
+
+# Relative weight of each view in the fused scores; the front view shows
+# the most tooth surface
+DEFAULT_VIEW_WEIGHTS = {
+    "front": 1.5,
+    "left": 1.0,
+    "right": 1.0,
+    "upper": 1.0,
+    "lower": 1.0,
+}
+
+# A view's score is rejected when it lies further than this many robust
+# standard deviations (scaled MAD) from the median of the views
+OUTLIER_THRESHOLD = 3.0
+
+# Lower bound of the spread estimate, in score points, so that a few
+# near-identical views do not reject every other view as an outlier
+MIN_SPREAD = 10.0
+
+# Scale turning a median absolute deviation into a standard deviation
+MAD_SCALE = 1.4826
+
+
+def view_digest(data):
+    """
+    Fingerprint the encoded bytes of a view.
+
+    Args:
+        data: Encoded image bytes
+
+    Returns:
+        Hex digest
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def fuse_scores(view_results, weights=None, threshold=OUTLIER_THRESHOLD, min_spread=MIN_SPREAD):
+    """
+    Fuse the scores of several views into one set of scores.
+
+    For each issue, views whose score is an outlier are dropped (only when
+    there are at least three views to compare), then the remaining scores
+    are averaged with the view weights.
+
+    Args:
+        view_results: Dictionary mapping view name to issue scores
+        weights: Dictionary mapping view name to weight (default:
+            DEFAULT_VIEW_WEIGHTS, 1.0 for unknown views)
+        threshold: Outlier threshold in robust standard deviations
+        min_spread: Lower bound of the spread estimate in score points
+
+    Returns:
+        fused: Dictionary of fused issue scores
+        rejected: Dictionary mapping issue to the views rejected for it
+    """
+    if weights is None:
+        weights = DEFAULT_VIEW_WEIGHTS
+
+    views = list(view_results)
+    if not views:
+        return {}, {}
+    issues = list(view_results[views[0]])
+
+    # Scores as a (views, issues) matrix
+    scores = np.array([[view_results[view][issue] for issue in issues] for view in views], dtype=np.float64)
+    view_weights = np.array([weights.get(view, 1.0) for view in views], dtype=np.float64)
+
+    keep = np.ones(scores.shape, dtype=bool)
+    if len(views) >= 3:
+        median = np.median(scores, axis=0)
+        deviation = np.abs(scores - median)
+        spread = np.maximum(np.median(deviation, axis=0) * MAD_SCALE, min_spread)
+        keep = deviation <= threshold * spread
+
+    kept_weights = view_weights[:, None] * keep
+    totals = kept_weights.sum(axis=0)
+    # The views closest to the median are always kept, but guard anyway
+    fused_scores = np.where(
+        totals > 0,
+        (scores * kept_weights).sum(axis=0) / np.where(totals > 0, totals, 1),
+        np.median(scores, axis=0)
+    )
+
+    fused = {issue: float(score) for issue, score in zip(issues, fused_scores)}
+    rejected = {
+        issue: [views[i] for i in np.flatnonzero(~keep[:, j])]
+        for j, issue in enumerate(issues)
+        if not keep[:, j].all()
+    }
+    return fused, rejected
+
+
+class VisitAggregator:
+    """
+    Scores the views of one patient visit and fuses them.
+
+    Each view is cached together with the digest of its upload, so when
+    one view is retaken only that view is decoded and scored again.
+    """
+
+    def __init__(self, detector, weights=None, threshold=OUTLIER_THRESHOLD, min_spread=MIN_SPREAD,
+                 min_size=None):
+        """
+        Initialize the aggregator.
+
+        Args:
+            detector: DentalDecayDetector used to score the views
+            weights: Dictionary mapping view name to weight
+            threshold: Outlier threshold in robust standard deviations
+            min_spread: Lower bound of the spread estimate in score points
+            min_size: Smallest decoded size as (width, height), see
+                image_processing.decode_image
+        """
+        self.detector = detector
+        self.weights = dict(DEFAULT_VIEW_WEIGHTS if weights is None else weights)
+        self.threshold = threshold
+        self.min_spread = min_spread
+        self.min_size = min_size
+        # view -> {"digest", "image", "processed", "results", "quality"}
+        self._views = {}
+        # Quality reports of the views rejected by the last update
+        self.rejected_quality = {}
+
+    @timed("visit_update")
+    def update(self, payloads):
+        """
+        Bring the visit up to date with the uploaded views.
+
+        Views whose bytes are unchanged keep their cached scores; new or
+        retaken views are decoded and quality-checked in parallel and
+        scored in one batch. Views missing from payloads, and views that
+        fail to decode or fail the quality gate, are dropped from the
+        visit; the quality reports of the latter are in rejected_quality.
+
+        Args:
+            payloads: Dictionary mapping view name to encoded image bytes
+
+        Returns:
+            recomputed: Views that were (re)analysed
+            failed: Views that could not be decoded or were rejected
+        """
+        for view in list(self._views):
+            if view not in payloads:
+                del self._views[view]
+
+        digests = {view: view_digest(data) for view, data in payloads.items()}
+        changed = [
+            view for view in payloads
+            if view not in self._views or self._views[view]["digest"] != digests[view]
+        ]
+        self.rejected_quality = {}
+        if not changed:
+            return [], []
+
+        ingested = ingest_images(
+            [payloads[view] for view in changed], min_size=self.min_size, assess=assess_quality
+        )
+
+        failed = []
+        for view, item in zip(changed, ingested):
+            if item is None or item[1] is None:
+                failed.append(view)
+                self._views.pop(view, None)
+                if item is not None:
+                    self.rejected_quality[view] = item[2]
+
+        recomputed = [view for view in changed if view not in failed]
+        items = [item for item in ingested if item is not None and item[1] is not None]
+        batch_results = self.detector.detect_batch([processed for _, processed, _ in items])
+
+        for view, (image, processed, quality), results in zip(recomputed, items, batch_results):
+            self._views[view] = {
+                "digest": digests[view],
+                "image": image,
+                "processed": processed,
+                "results": results,
+                "quality": quality,
+            }
+
+        return recomputed, failed
+
+    def views(self):
+        """
+        Get the analysed views in VIEWS order.
+
+        Returns:
+            List of view names
+        """
+        order = {view: i for i, view in enumerate(VIEWS)}
+        return sorted(self._views, key=lambda view: order.get(view, len(order)))
+
+    def view(self, name):
+        """
+        Get the cached entry of a view ("image", "processed", "results").
+        """
+        return self._views[name]
+
+    def primary_view(self):
+        """
+        The analysed view with the highest weight, used for display.
+
+        Returns:
+            View name, or None if no view has been analysed
+        """
+        views = self.views()
+        if not views:
+            return None
+        return max(views, key=lambda view: self.weights.get(view, 1.0))
+
+    def fuse(self):
+        """
+        Fuse the scores of the analysed views.
+
+        Returns:
+            Dictionary with the fused "results", per-view "views" scores,
+            "rejected" outliers per issue and the "weights" used
+        """
+        view_results = {view: self._views[view]["results"] for view in self.views()}
+        fused, rejected = fuse_scores(view_results, self.weights, self.threshold, self.min_spread)
+        return {
+            "results": fused,
+            "views": view_results,
+            "rejected": rejected,
+            "weights": {view: self.weights.get(view, 1.0) for view in view_results},
+        }